@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+
+
+"""
+Benchmarks for building and querying K-Trees.
+
+Run the benchmarks from the pyktree directory, e.g.
+
+    python -m benchmarks.run --preset quick --output before.json
+    ... change ktree ...
+    python -m benchmarks.run --preset quick --output after.json
+    python -m benchmarks.compare before.json after.json
+
+benchmarks.run builds a K-Tree for each combination of the swept 
+parameters (N, d, order, distance, weighted, reinsert, density, dtype)
+in a fresh worker process and measures build time, peak memory, the
+memory per node, query latencies and throughput, depth and distortion.  Cases with a density
+below 1 use sparse data sets.  The results are written as JSON, 
+see benchmarks.run.run_case() for the recorded values.
+"""
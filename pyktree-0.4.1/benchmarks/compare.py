@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+
+
+"""
+This module compares the results of two benchmark runs, see module
+benchmarks.
+
+    usage: python -m benchmarks.compare OLD NEW [--threshold RATIO]
+
+For each case of both runs, the relative change of each measurement is
+printed.  Changes for the worse by more than the threshold are marked 
+with "!".
+"""
+
+import sys
+import json
+import optparse
+
+from benchmarks.run import PARAMETERS
+
+# measurements where more is better, all others are better when less:
+MORE_IS_BETTER = ["throughput_qps"]
+
+
+def flatten(metrics, prefix=""):
+    """Returns the (nested) dict "metrics" as a flat dict, 
+    e.g. {"latency_ms.p50": ...}.
+    """
+    result = {}
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            result.update(flatten(value, prefix + name + "."))
+        elif isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            result[prefix + name] = value
+    return result
+
+
+def load(filename):
+    """Returns the flat measurements of each case of the results in "filename".
+    Results without a density are dense, i.e. of density 1, results
+    without a dtype are float64.
+    """
+    f = open(filename)
+    try:
+        report = json.load(f)
+    finally:
+        f.close()
+    for result in report["results"]:
+        result["case"].setdefault("density", 1.0)
+        result["case"].setdefault("dtype", "float64")
+    return dict((tuple(result["case"][name] for name in PARAMETERS), flatten(result["metrics"]))
+                for result in report["results"])
+
+
+def compare(old, new, threshold):
+    """Returns the lines of the comparison of the measurements "old" 
+    and "new" and the number of changes for the worse.
+    """
+    lines = []
+    worse = 0
+    for case in sorted(set(old) & set(new)):
+        lines.append(" ".join("%s=%s" % item for item in zip(PARAMETERS, case)))
+        for name in sorted(set(old[case]) & set(new[case])):
+            a, b = old[case][name], new[case][name]
+            if a == 0:
+                change = 0.0 if b == 0 else float("inf")
+            else:
+                change = (b - a) / float(abs(a))
+            if name.split(".")[0] in MORE_IS_BETTER:
+                bad = change < -threshold
+            else:
+                bad = change > threshold
+            worse += bad
+            lines.append("    %-22s %14.4f %14.4f %+8.1f%% %s" % (name, a, b, 100*change, "!" if bad else ""))
+    for label, cases in [ ("only in old", set(old) - set(new)), ("only in new", set(new) - set(old)) ]:
+        for case in sorted(cases):
+            lines.append(label + ": " + " ".join("%s=%s" % item for item in zip(PARAMETERS, case)))
+    return lines, worse
+
+
+def main(args):
+    usage = "usage: python -m benchmarks.compare OLD NEW {-t|--threshold} RATIO"
+    parser = optparse.OptionParser(usage)
+    parser.add_option("-t", "--threshold", type="float", dest="threshold", default=0.1,
+                      help="relative change that counts as worse, default 0.1.")
+    (options, args) = parser.parse_args(args)
+    if len(args) != 2:
+        parser.error("Please give two result files.")
+    lines, worse = compare(load(args[0]), load(args[1]), options.threshold)
+    for line in lines:
+        print line
+    print worse, "measurements changed for the worse by more than %g%%." % (100*options.threshold)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+
+
+"""
+This module runs the K-Tree benchmarks, see module benchmarks.
+
+    usage: python -m benchmarks.run [options]
+
+Each case is run in a fresh worker process, so that peak memory is
+measured per case.  Run "python -m benchmarks.run --help" for the 
+options.
+"""
+
+import sys
+import os
+import datetime
+import itertools
+import json
+import multiprocessing
+import optparse
+import platform
+import subprocess
+import timeit
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows:
+    resource = None
+
+import numpy
+import scipy
+import scipy.sparse
+
+# benchmark the ktree package of this source tree, not an installed one:
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import ktree
+import ktree.models
+import ktree.trees
+
+# parameters that are swept, with the values of each preset:
+PARAMETERS = ["N", "d", "order", "distance", "weighted", "reinsert", "density", "dtype"]
+# the parameters that are K-Tree options:
+OPTIONS = ["order", "distance", "weighted", "reinsert", "dtype"]
+PRESETS = {
+    "quick": {
+        "N":        [1000, 10000],
+        "d":        [2, 32],
+        "order":    [10],
+        "distance": ["sqeuclidean"],
+        "weighted": [True],
+        "reinsert": [False],
+        "density":  [1.0],
+        "dtype":    ["float64"],
+        },
+    "default": {
+        "N":        [1000, 10000, 100000],
+        "d":        [2, 32, 128],
+        "order":    [5, 20],
+        "distance": ["sqeuclidean", "euclidean", "cityblock"],
+        "weighted": [True, False],
+        "reinsert": [False, True],
+        "density":  [1.0],
+        "dtype":    ["float64"],
+        },
+    "full": {
+        "N":        [1000, 10000, 100000, 1000000, 10000000],
+        "d":        [2, 32, 128, 512],
+        "order":    [5, 20, 50],
+        "distance": ["sqeuclidean", "euclidean", "cityblock"],
+        "weighted": [True, False],
+        "reinsert": [False, True],
+        "density":  [1.0, 0.01],
+        "dtype":    ["float64", "float32"],
+        },
+    }
+PERCENTILES = [50, 90, 99]
+
+
+def make_data(N, d, seed, density=1.0):
+    """Returns "N" examples of dimension "d" drawn from a mixture of
+    gaussians, the same "seed" gives the same examples.  For a "density"
+    below 1, the examples are a CSR matrix in which each example keeps
+    that fraction of its components, i.e. like TF-IDF vectors.
+    """
+    random = numpy.random.RandomState(seed)
+    centers = 5 * random.randn(max(1, int(numpy.sqrt(N)) // 10), d)
+    labels = random.randint(len(centers), size=N)
+    if density >= 1.0:
+        return centers[labels] + random.randn(N, d)
+    mask = scipy.sparse.rand(N, d, density, format="csr", random_state=random)
+    rows = numpy.repeat(numpy.arange(N), numpy.diff(mask.indptr))
+    mask.data = centers[labels[rows], mask.indices] + random.randn(mask.nnz)
+    return mask
+
+
+def nbytes(data):
+    """Returns the size of the array or CSR matrix "data" in bytes."""
+    if scipy.sparse.issparse(data):
+        return data.data.nbytes + data.indices.nbytes + data.indptr.nbytes
+    return data.nbytes
+
+
+def node_bytes(tree):
+    """Returns the number of nodes of "tree" and their memory in bytes,
+    i.e. the size of the node objects and of the arrays they own.  Arrays
+    inside key stacks (sparse or quantized leafs) are counted as well.
+    """
+    nodes = size = 0
+    for node in tree.root.walk():
+        nodes += 1
+        size += sys.getsizeof(node)
+        for name in node.__slots__:
+            value = getattr(node, name, None)
+            if isinstance(value, numpy.ndarray):
+                # the shared empty arrays of nodes without keys are not counted:
+                if value.size:
+                    size += sys.getsizeof(value)
+            elif hasattr(value, "__dict__") and not isinstance(value, (ktree.trees.KNode, ktree.trees.KTree)):
+                size += sys.getsizeof(value)
+                size += sum(sys.getsizeof(array) for array in vars(value).values()
+                            if isinstance(array, numpy.ndarray))
+        if node.hold_leafs and node.values().dtype == object:
+            size += sum(sys.getsizeof(value) for value in node.values())
+    return nodes, size
+
+
+def peak_rss_mb():
+    """Returns the peak resident memory of this process in MB,
+    None if it is not available.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on Mac OS X and in kB on Linux:
+    if sys.platform == "darwin":
+        return rss / 2.0**20
+    return rss / 2.0**10
+
+
+def percentiles(seconds):
+    """Returns the PERCENTILES and the maximum of "seconds" in ms."""
+    ms = 1000 * numpy.asarray(seconds)
+    result = dict(("p%i" % p, float(numpy.percentile(ms, p))) for p in PERCENTILES)
+    result["max"] = float(numpy.max(ms))
+    return result
+
+
+def run_case(args):
+    """Build and query a K-Tree for a single case.
+    Arguments:
+        * args:     a tuple (case, queries, k, seed), where "case" is a 
+                    dict of the PARAMETERS, "queries" the number of 
+                    queries and "k" the number of neighbors of the knn 
+                    queries.
+    Returns:
+        * a dict of measurements:
+            - build_seconds:   time to build the K-Tree with ktree().
+            - data_mb:         size of the data set.
+            - peak_rss_mb:     peak memory of the worker process.
+            - build_rss_mb:    increase of the peak memory while building.
+            - depth, N_code_book.
+            - nodes:           number of nodes of the K-Tree.
+            - node_bytes:      mean memory per node, see node_bytes().
+            - distortion:      mean distortion per leaf.
+            - latency_ms:      percentiles of single nearest neighbor queries.
+            - knn_latency_ms:  percentiles of exact knn queries.
+            - throughput_qps:  queries per second of batched nearest
+                               neighbor queries, see KTree.nearest_neighbors().
+    """
+    case, queries, k, seed = args
+    data = make_data(case["N"], case["d"], seed, case["density"])
+    Q = make_data(queries, case["d"], seed+1, case["density"])
+    options = ktree.KTreeOptions()
+    for name in OPTIONS:
+        setattr(options, name, case[name])
+    options.seed = seed
+    rss = peak_rss_mb()
+    t0 = timeit.default_timer()
+    tree = ktree.ktree(data, options)
+    build_seconds = timeit.default_timer() - t0
+    nodes, size = node_bytes(tree)
+    # the distortion of the prototypes of the leafs:
+    levels = tree.quality()["levels"]
+    distortion = levels[1]["distortion"] if len(levels) > 1 else 0.0
+    result = {
+        "build_seconds":    build_seconds,
+        "data_mb":          nbytes(data) / 2.0**20,
+        "peak_rss_mb":      peak_rss_mb(),
+        "build_rss_mb":     None if rss is None else peak_rss_mb() - rss,
+        "depth":            tree.depth,
+        "N_code_book":      int(tree.N_code_book),
+        "nodes":            nodes,
+        "node_bytes":       size / float(max(1, nodes)),
+        "distortion":       distortion / max(1, tree.N),
+        }
+    latencies = []
+    for q in Q:
+        t0 = timeit.default_timer()
+        tree.nearest_neighbors(q)
+        latencies.append(timeit.default_timer() - t0)
+    result["latency_ms"] = percentiles(latencies)
+    latencies = []
+    for q in Q:
+        t0 = timeit.default_timer()
+        tree.knn(q, k)
+        latencies.append(timeit.default_timer() - t0)
+    result["knn_latency_ms"] = percentiles(latencies)
+    t0 = timeit.default_timer()
+    tree.nearest_neighbors(Q)
+    result["throughput_qps"] = queries / max(timeit.default_timer() - t0, 1e-9)
+    return result
+
+
+def cases(parameters):
+    """Returns the cases, i.e. all combinations of the parameter values.
+    Cityblock models are always unweighted, so that only one of the 
+    weighted/unweighted cases is run for them.  They do not support 
+    sparse data sets, i.e. cases with a density below 1.
+    """
+    result = []
+    for values in itertools.product(*[ parameters[name] for name in PARAMETERS ]):
+        case = dict(zip(PARAMETERS, values))
+        if case["distance"] == "cityblock" and case["weighted"] != parameters["weighted"][0]:
+            continue
+        if case["distance"] == "cityblock" and case["density"] < 1.0:
+            continue
+        result.append(case)
+    return result
+
+
+def environment():
+    """Returns a description of the environment of the benchmark run."""
+    try:
+        commit = subprocess.Popen(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[0].strip()
+    except OSError:
+        commit = ""
+    return {
+        "date":     datetime.datetime.now().isoformat(),
+        "commit":   commit or None,
+        "ktree":    ktree.__version__,
+        "python":   platform.python_version(),
+        "numpy":    numpy.__version__,
+        "scipy":    scipy.__version__,
+        "platform": platform.platform(),
+        "cpus":     multiprocessing.cpu_count(),
+        }
+
+
+def parse_list(value, convert):
+    """Converts the comma separated "value"."""
+    return [ convert(v) for v in value.split(",") if v ]
+
+def parse_bool(value):
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError("%s is not a boolean value." % value)
+
+
+def parse_command_line(args):
+    """Function that parse the command line arguments."""
+    usage = "usage: python -m benchmarks.run {-p|--preset} PRESET {-o|--output} FILE [sweep options]"
+    parser = optparse.OptionParser(usage)
+    parser.add_option("-p", "--preset", dest="preset", default="quick",
+                      help="one of %s, default quick." % ", ".join(sorted(PRESETS)))
+    parser.add_option("-o", "--output", dest="output", default="benchmark.json",
+                      help="file to write the JSON results to, default benchmark.json.", metavar="FILE")
+    parser.add_option("-q", "--queries", type="int", dest="queries", default=1000,
+                      help="number of queries per case, default 1000.")
+    parser.add_option("-k", type="int", dest="k", default=10,
+                      help="number of neighbors of knn queries, default 10.")
+    parser.add_option("-s", "--seed", type="int", dest="seed", default=0,
+                      help="seed of the data sets and the K-Trees, default 0.")
+    # sweep options override the preset:
+    for name in PARAMETERS:
+        parser.add_option("--" + name, dest=name, default=None, metavar="VALUES",
+                          help="comma separated values of %s." % name)
+    (options, args) = parser.parse_args(args)
+    if options.preset not in PRESETS:
+        raise UserWarning("Unknown preset %s." % options.preset)
+    parameters = dict(PRESETS[options.preset])
+    for name, convert in zip(PARAMETERS, [ int, int, int, str, parse_bool, parse_bool, float, str ]):
+        value = getattr(options, name)
+        if value is not None:
+            try:
+                parameters[name] = parse_list(value, convert)
+            except ValueError, e:
+                raise UserWarning("Invalid values for --%s (%s)." % (name, e))
+    for distance in parameters["distance"]:
+        if distance not in ktree.models.DISTANCES:
+            raise UserWarning("%s is not a valid distance." % distance)
+    for dtype in parameters["dtype"]:
+        if dtype not in ("float64", "float32"):
+            raise UserWarning("%s is not a valid floating point type." % dtype)
+    return options, parameters
+
+
+def main(args):
+    options, parameters = parse_command_line(args)
+    todo = cases(parameters)
+    results = []
+    # a fresh process for each case:
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        tasks = [ (case, options.queries, options.k, options.seed) for case in todo ]
+        for i, (case, result) in enumerate(zip(todo, pool.imap(run_case, tasks))):
+            print "[%i/%i]" % (i+1, len(todo)),
+            print " ".join("%s=%s" % (name, case[name]) for name in PARAMETERS),
+            print "build %.3fs, p50 %.3fms, %.0f queries/s" % (result["build_seconds"], 
+                    result["latency_ms"]["p50"], result["throughput_qps"])
+            sys.stdout.flush()
+            results.append({ "case": case, "metrics": result })
+    finally:
+        pool.close()
+        pool.join()
+    report = {
+        "environment":  environment(),
+        "parameters":   parameters,
+        "queries":      options.queries,
+        "k":            options.k,
+        "seed":         options.seed,
+        "results":      results,
+        }
+    f = open(options.output, "w")
+    try:
+        json.dump(report, f, indent=2, sort_keys=True)
+    finally:
+        f.close()
+    print "Results written to", options.output
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except UserWarning, w:
+        print w
+        sys.exit(1)
@@ -28,7 +28,9 @@ setup(  name='pyktree',
         author_email='ugrossek@techfak.uni-bielefeld.de',
         url = "http://ktree.sourceforge.net/",
         package_dir={'ktree': 'src/ktree'},
-        py_modules = ['ktree.trees', 'ktree.models', 'ktree.utils'],
+        py_modules = ['ktree.trees', 'ktree.models', 'ktree.utils', 'ktree.flat',
+                      'ktree.sources', 'ktree.profiler',
+                      'ktree.shared', 'ktree.checkpoint'],
         scripts=['scripts/ktmk', 
                  'scripts/ktpr', 
                  'scripts/ktnn'],
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""
+This module provides incremental checkpoints of K-Tree builds,
+see ktree.ktree() and options.checkpoint.
+
+A checkpoint file is an append-only log of segments.  Each segment
+holds the nodes that have changed since the previous segment and the
+state of the build, i.e. a sequence of .npy arrays:
+    * meta:     a JSON string with the ID of the root, the build phase
+                ("build", "reinsert" or "done"), the number of rows of
+                the data set the phase has consumed, the options that
+                determine the tree and the state of the model's random
+                number generator (without its key).
+    * ids:      (M,) the ID of each node.
+    * leafs:    (M,) True for nodes that hold leafs.
+    * lengths:  (M,) the number of items of each node.
+    * keys:     (I, d) the keys of all items, in storage type.
+    * values:   (I,) the row ID of each leaf or the node ID of each
+                sub-node.
+    * Ns, ncbs, radii: (I,) the statistics of each item, see KNode.
+    * random:   the key of the model's random number generator.
+The latest record of a node wins.  A segment that has not been written
+completely, e.g. after a crash, is ignored.  The nodes change along the
+insert path only, i.e. the costs of a checkpoint are proportional to
+the number of changed nodes, not to the size of the tree.  When the log
+holds COMPACT times more records than the tree has nodes, it is
+rewritten with a single segment.
+"""
+
+import json
+import os
+
+import numpy
+import numpy.lib.format
+
+import models
+import trees
+
+# default number of rows between checkpoints:
+EVERY = 100000
+# rewrite the log if it holds COMPACT times more node records than nodes:
+COMPACT = 4
+# the options a resumed build must share with the checkpoint:
+OPTIONS = ["order", "weighted", "distance", "dtype", "quantize"]
+ARRAYS = ["ids", "leafs", "lengths", "keys", "values", "Ns", "ncbs", "radii", "random"]
+
+
+class Checkpointer(object):
+    """Writes the checkpoints of the build of KTree "k" to "filename".
+    The KTree's model records its changed nodes in "journal" from now on,
+    see KNode.  The log is started anew with a complete checkpoint of the
+    build "phase" at row "offset".
+    """
+
+    def __init__(self, filename, k, phase="build", offset=0):
+        self.filename = filename
+        self.k = k
+        k.model.journal = {}
+        self.write(phase, offset, full=True)
+
+    def write(self, phase, offset, full=False):
+        """Append the changed nodes and the build state to the log.
+        If "full" is set or the log is due for compaction, the log is
+        rewritten with all nodes instead.
+        """
+        k = self.k
+        journal = k.model.journal
+        if not full and self.records + len(journal) > COMPACT * max(self.nodes, 1):
+            full = True
+        if full:
+            nodes = list(k.root.walk())
+        else:
+            nodes = journal.values()
+        arrays = _node_arrays(k, nodes)
+        state = k.model.random.get_state()
+        meta = {
+            "root":     k.root.ID,
+            "phase":    phase,
+            "offset":   offset,
+            "options":  dict((name, getattr(k.options, name, None)) for name in OPTIONS),
+            "random":   [ state[0] ] + [ float(value) if isinstance(value, float) else int(value)
+                                         for value in state[2:] ],
+            }
+        arrays["random"] = state[1]
+        if full:
+            tmp = self.filename + ".tmp"
+            f = open(tmp, "wb")
+        else:
+            f = open(self.filename, "ab")
+        try:
+            numpy.lib.format.write_array(f, numpy.array(json.dumps(meta)))
+            for name in ARRAYS:
+                _write_array(f, arrays[name])
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        if full:
+            if os.name == "nt" and os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmp, self.filename)
+            self.records = self.nodes = len(nodes)
+        else:
+            self.records += len(nodes)
+        journal.clear()
+
+
+def _write_array(f, array):
+    numpy.lib.format.write_array(f, numpy.ascontiguousarray(array))
+
+
+def _node_arrays(k, nodes):
+    """Returns the arrays of a segment for "nodes"."""
+    d = k.root.keys().shape[1]
+    dtype = models.storage_dtype(k.options)
+    keys = [ numpy.empty((0, d), dtype) ]
+    for node in nodes:
+        if isinstance(node._keys, trees.SparseRows):
+            raise ValueError("Checkpoints do not support sparse leafs.")
+        if len(node) > 0:
+            keys.append(node.keys())
+    values = [ numpy.empty(0, dtype=numpy.int64) ]
+    for node in nodes:
+        if node.hold_leafs:
+            values.append(node.values().astype(numpy.int64))
+        else:
+            values.append(numpy.array([ child.ID for child in node.values() ], dtype=numpy.int64))
+    return {
+        "ids":      numpy.array([ node.ID for node in nodes ], dtype=numpy.int64),
+        "leafs":    numpy.array([ node.hold_leafs for node in nodes ], dtype=bool),
+        "lengths":  numpy.array([ len(node) for node in nodes ], dtype=numpy.int64),
+        "keys":     numpy.concatenate(keys),
+        "values":   numpy.concatenate(values),
+        "Ns":       numpy.concatenate([ numpy.empty(0, dtype=numpy.int64) ] +
+                                      [ node.Ns for node in nodes ]).astype(numpy.int64),
+        "ncbs":     numpy.concatenate([ numpy.empty(0, dtype=numpy.int64) ] +
+                                      [ node._ncbs[:len(node)] for node in nodes ]).astype(numpy.int64),
+        "radii":    numpy.concatenate([ numpy.empty(0) ] + [ node._radii[:len(node)] for node in nodes ]),
+        }
+
+
+def _segments(filename):
+    """Yields (meta, arrays) of each complete segment of "filename"."""
+    f = open(filename, "rb")
+    try:
+        while True:
+            try:
+                meta = json.loads(numpy.lib.format.read_array(f).item())
+                arrays = dict((name, numpy.lib.format.read_array(f)) for name in ARRAYS)
+            except (ValueError, EOFError, IOError):
+                # the end of the log or an incomplete segment:
+                return
+            yield meta, arrays
+    finally:
+        f.close()
+
+
+def load(filename, options):
+    """Load the checkpoint "filename" of a build with "options".
+    Returns:
+        * the KTree of the checkpoint.
+        * the build phase, see module documentation.
+        * the number of rows the phase has consumed.
+    """
+    records = {}
+    meta = None
+    for meta, arrays in _segments(filename):
+        offsets = numpy.concatenate(([0], numpy.cumsum(arrays["lengths"])))
+        for j, ID in enumerate(arrays["ids"]):
+            rows = slice(offsets[j], offsets[j+1])
+            records[int(ID)] = (arrays["leafs"][j], arrays["keys"][rows], arrays["values"][rows],
+                                arrays["Ns"][rows], arrays["ncbs"][rows], arrays["radii"][rows])
+        state = (meta["random"][0], arrays["random"]) + tuple(meta["random"][1:])
+    if meta is None:
+        raise ValueError("%s is not a K-Tree checkpoint." % filename)
+    for name in OPTIONS:
+        if meta["options"][name] != getattr(options, name, None):
+            raise ValueError("The checkpoint %s was written with %s %s, not %s." %
+                             (filename, name, meta["options"][name], getattr(options, name, None)))
+    k = trees.KTree(options=options)
+    k.model.random.set_state(state)
+    k.root = _node(k, records, meta["root"])
+    k.root.parent = k
+    return k, str(meta["phase"]), meta["offset"]
+
+
+def _node(k, records, ID):
+    """Rebuild the (sub)tree of node "ID" from its "records"."""
+    leaf, keys, values, Ns, ncbs, radii = records[ID]
+    node = trees.KNode(options=k.options, model=k.model)
+    if len(keys) == 0:
+        return node
+    if not leaf:
+        children = numpy.empty(len(values), dtype=object)
+        for i, child in enumerate(values):
+            children[i] = _node(k, records, int(child))
+        values = children
+    node.extend(keys, values, Ns, ncbs, radii)
+    return node
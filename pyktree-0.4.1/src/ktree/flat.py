@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""
+This module provides a flat, memory-mappable file format for K-Trees.
+
+A K-Tree file consists of
+    * the magic string MAGIC and the (uint64) offset of the header,
+    * a number of arrays in .npy layout, each aligned to ALIGNMENT bytes,
+    * a JSON header with the format version, the K-Tree's options and
+      the offset of each array.
+
+The nodes are numbered in breadth-first order, i.e. node 0 is the root
+and, since K-Trees are height balanced, the nodes that hold leafs come
+last.  The keys of all nodes form a single sequence of rows: the rows of
+node i are node_offsets[i]:node_offsets[i+1].  The first rows are the
+prototypes of inner nodes, the remaining rows are the leafs.  The arrays
+are:
+    * node_offsets: (M+1,) the first row of each node.
+    * prototypes:   (P, d) the keys of inner nodes.
+    * children:     (P,) the node of each prototype.
+    * Ns:           (P,) the number of leafs below each prototype.
+    * radii:        (P,) the covering radius of each prototype.
+    * leafs:        (L, d) the leafs, in depth-first order.
+    * ids:          (L,) the row ID of each leaf (since version 2).
+    * quantize_range: (2, d) the minimum and maximum of each dimension of
+                    quantized leafs, empty if the leafs are not quantized
+                    (since version 3).
+
+The prototypes and leafs are stored in options.dtype, quantized leafs as
+their codes, see models.ScalarQuantizer.
+"""
+
+import heapq
+import json
+import struct
+
+import numpy
+import numpy.lib.format
+
+import models
+import trees
+
+MAGIC = "KTREEFLT"
+VERSION = 3
+ALIGNMENT = 64
+ARRAYS = ["node_offsets", "prototypes", "children", "Ns", "radii", "leafs", "ids",
+          "quantize_range"]
+OPTIONS = ["order", "weighted", "distance", "reinsert", "bulk", "jobs", "seed",
+           "distance_dtype", "dtype", "quantize"]
+
+
+def is_flat(filename):
+    """Returns True if "filename" is a file in the flat K-Tree format."""
+    f = open(filename, "rb")
+    try:
+        return f.read(len(MAGIC)) == MAGIC
+    finally:
+        f.close()
+
+
+def has_sparse_leafs(k):
+    """Returns True if KTree "k" holds sparse leafs, which the flat
+    format does not support.
+    """
+    return any(isinstance(node._keys, trees.SparseRows) for node in k.root.walk())
+
+
+def flatten(k):
+    """Returns the header and the arrays of the flat representation of KTree "k"."""
+    # breadth-first order:
+    nodes = [ k.root ]
+    for node in nodes:
+        if not node.hold_leafs:
+            nodes.extend(node.values())
+    inner = [ node for node in nodes if not node.hold_leafs ]
+    outer = nodes[len(inner):]
+    if has_sparse_leafs(k):
+        raise ValueError("The flat K-Tree format does not support sparse leafs.")
+    lengths = [ len(node) for node in nodes ]
+    d = k.root.keys().shape[1]
+    dtype = models.storage_dtype(k.options)
+    def stack(nodes):
+        return numpy.concatenate([ numpy.empty((0, d), dtype) ] + [ node.keys() for node in nodes ])
+    quantizer = k.model.quantizer
+    P = sum(lengths[:len(inner)])
+    arrays = {
+        "node_offsets": numpy.concatenate(([0], numpy.cumsum(lengths))).astype(numpy.int64),
+        "prototypes":   stack(inner),
+        "children":     numpy.arange(1, P+1, dtype=numpy.int64),
+        "Ns":           numpy.concatenate([ numpy.empty(0) ] + [ node.Ns for node in inner ]).astype(numpy.int64),
+        "radii":        numpy.concatenate([ numpy.empty(0) ] + [ node._radii[:len(node)] for node in inner ]),
+        "leafs":        stack(outer) if quantizer is None else quantizer.encode(stack(outer)),
+        "ids":          numpy.concatenate([ numpy.empty(0) ] + [ node.values() for node in outer ]).astype(numpy.int64),
+        "quantize_range": numpy.empty((0, d)) if quantizer is None else numpy.array([ quantizer.low, quantizer.high ]),
+        }
+    header = {
+        "version":  VERSION,
+        "options":  dict((name, getattr(k.options, name)) for name in OPTIONS
+                         if hasattr(k.options, name)),
+        "depth":    k.depth,
+        "inner":    len(inner),
+        }
+    return header, arrays
+
+
+def save(k, filename):
+    """Save KTree "k" to "filename" in the flat K-Tree format."""
+    header, arrays = flatten(k)
+    header["arrays"] = {}
+    f = open(filename, "wb")
+    try:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", 0))
+        for name in ARRAYS:
+            f.write("\0" * (-f.tell() % ALIGNMENT))
+            header["arrays"][name] = f.tell()
+            numpy.lib.format.write_array(f, numpy.ascontiguousarray(arrays[name]))
+        offset = f.tell()
+        f.write(json.dumps(header))
+        f.seek(len(MAGIC))
+        f.write(struct.pack("<Q", offset))
+    finally:
+        f.close()
+
+
+def _read_array(f, filename, offset, mmap):
+    """Read (or memory-map) the .npy array at "offset" of file "f"."""
+    f.seek(offset)
+    if not mmap:
+        return numpy.lib.format.read_array(f)
+    if numpy.lib.format.read_magic(f) == (1, 0):
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+    if numpy.prod(shape) == 0:
+        return numpy.empty(shape, dtype=dtype)
+    return numpy.memmap(filename, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                        order="F" if fortran_order else "C")
+
+
+def load(filename, mmap=False):
+    """Load a FlatKTree from "filename".  If "mmap" is True,
+    the arrays are memory-mapped instead of read.
+    """
+    f = open(filename, "rb")
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a K-Tree file." % filename)
+        offset, = struct.unpack("<Q", f.read(8))
+        f.seek(offset)
+        header = json.loads(f.read())
+        if header["version"] > VERSION:
+            raise ValueError("K-Tree file format version %i is not supported." % header["version"])
+        arrays = dict((str(name), _read_array(f, filename, offset, mmap))
+                      for name, offset in header["arrays"].items())
+    finally:
+        f.close()
+    if "ids" not in arrays:
+        # version 1 files do not know the row IDs:
+        arrays["ids"] = -numpy.ones(len(arrays["leafs"]), dtype=numpy.int64)
+    options = trees.KTreeOptions()
+    for name, value in header["options"].items():
+        if isinstance(value, unicode):
+            value = str(value)
+        setattr(options, str(name), value)
+    if len(arrays.get("quantize_range", ())):
+        options.quantize_range = numpy.array(arrays["quantize_range"])
+    else:
+        arrays["quantize_range"] = numpy.empty((0, arrays["leafs"].shape[1]))
+    return FlatKTree(options, header["depth"], header["inner"], arrays)
+
+
+def _groups(labels):
+    """Returns (label, rows) pairs for the distinct values of "labels"."""
+    rows = numpy.argsort(labels, kind="mergesort")
+    labels = labels[rows]
+    starts = numpy.nonzero(numpy.concatenate(([True], labels[1:] != labels[:-1])))[0]
+    stops = numpy.concatenate((starts[1:], [len(rows)]))
+    return [ (labels[start], rows[start:stop]) for start, stop in zip(starts, stops) ]
+
+
+class FlatKTree(object):
+    """A read-only K-Tree that answers queries from the arrays of
+    a flat K-Tree file, see the module documentation.
+    """
+
+    def __init__(self, options, depth, inner, arrays):
+        self.options = options
+        self.model = models.model(options)
+        self.depth = depth
+        self.inner = inner
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        # number of prototypes, i.e. the first row of the leafs:
+        self.P = len(self.prototypes)
+        self.dtype = models.storage_dtype(options)
+
+    def __str__(self):
+        return "FlatKTree(%s, N: %i, depth: %i)" % (str(self.options), self.N, self.depth)
+
+    @property
+    def order(self):
+        """Convenient property that returns this K-Tree's order."""
+        return self.options.order
+
+    @property
+    def N(self):
+        """Number of leafs."""
+        return len(self.leafs)
+
+    def _rows(self, node):
+        """Returns the keys of "node" and the index of its first key."""
+        start, stop = self.node_offsets[node], self.node_offsets[node+1]
+        if node < self.inner:
+            return self.prototypes[start:stop], start
+        return self._leafs(slice(start-self.P, stop-self.P)), start-self.P
+
+    def _leafs(self, index):
+        """Returns the leafs "index", decoded if they are quantized."""
+        if self.model.quantizer is None:
+            return self.leafs[index]
+        return self.model.quantizer.decode(self.leafs[index], self.dtype)
+
+    def nearest_neighbor(self, value, return_id=False):
+        """Find the nearest neighbor of "value" in this KTree.
+        If "return_id" is True, return its row ID instead.
+        """
+        return self.nearest_neighbors(value)[1 if return_id else 0][0]
+
+    def nearest_neighbors(self, X):
+        """Find the nearest neighbors of all rows of "X" in this KTree,
+        see KTree.nearest_neighbors().
+        """
+        X = numpy.atleast_2d(X)
+        N = len(X)
+        vectors = numpy.empty(X.shape)
+        vectors.fill(numpy.nan)
+        ids = -numpy.ones(N, dtype=int)
+        distances = numpy.empty(N)
+        distances.fill(numpy.inf)
+        nodes = numpy.zeros(N, dtype=int)
+        for level in xrange(self.depth+1):
+            for node, rows in _groups(nodes):
+                keys, first = self._rows(node)
+                if len(keys) == 0:
+                    continue
+                dm = self.model.distance_matrix(X[rows], keys)
+                if level < self.depth:
+                    # never descend into sub-trees without leafs:
+                    dm[:, self.Ns[first:first+len(keys)] == 0] = numpy.inf
+                nearest = numpy.argmin(dm, 1)
+                if level < self.depth:
+                    nodes[rows] = self.children[first + nearest]
+                else:
+                    vectors[rows] = keys[nearest]
+                    ids[rows] = self.ids[first + nearest]
+                    distances[rows] = dm[numpy.arange(len(rows)), nearest]
+        return vectors, ids, distances
+
+    def knn(self, query, k=1, mode="exact", beam_width=None):
+        """Find the "k" nearest leafs of "query" in this KTree,
+        see KTree.knn().
+        """
+        query = numpy.atleast_2d(query)
+        model = self.model
+        # the best leafs so far (indices, distances, metric distances):
+        best = [ numpy.empty(0, dtype=int), numpy.empty(0), numpy.empty(0) ]
+        def add_leafs(node):
+            keys, first = self._rows(node)
+            if len(keys) == 0:
+                return
+            dm = model.distance_matrix(query, keys)[0]
+            candidates = [ first + numpy.arange(len(keys)), dm, model.to_metric(dm) ]
+            for i, candidate in enumerate(candidates):
+                best[i] = numpy.concatenate((best[i], candidate))
+            nearest = numpy.argsort(best[2], kind="mergesort")[:k]
+            for i in xrange(len(best)):
+                best[i] = best[i][nearest]
+        if mode == "exact":
+            # best-first search over (lower bound, node):
+            heap = [ (0.0, 0) ]
+            while heap:
+                bound = best[2][-1] if len(best[2]) == k else numpy.inf
+                lower, node = heapq.heappop(heap)
+                if lower >= bound:
+                    break
+                if node >= self.inner:
+                    add_leafs(node)
+                    continue
+                keys, first = self._rows(node)
+                dm = model.distance_matrix(query, keys)[0]
+                lowers = numpy.maximum(model.to_metric(dm) - self.radii[first:first+len(keys)], lower)
+                for i in numpy.nonzero(lowers < bound)[0]:
+                    heapq.heappush(heap, (lowers[i], self.children[first+i]))
+        elif mode == "beam":
+            if beam_width is None:
+                beam_width = k
+            frontier = [ 0 ]
+            while frontier and frontier[0] < self.inner:
+                children = []
+                for node in frontier:
+                    keys, first = self._rows(node)
+                    dm = model.distance_matrix(query, keys)[0]
+                    nonempty = self.Ns[first:first+len(keys)] > 0
+                    children.extend(zip(dm[nonempty], self.children[first:first+len(keys)][nonempty]))
+                children.sort()
+                frontier = [ node for dist, node in children[:beam_width] ]
+            for node in frontier:
+                add_leafs(node)
+        else:
+            raise ValueError("Unknown search mode %s." % str(mode))
+        return self._leafs(best[0]), self.ids[best[0]], best[1]
+
+    def to_ktree(self):
+        """Returns a (modifiable) KTree with the content of this FlatKTree."""
+        k = trees.KTree(options=self.options)
+        nodes = [ None ] * len(self.node_offsets[:-1])
+        for i in xrange(len(nodes)-1, -1, -1):
+            node = trees.KNode(options=k.options, model=k.model)
+            keys, first = self._rows(i)
+            n = len(keys)
+            if n and i >= self.inner:
+                node.extend(keys, self.ids[first:first+n], numpy.ones(n, dtype=int),
+                            numpy.zeros(n, dtype=int), numpy.zeros(n))
+            elif n:
+                values = numpy.empty(n, dtype=object)
+                for j, child in enumerate(self.children[first:first+n]):
+                    values[j] = nodes[child]
+                node.extend(keys, values, self.Ns[first:first+n],
+                            [ value.N_code_book for value in values ],
+                            self.radii[first:first+n])
+            nodes[i] = node
+        k.root = nodes[0]
+        k.root.parent = k
+        return k
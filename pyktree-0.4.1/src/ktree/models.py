@@ -21,36 +21,208 @@
 # with this program.  If not, see <http://www.gnu.org/licenses/>
 
 import numpy
+import scipy.sparse
 import scipy.spatial.distance
 import scipy.stats
 
 import sys
-import random
+import threading
 
 import trees
 
 DISTANCES = [
-            'eculidean',
+            'euclidean',
             'cityblock',
-            'sqeuclidean'
+            'sqeuclidean',
+            'cosine'
             ]
 
+# integer types of scalar quantized leafs, see ScalarQuantizer:
+QUANTIZATIONS = [
+            'uint8',
+            'int8'
+            ]
+
+# distance matrices of at most SMALL differences are computed directly:
+SMALL = 4096
+# maximum size of the scratch buffers of the euclidean distance kernel:
+SCRATCH_SIZE = 1 << 20
+
+# scratch buffers of the current thread, see _scratch():
+_local = threading.local()
+
+def _scratch(shape, dtype):
+    """Returns an uninitialized array of "shape" and "dtype" that reuses
+    the memory of the current thread's scratch buffer, if possible.
+    """
+    size = shape[0] * shape[1]
+    if size > SCRATCH_SIZE:
+        return numpy.empty(shape, dtype)
+    name = "buffer_" + dtype.name
+    buf = getattr(_local, name, None)
+    if buf is None or len(buf) < size:
+        buf = numpy.empty(max(size, 1024), dtype)
+        setattr(_local, name, buf)
+    return buf[:size].reshape(shape)
+
+def issparse(X):
+    """Returns True if "X" is a scipy.sparse matrix."""
+    return scipy.sparse.issparse(X)
+
+def rows(X, dtype=float):
+    """Returns "X" as a matrix of "dtype" with one example per row, i.e.
+    as 2-d array or, if "X" is sparse, as CSR matrix.  A 1-d "X" is a 
+    single example.
+    """
+    if issparse(X):
+        return scipy.sparse.csr_matrix(X, dtype=dtype)
+    X = numpy.asarray(X, dtype=dtype)
+    if X.ndim == 1:
+        X = X[numpy.newaxis,:]
+    return X
+
+def toarray(X):
+    """Returns "X" as dense array."""
+    if issparse(X):
+        return X.toarray()
+    return X
+
+def sqnorms(X):
+    """Returns the squared euclidean norm of each row of "X"."""
+    if issparse(X):
+        return numpy.asarray(X.multiply(X).sum(1), dtype=float).ravel()
+    return numpy.einsum("ij,ij->i", X, X)
+
+def wsum(weights, X):
+    """Returns the sum of the rows of "X" weighted by "weights" as 1-d array.
+    The sum is accumulated in float64, whatever the type of "X".
+    """
+    weights = numpy.asarray(weights, dtype=float)
+    if issparse(X):
+        return X.T.dot(weights)
+    return numpy.dot(weights, X)
+
+def products(X, Y):
+    """Returns the (dense) matrix of dot products between the rows of "X"
+    and "Y".  If one of them is sparse, the costs are proportional to its
+    number of nonzeros times the number of rows of the other one.
+    """
+    if issparse(X):
+        return toarray(X.dot(Y.T))
+    if issparse(Y):
+        return toarray(Y.dot(X.T)).T
+    return numpy.dot(X, Y.T)
+
+def paired_products(X, Y):
+    """Returns the dot product of each row of "X" with the same row of
+    (dense) "Y".  "X" may be sparse.
+    """
+    if issparse(X):
+        return numpy.asarray(X.multiply(Y).sum(1), dtype=float).ravel()
+    return numpy.einsum("ij,ij->i", X, Y)
+
+def paired_sqdistances(X, Y):
+    """Returns the squared euclidean distance between each row of "X"
+    and the same row of (dense) "Y".  "X" may be sparse.
+    """
+    if issparse(X):
+        return numpy.maximum(sqnorms(X) - 2.0 * paired_products(X, Y) + sqnorms(Y), 0.0)
+    diff = X - Y
+    return numpy.einsum("ij,ij->i", diff, diff)
+
+def paired_cosine_distances(X, Y):
+    """Returns the cosine distance between each row of "X" and the same
+    row of (dense) "Y", see cosine_distances().
+    """
+    scale = numpy.sqrt(sqnorms(X) * sqnorms(Y))
+    dm = paired_products(X, Y) / numpy.where(scale > 0, scale, 1.0)
+    return numpy.clip(1.0 - dm, 0.0, 2.0)
+
+def cosine_distances(X, Y, norms=None, dtype=float):
+    """Returns the cosine distances 1 - x.y / (||x|| ||y||) between the rows
+    of "X" and "Y", which may be sparse.  "norms" are the squared norms of
+    the rows of "Y".  Zero vectors have distance 1 to all vectors.
+    """
+    X = rows(X, dtype)
+    Y = rows(Y, dtype)
+    if norms is None:
+        norms = sqnorms(Y)
+    scale = numpy.sqrt(sqnorms(X))[:,numpy.newaxis] * numpy.sqrt(norms)
+    dm = products(X, Y)
+    dm /= numpy.where(scale > 0, scale, 1.0)
+    return numpy.clip(1.0 - dm, 0.0, 2.0)
+
+def storage_dtype(options):
+    """Returns the floating point type in which K-Trees with "options"
+    store their keys, i.e. options.dtype if present.
+    """
+    return numpy.dtype(getattr(options, "dtype", None) or "float64")
+
 def model(options):
     """Convenient function that returns the right model for given options.
-
+    The model's random number generator is seeded with options.seed and
+    its distances are computed in options.distance_dtype, if present, and
+    in the storage type options.dtype otherwise.  If options.quantize is
+    set, the model's quantizer scalar quantizes leafs in the range 
+    options.quantize_range, see ScalarQuantizer.
     """
+    seed = getattr(options, "seed", None)
+    dtype = getattr(options, "distance_dtype", None) or storage_dtype(options)
     if options.distance == "sqeuclidean" and options.weighted:
-        return WeightedSqeuclideanModel()
-    if options.distance == "sqeuclidean" and not options.weighted:
-        return SqeuclideanModel()
+        m = WeightedSqeuclideanModel(seed, dtype)
+    elif options.distance == "sqeuclidean" and not options.weighted:
+        m = SqeuclideanModel(seed, dtype)
     elif options.distance == "euclidean" and options.weighted:
-        return WeightedEuclideanModel()
+        m = WeightedEuclideanModel(seed, dtype)
     elif options.distance == "euclidean" and not options.weighted:
-        return EuclideanModel()
+        m = EuclideanModel(seed, dtype)
     elif options.distance == "cityblock":
-        return CityblockModel()
+        m = CityblockModel(seed, dtype)
+    elif options.distance == "cosine" and options.weighted:
+        m = WeightedCosineModel(seed, dtype)
+    elif options.distance == "cosine" and not options.weighted:
+        m = CosineModel(seed, dtype)
     else:
         raise ValueError("Options %s unknown." % str(options))
+    quantize = getattr(options, "quantize", None)
+    if quantize:
+        bounds = getattr(options, "quantize_range", None)
+        if bounds is None:
+            raise ValueError("Quantized leafs require options.quantize_range.")
+        m.quantizer = ScalarQuantizer(quantize, bounds[0], bounds[1])
+    return m
+
+class ScalarQuantizer(object):
+    """A ScalarQuantizer stores each component of a vector as an integer 
+    code of type "dtype", one of QUANTIZATIONS, i.e. 
+
+        code = round((x - offset) / scale)
+
+    with a scale and an offset per dimension, such that the range 
+    "low".."high" of each dimension covers all codes.  Components outside
+    the range are clipped.  Codes take 1/8 of the memory of float64.
+    """
+
+    def __init__(self, dtype, low, high):
+        self.dtype = numpy.dtype(dtype)
+        if self.dtype.name not in QUANTIZATIONS:
+            raise ValueError("Quantization %s unknown." % str(dtype))
+        info = numpy.iinfo(self.dtype)
+        self.low = numpy.ravel(numpy.asarray(low, dtype=float))
+        self.high = numpy.ravel(numpy.asarray(high, dtype=float))
+        span = self.high - self.low
+        self.scale = numpy.where(span > 0, span, 1.0) / (int(info.max) - int(info.min))
+        self.offset = self.low - info.min * self.scale
+        self._bounds = (info.min, info.max)
+
+    def encode(self, X):
+        """Returns the codes of the rows of "X"."""
+        codes = numpy.rint((numpy.asarray(X, dtype=float) - self.offset) / self.scale)
+        return numpy.clip(codes, self._bounds[0], self._bounds[1], out=codes).astype(self.dtype)
+
+    def decode(self, codes, dtype=float):
+        """Returns the vectors of "codes" as array of "dtype"."""
+        return (codes * self.scale + self.offset).astype(dtype)
 
 class Model(object):
     """A Model is the base class for all distance and centroid related functions.
@@ -58,8 +230,13 @@ class Model(object):
 
     distance_functions(self, x, y): a function that returns the distance between
                                     x (an example) and y (a centroid).
-    distance_matrix(self, X, Y): a function that returns a distance matrix between
-                                 a list of examples X and a list of centroids Y.
+    distance_matrix(self, X, Y, norms=None): a function that returns a distance 
+                                 matrix between a list of examples X and a 
+                                 list of centroids Y.  Models may use "norms",
+                                 the squared euclidean norms of Y, if given.
+    paired_distances(self, X, Y): a function that returns the distances 
+                                  between the rows of X and the same rows
+                                  of Y, by default with distance_function().
     centroid_function(self, node): a function that computes a representation for
                                    a node.
     clustering_function(self, node): a function that generates two clusters, 
@@ -70,13 +247,44 @@ class Model(object):
     would be the mean parameter mu and the variance parameter sigma.
     However, the data type of "examples" and the representation of centroids 
     only depends on the chosen model.
+
+    Additionally, a model declares how a K-Tree may maintain its centroids:
+
+    incremental: if True, the centroid of a node is the running sum of its
+                 keys divided by the running sum of their weights, and nodes
+                 may update it in O(d) on insert.  Otherwise, it is
+                 recomputed with centroid_function().
+    weighted:    if True, each key is weighted by the number of leafs in 
+                 the related sub-tree, otherwise all keys weigh 1.
+
+    All random choices of a model, e.g. the seeds of k-means, are drawn 
+    from its own random number generator "random", i.e. a model created 
+    with a fixed "seed" builds reproducible K-Trees.  Models may compute
+    their distances in the floating point type "dtype".  A model's
+    "quantizer" is None or a ScalarQuantizer for the leafs of K-Trees, 
+    its "profiler" None or the ktree.profiler.Profiler of its K-Tree.
+
+    The euclidean, squared euclidean and cosine models also accept 
+    scipy.sparse matrices as examples, e.g. TF-IDF vectors of documents.
+    Their distances between sparse examples and (dense) centroids cost
+    time in proportion to the number of nonzeros.
     """
+
+    incremental = False
+    weighted = False
+    quantizer = None
+    profiler = None
+    journal = None
+
+    def __init__(self, seed=None, dtype="float64"):
+        self.random = numpy.random.RandomState(seed)
+        self.dtype = numpy.dtype(dtype)
     
     def distance_function(self, x, y):
         """Returns the distance between x and y."""
         pass
 
-    def distance_matrix(self, X, Y):
+    def distance_matrix(self, X, Y, norms=None):
         """Returns a distance matrix for elements of list X and list Y."""
         N1 = len(X)
         N2 = len(Y)
@@ -86,6 +294,19 @@ class Model(object):
                 dm[ix, iy] = self.distance_function(x.data,y.data)
         return dm    
 
+    def paired_distances(self, X, Y):
+        """Returns the distance between each row of "X" and the same
+        row of "Y".
+        """
+        return numpy.array([ self.distance_function(x, y) for x, y in zip(X, Y) ])
+
+    def to_metric(self, dm):
+        """Returns the distances "dm" in terms of a metric, i.e. a distance
+        that satisfies the triangle inequality.  K-Trees use it to bound 
+        the distances to the leafs of sub-trees.
+        """
+        return dm
+
     def centroid_function(self, node):
         """Computes the centroid for the elements of "node"."""
         pass
@@ -102,61 +323,162 @@ class EuclideanModel(Model):
     Please note that this model does not use weighted averages. 
     """
 
+    incremental = True
+
     def _toarray(self, node):
-        """Generates an numpy array from a nodes keys."""
-        keys = None
-        for item in node:
-            if keys is None:
-                keys = item[0]
-            else: 
-                keys = numpy.vstack((keys, item[0]))
+        """Returns a node's keys as a 2d numpy array."""
+        try:
+            keys = node.keys()
+        except AttributeError:
+            keys = node
+        if issparse(keys):
+            return keys
         return numpy.atleast_2d(keys)
 
     def distance_function(self, x, y):
         """Returns euclidean distance between "x" and "y"."""
         # return numpy.linalg.norm(x-y)
-        return numpy.sqrt(numpy.sum((x-y)**2))
+        if issparse(x) or issparse(y):
+            return self.distance_matrix(x, y)[0,0]
+        diff = numpy.ravel(x) - numpy.ravel(y)
+        return numpy.sqrt(numpy.dot(diff, diff))
         
-    def distance_matrix(self, X, Y):
+    def distance_matrix(self, X, Y, norms=None):
         """Returns a distance matrix for elements of lists "X" and "Y"
-        in terms of euclidean distance.
+        in terms of euclidean distance, see sqdistances().
+        """
+        return numpy.sqrt(self.sqdistances(X, Y, norms))
+
+    def paired_distances(self, X, Y):
+        """Returns the euclidean distance between each row of "X" and
+        the same row of "Y", see paired_sqdistances().
+        """
+        return numpy.sqrt(paired_sqdistances(rows(X), rows(Y)))
+
+    def sqdistances(self, X, Y, norms=None):
+        """Returns the squared euclidean distances between the rows of "X"
+        and "Y" in terms of ||x||^2 - 2 x.y + ||y||^2, i.e. with a single
+        matrix product.  "norms" are the squared norms of the rows of "Y", 
+        e.g. as cached by KNodes.  Small matrices are computed directly.
+        "X" and "Y" may be sparse.
         """
-        return scipy.spatial.distance.cdist(X, Y, metric="euclidean")
+        X = rows(X, self.dtype)
+        Y = rows(Y, self.dtype)
+        sparse = issparse(X) or issparse(Y)
+        if not sparse and X.size * len(Y) <= SMALL:
+            diff = X[:,numpy.newaxis,:] - Y[numpy.newaxis,:,:]
+            return numpy.einsum("ijk,ijk->ij", diff, diff)
+        if norms is None:
+            norms = sqnorms(Y)
+        if sparse:
+            dot = products(X, Y)
+        else:
+            dot = _scratch((X.shape[0], Y.shape[0]), self.dtype)
+            numpy.dot(X, Y.T, out=dot)
+        dot *= 2
+        dm = sqnorms(X)[:,numpy.newaxis] + norms
+        dm -= dot
+        # rounding errors may result in (small) negative distances:
+        return numpy.maximum(dm, 0, out=dm)
 
     def centroid_function(self, node):
         """Computes and returns the average of the node's "node" keys."""
         node = self._toarray(node)
-        return numpy.mean(node,0) 
+        if issparse(node):
+            return numpy.asarray(node.mean(0)).ravel()
+        return numpy.mean(node, 0, dtype=float)
 
     def clustering_function(self, node):
-        """Simple implementation of k-means algorithm.
+        """Performs 2-means clustering on the keys of "node".
         Arguments:
             * node:     ktree.node that should be processed.
         Returns:
             * centroids
             * assignments    
         """    
+        return self.kmeans(self._toarray(node), 2)
+
+    def kmeans(self, X, K, Ns=None):
+        """Simple implementation of k-means algorithm.  The centroids are
+        seeded with k-means++, the iterations stop as soon as the 
+        assignments do not change anymore.
+        Arguments:
+            * X:        examples, one example per row, may be sparse.
+            * K:        number of clusters, at most the number of examples.
+            * Ns:       weights of the examples, only used by 
+                        weighted models.
+        Returns:
+            * centroids
+            * assignments    
+        """    
         # some consts:
         max_iter = 10
-        K = 2
-        # lets start from here:
-        X = self._toarray(node)
-        N, d = X.shape
-        # random initalization:
-        centroids = X[random.sample(xrange(N), 2),:] 
-        for iter in xrange(max_iter): # well, ...
+        X = rows(X)
+        weights = numpy.ones(X.shape[0]) if Ns is None else numpy.asarray(Ns, dtype=float)
+        centroids = self._seed(X, K, weights)
+        assignments = None
+        for iter in xrange(max_iter):
             # assign:
             dm = self.distance_matrix(X, centroids)
-            assignments = numpy.argmin(dm,1)
+            labels = numpy.argmin(dm,1)
             # this shouldn't happen:
-            if len(set(assignments)) == 1:
-                 i = numpy.random.randint(len(assignments)) 
-                 assignments[i] = abs(assignments[i]-1)    
-            #update centroids:
-            for k in xrange(K):
-                centroids[k,:] = self.centroid_function(X[numpy.nonzero(assignments==k)])
+            self._fill_empty_clusters(labels, K)
+            if assignments is not None and numpy.array_equal(labels, assignments):
+                break
+            assignments = labels
+            centroids = self._centroids(X, assignments, K, weights)
         return centroids, assignments
 
+    def _seed(self, X, K, weights):
+        """Choose "K" initial centroids from the rows of "X" with k-means++,
+        i.e. with a probability proportional to their weight times their 
+        squared (metric) distance to the nearest centroid chosen so far.
+        """
+        N = X.shape[0]
+        chosen = []
+        closest = numpy.ones(N)
+        for k in xrange(K):
+            p = weights * closest
+            p[chosen] = 0.0
+            if p.sum() > 0:
+                i = self.random.choice(N, p=p/p.sum())
+            else:
+                # all remaining rows are weightless or duplicates:
+                i = self.random.choice(numpy.setdiff1d(numpy.arange(N), chosen))
+            chosen.append(i)
+            dm = self.to_metric(self.distance_matrix(X, X[i:i+1])[:,0]) ** 2
+            closest = numpy.minimum(closest, dm) if k else dm
+        return toarray(X[chosen]).copy()
+
+    def _centroids(self, X, assignments, K, weights):
+        """Returns the centroids of the "K" clusters of "X", i.e. the
+        (weighted) means of the clusters, computed in a single pass.
+        """
+        N = X.shape[0]
+        if not self.incremental:
+            return numpy.array([ self.centroid_function(X[assignments == k]) 
+                                 for k in xrange(K) ])
+        if not self.weighted:
+            weights = numpy.ones(N)
+        totals = numpy.bincount(assignments, weights, K)
+        if not totals.all():
+            # clusters without weight get the unweighted mean:
+            weights = numpy.where(totals[assignments] > 0, weights, 1.0)
+            totals = numpy.bincount(assignments, weights, K)
+        W = numpy.zeros((K, N))
+        W[assignments, numpy.arange(N)] = weights
+        return products(W, X.T) / totals[:,numpy.newaxis]
+
+    def _fill_empty_clusters(self, assignments, K):
+        """Move random examples to empty clusters."""
+        counts = numpy.bincount(assignments, minlength=K)
+        for k in numpy.nonzero(counts == 0)[0]:
+            candidates = numpy.nonzero(counts[assignments] > 1)[0]
+            i = candidates[self.random.randint(len(candidates))]
+            counts[assignments[i]] -= 1
+            counts[k] += 1
+            assignments[i] = k
+
 
 class SqeuclideanModel(EuclideanModel):
     """A SqeuclideanModel uses euclidean squared distances as distance measure
@@ -168,30 +490,57 @@ class SqeuclideanModel(EuclideanModel):
     def distance_function(self, x, y):
         """Euclidean squared distance between vectors x and y."""
         # return numpy.linalg.norm(x-y)**2
-        return numpy.sum((x-y)**2)
+        if issparse(x) or issparse(y):
+            return self.distance_matrix(x, y)[0,0]
+        diff = numpy.ravel(x) - numpy.ravel(y)
+        return numpy.dot(diff, diff)
         
-    def distance_matrix(self, X, Y):
+    def distance_matrix(self, X, Y, norms=None):
         """Returns a distance matrix for elements of lists "X" and "Y"
-        in terms of euclidean squared distance.
+        in terms of euclidean squared distance, see sqdistances().
+        """
+        return self.sqdistances(X, Y, norms)
+
+    def paired_distances(self, X, Y):
+        """Returns the squared euclidean distance between each row of "X"
+        and the same row of "Y", see paired_sqdistances().
         """
-        return scipy.spatial.distance.cdist(X, Y, metric="sqeuclidean")
+        return paired_sqdistances(rows(X), rows(Y))
+
+    def to_metric(self, dm):
+        """Returns the euclidean distances for squared distances "dm"."""
+        return numpy.sqrt(dm)
 
 
 class CityblockModel(EuclideanModel):
     """A CityblockModel uses cityblock distance as distance measure
     and the median function as centroid funtion.
+
+    Please note that the median can not be updated incrementally.
     """
 
+    incremental = False
+
     def distance_function(self, x, y):
         """cityblock distance between vectors "x" and "y"."""
         return numpy.sum(abs(x-y))
         
-    def distance_matrix(self, X, Y):
+    def distance_matrix(self, X, Y, norms=None):
         """Returns a distance matrix for elements of lists "X" and "Y"
         in terms of cityblock distances.
         """
+        if issparse(X) or issparse(Y):
+            raise TypeError("The cityblock model does not support sparse examples.")
         return scipy.spatial.distance.cdist(X, Y, metric="cityblock")
 
+    def paired_distances(self, X, Y):
+        """Returns the cityblock distance between each row of "X" and
+        the same row of "Y".
+        """
+        if issparse(X) or issparse(Y):
+            raise TypeError("The cityblock model does not support sparse examples.")
+        return numpy.sum(abs(rows(X) - rows(Y)), 1)
+
     def centroid_function(self, node):
         """Returns the median of "node"'s keys."""
         node = self._toarray(node)
@@ -209,10 +558,14 @@ class WeightedEuclideanModel(EuclideanModel):
     Please note that this model uses weighted averages. 
     """
 
+    weighted = True
+
     def centroid_function(self, node, Ns=None):
         if Ns is None:
             Ns = node.Ns
         X = self._toarray(node) 
+        if issparse(X):
+            return wsum(Ns, X) / numpy.sum(Ns)
         try:
             centroid = numpy.average(numpy.atleast_2d(X), weights=Ns, axis=0)
         except (ZeroDivisionError, IndexError):
@@ -220,7 +573,7 @@ class WeightedEuclideanModel(EuclideanModel):
         return centroid
 
     def clustering_function(self, node):
-        """Simple implementation of k-means algorithm.
+        """Performs 2-means clustering on the keys of "node".
         Arguments:
             * node:     ktree.node that should be processed.
         Returns:
@@ -228,28 +581,7 @@ class WeightedEuclideanModel(EuclideanModel):
             * assignments    
         This function uses weighted means.
         """    
-        # some consts:
-        max_iter = 10
-        K = 2
-        # lets start from here:
-        X = self._toarray(node)
-        N, d = X.shape
-        Ns = numpy.array(node.Ns)
-        # random initalization:
-        centroids = X[random.sample(xrange(N), 2),:] 
-        for iter in xrange(max_iter): # well, ...
-            # assign:
-            dm = self.distance_matrix(X, centroids)
-            assignments = numpy.argmin(dm,1)
-            # this shouldn't happen:
-            if len(set(assignments)) == 1:
-                 i = numpy.random.randint(len(assignments)) 
-                 assignments[i] = abs(assignments[i]-1)    
-            #update centroids:
-            for k in xrange(K):
-                centroids[k,:] = self.centroid_function(X[numpy.nonzero(assignments==k)], 
-                                                        Ns[assignments==k])
-        return centroids, assignments
+        return self.kmeans(self._toarray(node), 2, numpy.array(node.Ns))
 
 
 class WeightedSqeuclideanModel(WeightedEuclideanModel):
@@ -261,12 +593,85 @@ class WeightedSqeuclideanModel(WeightedEuclideanModel):
     def distance_function(self, x, y):
         """Euclidean squared distance between vectors x and y."""
         # return numpy.linalg.norm(x-y)**2
-        return numpy.sum((x-y)**2)
+        if issparse(x) or issparse(y):
+            return self.distance_matrix(x, y)[0,0]
+        diff = numpy.ravel(x) - numpy.ravel(y)
+        return numpy.dot(diff, diff)
         
-    def distance_matrix(self, X, Y):
+    def distance_matrix(self, X, Y, norms=None):
+        """Returns a distance matrix for elements of lists "X" and "Y"
+        in terms of euclidean squared distance, see sqdistances().
+        """
+        return self.sqdistances(X, Y, norms)
+
+    def paired_distances(self, X, Y):
+        """Returns the squared euclidean distance between each row of "X"
+        and the same row of "Y", see paired_sqdistances().
+        """
+        return paired_sqdistances(rows(X), rows(Y))
+
+    def to_metric(self, dm):
+        """Returns the euclidean distances for squared distances "dm"."""
+        return numpy.sqrt(dm)
+
+
+class CosineModel(EuclideanModel):
+    """A CosineModel uses the cosine distance 1 - x.y / (||x|| ||y||)
+    as distance measure and the average function to compute the 
+    centroid, i.e. it clusters the directions of the examples, e.g. of
+    (sparse) TF-IDF vectors.  Normalize the examples to unit length if
+    long examples should not dominate the centroids.
+    
+    Please note that this model does not use weighted averages. 
+    """
+
+    def distance_function(self, x, y):
+        """Cosine distance between vectors x and y."""
+        return cosine_distances(x, y, dtype=self.dtype)[0,0]
+
+    def distance_matrix(self, X, Y, norms=None):
+        """Returns a distance matrix for elements of lists "X" and "Y"
+        in terms of cosine distance, see cosine_distances().
+        """
+        return cosine_distances(X, Y, norms, self.dtype)
+
+    def paired_distances(self, X, Y):
+        """Returns the cosine distance between each row of "X" and the
+        same row of "Y", see paired_cosine_distances().
+        """
+        return paired_cosine_distances(rows(X), rows(Y))
+
+    def to_metric(self, dm):
+        """Returns the euclidean distances between the normalized
+        vectors for cosine distances "dm".
+        """
+        return numpy.sqrt(2.0 * numpy.asarray(dm))
+
+
+class WeightedCosineModel(WeightedEuclideanModel):
+    """A WeightedCosineModel uses cosine distance as distance measure
+    and the weighted average function to compute the centroid,
+    see CosineModel.
+    """
+
+    def distance_function(self, x, y):
+        """Cosine distance between vectors x and y."""
+        return cosine_distances(x, y, dtype=self.dtype)[0,0]
+
+    def distance_matrix(self, X, Y, norms=None):
         """Returns a distance matrix for elements of lists "X" and "Y"
-        in terms of euclidean squared distance.
+        in terms of cosine distance, see cosine_distances().
         """
-        return scipy.spatial.distance.cdist(X, Y, metric="sqeuclidean")
+        return cosine_distances(X, Y, norms, self.dtype)
 
+    def paired_distances(self, X, Y):
+        """Returns the cosine distance between each row of "X" and the
+        same row of "Y", see paired_cosine_distances().
+        """
+        return paired_cosine_distances(rows(X), rows(Y))
 
+    def to_metric(self, dm):
+        """Returns the euclidean distances between the normalized
+        vectors for cosine distances "dm".
+        """
+        return numpy.sqrt(2.0 * numpy.asarray(dm))
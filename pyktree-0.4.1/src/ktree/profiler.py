@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""
+This module provides the instrumentation of K-Tree builds.
+
+A KTree built with options.profile set has a Profiler as its model's
+"profiler", which the KTree and its KNodes feed with
+    * counters per level, i.e. per node depth (0 for the nodes that
+      hold leafs):
+        - distances:    number of distance evaluations,
+        - splits:       number of node splits,
+        - root_splits:  number of root splits, i.e. new levels,
+        - centroids:    number of centroid computations,
+    * cumulative timers:
+        - build:        ktree() without the re-insert pass,
+        - insert:       KTree.insert(),
+        - descent:      choosing the nearest child on the way down,
+        - split:        clustering and distributing the items of
+                        split nodes,
+        - reinsert:     the re-insert pass of ktree().
+Without options.profile, the model's profiler is None and the KTree
+only checks for it.  See KTree.stats() for the results.
+"""
+
+import timeit
+
+# clock of the timers:
+clock = timeit.default_timer
+
+
+class Profiler(object):
+    """Counters per level and cumulative timers, see the module
+    documentation.  The counters of a level are lists indexed by level.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+
+    def count(self, name, level, n=1):
+        """Add "n" to the counter "name" of level "level"."""
+        counts = self.counters.setdefault(name, [])
+        if level >= len(counts):
+            counts.extend([ 0 ] * (level + 1 - len(counts)))
+        counts[level] += n
+
+    def stop(self, name, start):
+        """Add the time since "start", a value of clock(), to the timer "name"."""
+        seconds, calls = self.timers.get(name, (0.0, 0))
+        self.timers[name] = (seconds + clock() - start, calls + 1)
+
+    def update(self, other):
+        """Add the counters and timers of Profiler "other" to this one."""
+        for name, counts in other.counters.items():
+            for level, n in enumerate(counts):
+                self.count(name, level, n)
+        for name, (seconds, calls) in other.timers.items():
+            total, n = self.timers.get(name, (0.0, 0))
+            self.timers[name] = (total + seconds, n + calls)
+
+    def stats(self):
+        """Returns the counters and timers as dict:
+            * counters: name -> list of counts per level.
+            * timers:   name -> dict of "seconds" and "calls".
+        """
+        return {
+            "counters": dict((name, list(counts)) for name, counts in self.counters.items()),
+            "timers":   dict((name, { "seconds": seconds, "calls": calls })
+                             for name, (seconds, calls) in self.timers.items()),
+            }
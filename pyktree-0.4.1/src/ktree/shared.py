@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""
+This module provides K-Trees that serve queries from many threads while
+a single writer inserts and deletes.
+
+A SharedKTree publishes its content as immutable Snapshots.  The writer
+never modifies a node of a published snapshot: before an insert, it
+copies the nodes on the path from the root to the target leaf node
+(copy-on-write, see KNode.copy()), before a delete also their sub-nodes,
+which may be merged.  The new snapshot is then published by a single
+(atomic) assignment.  Queries read the latest snapshot and never block,
+queries that run while the writer inserts see the previous snapshot.
+
+    >>> k = SharedKTree(ktree.ktree(data, options), threads=4)
+    >>> # writer thread:
+    >>> k.insert(x, row_id=i)
+    >>> # query threads:
+    >>> vectors, ids, distances = k.nearest_neighbors(X)
+
+The query methods of a SharedKTree use its latest snapshot.  The pool
+methods map_nearest_neighbors() and map_knn() run a batch of queries on
+a thread pool; numpy releases the GIL in the distance computations.
+"""
+
+import collections
+import multiprocessing.pool
+import threading
+
+import models
+import trees
+
+
+class Snapshot(trees.KTree):
+    """A read-only version of a SharedKTree.  It answers all queries
+    of KTree, its methods that modify the tree raise TypeError.
+    """
+
+    def __init__(self, k):
+        self.ID = -1
+        self.options = k.options
+        self.model = k.model
+        self.root = k.root
+        self.window = collections.deque()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Snapshots of K-Trees are read-only.")
+
+    insert = delete = bulk_load = merge = parallel_reinsert = _read_only
+    remove_leafs = new_root = _read_only
+
+
+class SharedKTree(trees.KTree):
+    """A KTree that serves queries from many threads while a single
+    writer inserts and deletes, see the module documentation.
+    Arguments:
+        * k:        the KTree to share, by default an empty KTree with
+                    "options".  The SharedKTree takes over the nodes of
+                    "k", i.e. "k" must not be modified any more.
+        * options:  the options of an empty KTree.
+        * threads:  number of threads of the query pool, by default
+                    the number of CPUs.
+    """
+
+    def __init__(self, k=None, options=None, threads=None):
+        if k is None:
+            trees.KTree.__init__(self, options)
+        else:
+            self.ID = -1
+            self.options = k.options
+            self.model = k.model
+            self.root = k.root
+            self.root.parent = self
+            self.window = k.window
+        self.threads = threads
+        self._lock = threading.RLock()
+        self._pool = None
+        self._publish()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ("_lock", "_pool", "_snapshot", "_published"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._pool = None
+        self._publish()
+
+    def snapshot(self):
+        """Returns the latest published Snapshot."""
+        return self._snapshot
+
+    def _publish(self):
+        """Publish the current content as the latest snapshot."""
+        self._snapshot = Snapshot(self)
+        # nodes with a larger ID have been created after publishing:
+        self._published = next(trees._ids)
+
+    def _private(self, node):
+        """Returns the private version of "node", i.e. copies "node"
+        and its ancestors that may be part of a published snapshot and
+        links the copies into the current tree.
+        """
+        path = []
+        while isinstance(node, trees.KNode):
+            path.append(node)
+            node = node.parent
+        parent = None
+        for node in reversed(path):
+            if node.ID < self._published:
+                copy = node.copy()
+                if parent is None:
+                    self.root = copy
+                    copy.parent = self
+                else:
+                    parent._values[parent.index(node)] = copy
+                    copy.parent = parent
+                node = copy
+            parent = node
+        return parent
+
+    def _private_family(self, node):
+        """Returns the private version of "node", see _private(),
+        the sub-nodes of its ancestors are made private as well.
+        """
+        node = self._private(node)
+        parent = node.parent
+        while isinstance(parent, trees.KNode):
+            for i, child in enumerate(parent.values()):
+                if child.ID < self._published:
+                    copy = child.copy()
+                    copy.parent = parent
+                    parent._values[i] = copy
+            parent = parent.parent
+        return node
+
+    def _descend(self, value):
+        """Returns the node that holds leafs which an insert of
+        "value" reaches, see KNode.insert().
+        """
+        node = self.root
+        while not node.hold_leafs:
+            node = node._values[node.nearestindex(value)]
+        return node
+
+    def insert(self, value, split=True, row_id=-1):
+        """Insert "value" and publish a new snapshot, see KTree.insert()."""
+        with self._lock:
+            self._private(self._descend(value))
+            trees.KTree.insert(self, value, split, row_id)
+            self._publish()
+
+    def insert_many(self, X, row_ids=None, split=True):
+        """Insert the rows of "X" with their "row_ids" (default -1) and
+        publish a single new snapshot afterwards, i.e. nodes are copied
+        once per batch.
+        """
+        X = models.rows(X)
+        if row_ids is None:
+            row_ids = [ -1 ] * X.shape[0]
+        with self._lock:
+            for x, row_id in zip(X, row_ids):
+                self._private(self._descend(x))
+                trees.KTree.insert(self, x, split, row_id)
+            self._publish()
+
+    def delete(self, row_id, value=None):
+        """Delete a leaf and publish a new snapshot, see KTree.delete()."""
+        with self._lock:
+            node, i = self._locate(row_id, value)
+            self._delete_leaf(self._private_family(node), i)
+            self._publish()
+
+    def bulk_load(self, keys, values=None, Ns=None):
+        """Replace the content and publish a new snapshot,
+        see KTree.bulk_load().
+        """
+        with self._lock:
+            trees.KTree.bulk_load(self, keys, values, Ns)
+            self._publish()
+
+    def _not_shared(self, *args, **kwargs):
+        raise TypeError("This method modifies all nodes in place, please use "
+                        "it before sharing the KTree.")
+
+    merge = parallel_reinsert = remove_leafs = _not_shared
+
+    def nearest_neighbor(self, value, return_id=False):
+        return self._snapshot.nearest_neighbor(value, return_id)
+
+    def nearest_neighbors(self, X):
+        return self._snapshot.nearest_neighbors(X)
+
+    def knn(self, query, k=1, mode="exact", beam_width=None):
+        return self._snapshot.knn(query, k, mode, beam_width)
+
+    def codebook(self, level=1):
+        return self._snapshot.codebook(level)
+
+    def predict(self, X, level=1):
+        return self._snapshot.predict(X, level)
+
+    def encode(self, X):
+        return self._snapshot.encode(X)
+
+    def stats(self):
+        return self._snapshot.stats()
+
+    def pool(self):
+        """Returns the thread pool of the query methods map_*()."""
+        if self._pool is None:
+            self._pool = multiprocessing.pool.ThreadPool(self.threads)
+        return self._pool
+
+    def close(self):
+        """Stop the threads of the query pool."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def map_nearest_neighbors(self, X, batch_size=1000):
+        """Find the nearest neighbors of the rows of "X" on the thread
+        pool, in batches of "batch_size" rows, see KTree.nearest_neighbors().
+        All batches are searched in the same snapshot.
+        """
+        snapshot = self._snapshot
+        X = models.rows(X)
+        batches = [ X[i:i+batch_size] for i in xrange(0, X.shape[0], batch_size) ]
+        if len(batches) < 2:
+            return snapshot.nearest_neighbors(X)
+        results = self.pool().map(snapshot.nearest_neighbors, batches)
+        return tuple(trees._concatenate([ result[j] for result in results ])
+                     for j in xrange(3))
+
+    def map_knn(self, queries, k=1, mode="exact", beam_width=None):
+        """Find the "k" nearest leafs of each row of "queries" on the
+        thread pool, see KTree.knn().  All queries are searched in the
+        same snapshot.
+        Returns:
+            * a list of (vectors, ids, distances), one per query.
+        """
+        snapshot = self._snapshot
+        queries = models.rows(queries)
+        return self.pool().map(lambda query: snapshot.knn(query, k, mode, beam_width),
+                               [ queries[i] for i in xrange(queries.shape[0]) ])
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+
+
+"""
+This module provides data sets that are read in chunks of rows.
+
+A source is re-iterable: each iteration reads the data set again, 
+chunk by chunk, so that a K-Tree can be built from data sets that do 
+not fit into memory.  Each chunk is a 2-d float array of at most
+"chunk_size" rows, or a CSR matrix for sparse data sets in memory.
+"""
+
+import itertools
+import os
+
+import numpy
+import scipy.sparse
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+CHUNK_SIZE = 10000
+
+
+def open_source(filename, chunk_size=CHUNK_SIZE, dataset=None):
+    """Convenient function that returns the right source for "filename".
+    Arguments:
+        * filename:     a .npy file, a .npz file of a scipy.sparse matrix
+                        (see scipy.sparse.save_npz()), a HDF5 file 
+                        (.h5, .hdf5) or a text file with one example 
+                        per line.
+        * chunk_size:   the maximum number of rows per chunk.
+        * dataset:      the name of the data set in a HDF5 file.
+    Returns:
+        * a Source
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".npy":
+        return NpySource(filename, chunk_size)
+    if extension == ".npz":
+        return ArraySource(scipy.sparse.load_npz(filename), chunk_size)
+    if extension in (".h5", ".hdf5"):
+        return HDF5Source(filename, dataset, chunk_size)
+    return TextSource(filename, chunk_size)
+
+
+def chunks(data, chunk_size=CHUNK_SIZE):
+    """Returns "data" if it is a Source, an ArraySource for "data" otherwise."""
+    if isinstance(data, Source):
+        return data
+    return ArraySource(data, chunk_size)
+
+
+def split(data, n):
+    """Split the rows of array or sparse matrix "data" into "n" 
+    parts of (almost) equal size, see numpy.array_split().
+    """
+    sizes = [ len(part) for part in numpy.array_split(numpy.arange(data.shape[0]), n) ]
+    bounds = numpy.cumsum([ 0 ] + sizes)
+    return [ data[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) ]
+
+
+def ranges(data):
+    """Returns the minimum and the maximum of each column of "data",
+    an array or a source, computed chunk by chunk.
+    """
+    low = high = None
+    for chunk in chunks(data):
+        if chunk.shape[0] == 0:
+            continue
+        if scipy.sparse.issparse(chunk):
+            lo = chunk.min(0).toarray().ravel()
+            hi = chunk.max(0).toarray().ravel()
+        else:
+            lo, hi = chunk.min(0), chunk.max(0)
+        if low is None:
+            low, high = lo, hi
+        else:
+            low, high = numpy.minimum(low, lo), numpy.maximum(high, hi)
+    if low is None:
+        return numpy.empty(0), numpy.empty(0)
+    return low, high
+
+
+def _rows(chunk):
+    """Returns "chunk" as 2-d float array, a 1-d chunk is a column.
+    Sparse chunks are returned as CSR matrix.
+    """
+    if scipy.sparse.issparse(chunk):
+        return scipy.sparse.csr_matrix(chunk, dtype=float)
+    chunk = numpy.asarray(chunk, dtype=float)
+    if chunk.ndim == 1:
+        chunk = chunk.reshape(len(chunk), 1)
+    return chunk
+
+
+class Source(object):
+    """Base class of all sources."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive, got %s." % str(chunk_size))
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def read(self):
+        """Returns the complete data set as a single array."""
+        chunks = list(self)
+        if not chunks:
+            return numpy.empty((0, 1))
+        if scipy.sparse.issparse(chunks[0]):
+            return scipy.sparse.vstack(chunks, format="csr")
+        return numpy.concatenate(chunks)
+
+
+class ArraySource(Source):
+    """Source for a data set in memory, an array or a scipy.sparse matrix."""
+
+    def __init__(self, data, chunk_size=CHUNK_SIZE):
+        Source.__init__(self, chunk_size)
+        self.data = _rows(data)
+
+    def __iter__(self):
+        for i in xrange(0, self.data.shape[0], self.chunk_size):
+            yield self.data[i:i+self.chunk_size]
+
+    def read(self):
+        return self.data
+
+
+class NpySource(Source):
+    """Source for a .npy file, the file is memory-mapped and
+    only one chunk at a time is read.
+    """
+
+    def __init__(self, filename, chunk_size=CHUNK_SIZE):
+        Source.__init__(self, chunk_size)
+        self.filename = filename
+        # fail early on missing or broken files:
+        numpy.load(filename, mmap_mode="r")
+
+    def __iter__(self):
+        data = numpy.load(self.filename, mmap_mode="r")
+        for i in xrange(0, len(data), self.chunk_size):
+            yield _rows(data[i:i+self.chunk_size])
+
+
+class HDF5Source(Source):
+    """Source for a data set "dataset" of a HDF5 file, requires h5py.
+    If "dataset" is None, the file must contain exactly one data set.
+    """
+
+    def __init__(self, filename, dataset=None, chunk_size=CHUNK_SIZE):
+        Source.__init__(self, chunk_size)
+        if h5py is None:
+            raise ImportError("Please install h5py (http://www.h5py.org) to read HDF5 files.")
+        self.filename = filename
+        f = h5py.File(filename, "r")
+        try:
+            if dataset is None:
+                names = f.keys()
+                if len(names) != 1:
+                    raise ValueError("%s contains %i data sets, please choose one." 
+                                     % (filename, len(names)))
+                dataset = names[0]
+            if dataset not in f:
+                raise ValueError("%s does not contain a data set %s." % (filename, dataset))
+        finally:
+            f.close()
+        self.dataset = dataset
+
+    def __iter__(self):
+        f = h5py.File(self.filename, "r")
+        try:
+            data = f[self.dataset]
+            for i in xrange(0, len(data), self.chunk_size):
+                yield _rows(data[i:i+self.chunk_size])
+        finally:
+            f.close()
+
+
+class TextSource(Source):
+    """Source for a text file with one example per line, as read by
+    numpy.loadtxt(): values are separated by whitespace, "#" starts a 
+    comment.
+    """
+
+    def __init__(self, filename, chunk_size=CHUNK_SIZE):
+        Source.__init__(self, chunk_size)
+        self.filename = filename
+        # fail early on missing files:
+        open(filename).close()
+
+    def __iter__(self):
+        f = open(self.filename)
+        try:
+            lines = (line.split("#", 1)[0] for line in f)
+            lines = (line for line in lines if line.strip())
+            while True:
+                chunk = list(itertools.islice(lines, self.chunk_size))
+                if not chunk:
+                    break
+                yield self._parse(chunk)
+        finally:
+            f.close()
+
+    def _parse(self, lines):
+        """Returns the rows of "lines" as 2-d float array."""
+        d = len(lines[0].split())
+        values = numpy.fromstring(" ".join(lines), dtype=float, sep=" ")
+        if len(values) != d * len(lines):
+            raise ValueError("%s: all lines must contain %i values." % (self.filename, d))
+        return values.reshape(len(lines), d)
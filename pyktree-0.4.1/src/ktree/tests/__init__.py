@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""
+The tests of the ktree package.  Run them from the "src" directory:
+
+    > python -m unittest discover -s ktree/tests -t .
+"""
+
+import numpy
+
+from ktree import trees
+
+
+def data(n, d=8, seed=0):
+    """Returns a random (n, d) data set."""
+    return numpy.random.RandomState(seed).rand(n, d)
+
+
+def options(**kwargs):
+    """Returns KTreeOptions with a fixed seed and "kwargs" set."""
+    o = trees.KTreeOptions()
+    o.seed = 1
+    for name, value in kwargs.items():
+        setattr(o, name, value)
+    return o
+
+
+def leafs(k):
+    """Returns the row IDs of the leafs of KTree "k", sorted."""
+    ids = [ node.values() for node in k.root.walk() if node.hold_leafs and len(node) ]
+    return numpy.sort(numpy.concatenate(ids)) if ids else numpy.empty(0, dtype=int)
+
+
+def brute_force(X, Q, metric="sqeuclidean"):
+    """Returns the index of the nearest row of "X" for each row of "Q"."""
+    import scipy.spatial.distance
+    return numpy.argmin(scipy.spatial.distance.cdist(Q, X, metric), 1)
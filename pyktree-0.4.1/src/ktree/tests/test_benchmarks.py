@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the benchmark suite in the directory "benchmarks" of the 
+pyktree sources.  They are skipped for an installed pyktree.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy
+import scipy.sparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if os.path.isdir(os.path.join(ROOT, "benchmarks")):
+    sys.path.insert(0, ROOT)
+    from benchmarks import compare, run
+else:
+    run = None
+
+
+def case(**kwargs):
+    """Returns a small benchmark case with "kwargs" set."""
+    result = { "N": 300, "d": 4, "order": 5, "distance": "sqeuclidean", "weighted": True,
+               "reinsert": False, "density": 1.0, "dtype": "float64" }
+    result.update(kwargs)
+    return result
+
+
+@unittest.skipIf(run is None, "no benchmarks directory")
+class RunTest(unittest.TestCase):
+
+    def test_make_data(self):
+        numpy.testing.assert_array_equal(run.make_data(100, 5, 3), run.make_data(100, 5, 3))
+        self.assertEqual(run.make_data(100, 5, 3).shape, (100, 5))
+        X = run.make_data(1000, 50, 3, density=0.1)
+        self.assertTrue(scipy.sparse.isspmatrix_csr(X))
+        self.assertEqual(X.shape, (1000, 50))
+        self.assertTrue(abs(X.nnz / 50000.0 - 0.1) < 0.02)
+
+    def test_cases(self):
+        parameters = dict(run.PRESETS["default"])
+        parameters["density"] = [1.0, 0.1]
+        todo = run.cases(parameters)
+        self.assertEqual(len(set(tuple(sorted(c.items())) for c in todo)), len(todo))
+        for c in todo:
+            if c["distance"] == "cityblock":
+                self.assertTrue(c["weighted"])
+                self.assertEqual(c["density"], 1.0)
+        n = numpy.prod([ len(values) for values in parameters.values() ])
+        cityblock = n / len(parameters["distance"])
+        self.assertEqual(len(todo), n - cityblock + cityblock // 4)
+
+    def test_run_case(self):
+        for c in (case(), case(distance="cosine", density=0.2, d=40), case(dtype="float32")):
+            result = run.run_case((c, 20, 3, 0))
+            self.assertTrue(result["build_seconds"] > 0)
+            self.assertTrue(result["depth"] >= 1)
+            self.assertTrue(result["nodes"] > 1)
+            self.assertTrue(result["distortion"] >= 0)
+            for name in ("latency_ms", "knn_latency_ms"):
+                self.assertTrue(result[name]["p50"] <= result[name]["p90"] <= result[name]["max"])
+            # the results can be written as JSON:
+            json.dumps(result)
+
+    def test_distortion(self):
+        # the mean squared distance of the leafs to their prototypes:
+        c = case()
+        result = run.run_case((c, 5, 1, 0))
+        options = run.ktree.KTreeOptions()
+        for name in run.OPTIONS:
+            setattr(options, name, c[name])
+        options.seed = 0
+        tree = run.ktree.ktree(run.make_data(c["N"], c["d"], 0), options)
+        total = 0.0
+        for node in tree.root.walk():
+            if node.depth != 1:
+                continue
+            for key, child in zip(node.keys(), node.values()):
+                if child.N:
+                    total += numpy.sum((child.keys() - key) ** 2)
+        self.assertAlmostEqual(result["distortion"], total / c["N"])
+
+
+@unittest.skipIf(run is None, "no benchmarks directory")
+class CompareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, results):
+        filename = os.path.join(self.directory, name)
+        f = open(filename, "w")
+        json.dump({ "results": results }, f)
+        f.close()
+        return filename
+
+    def test_compare(self):
+        old = { "build_seconds": 1.0, "throughput_qps": 100.0, "latency_ms": { "p50": 2.0 } }
+        new = { "build_seconds": 1.5, "throughput_qps": 50.0, "latency_ms": { "p50": 2.1 } }
+        c = case()
+        # results of older versions have neither density nor dtype:
+        del c["density"], c["dtype"]
+        first = compare.load(self.write("old.json", [ { "case": c, "metrics": old } ]))
+        second = compare.load(self.write("new.json", [ { "case": case(), "metrics": new }, 
+                                                       { "case": case(N=10), "metrics": new } ]))
+        self.assertEqual(set(first), set(second) - set([ tuple(case(N=10)[name] for name in run.PARAMETERS) ]))
+        lines, worse = compare.compare(first, second, 0.1)
+        # slower builds and less throughput are worse, the latency is within the threshold:
+        self.assertEqual(worse, 2)
+        marked = [ line.split()[0] for line in lines if line.endswith("!") ]
+        self.assertEqual(marked, [ "build_seconds", "throughput_qps" ])
+        self.assertTrue(lines[-1].startswith("only in new"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the checkpoints of K-Tree builds, see module ktree.checkpoint."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import scipy.sparse
+
+from ktree import checkpoint, sources, trees
+from ktree.tests import data, options
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingSource(sources.ArraySource):
+    """An ArraySource that raises Crash after "rows" rows have been read,
+    counted over all passes.
+    """
+
+    def __init__(self, data, chunk_size, rows):
+        sources.ArraySource.__init__(self, data, chunk_size)
+        self.rows = rows
+
+    def __iter__(self):
+        for chunk in sources.ArraySource.__iter__(self):
+            if self.rows < chunk.shape[0]:
+                raise Crash()
+            self.rows -= chunk.shape[0]
+            yield chunk
+
+
+def content(k):
+    """Returns the keys and the row IDs of the nodes of "k" in walk order."""
+    return [ (node.keys(), node.values() if node.hold_leafs else None) for node in k.root.walk() ]
+
+
+class ResumeTest(unittest.TestCase):
+    """A resumed build results in the K-Tree of an uninterrupted one."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "ktree.ckpt")
+        self.X = data(1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameTree(self, k, other):
+        first, second = content(k), content(other)
+        self.assertEqual(len(first), len(second))
+        for (keys1, ids1), (keys2, ids2) in zip(first, second):
+            numpy.testing.assert_array_equal(ids1, ids2)
+            self.assertEqual(len(keys1), len(keys2))
+            if len(keys1):
+                # the running sums of resumed nodes are recomputed:
+                numpy.testing.assert_allclose(keys1, keys2, rtol=1e-12, atol=1e-12)
+
+    def resume(self, rows, **kwargs):
+        """Crash a build after "rows" rows, resume it and compare the
+        result with an uninterrupted build.
+        """
+        o = options(checkpoint=self.filename, checkpoint_every=100, **kwargs)
+        self.assertRaises(Crash, trees.ktree, CrashingSource(self.X, 50, rows), o)
+        self.assertTrue(os.path.exists(self.filename))
+        k = trees.ktree(sources.ArraySource(self.X, 50), options(checkpoint=self.filename, 
+                        checkpoint_every=100, resume=True, **kwargs))
+        self.assertSameTree(k, trees.ktree(self.X, options(**kwargs)))
+
+    def test_build(self):
+        self.resume(430, reinsert=False)
+
+    def test_reinsert(self):
+        self.resume(1570)
+
+    def test_before_first_checkpoint(self):
+        self.resume(50, reinsert=False)
+
+    def test_float32(self):
+        self.resume(730, dtype="float32", reinsert=False)
+
+    def test_quantize(self):
+        self.resume(1250, quantize="uint8")
+
+    def test_without_checkpoint(self):
+        # "resume" without a checkpoint file starts from scratch:
+        k = trees.ktree(self.X, options(checkpoint=self.filename, resume=True))
+        self.assertSameTree(k, trees.ktree(self.X, options()))
+
+    def test_done(self):
+        # resuming a finished build returns its K-Tree:
+        k = trees.ktree(self.X, options(checkpoint=self.filename))
+        resumed = trees.ktree(self.X, options(checkpoint=self.filename, resume=True))
+        self.assertSameTree(resumed, k)
+
+    def test_incomplete_segment(self):
+        # a segment that has not been written completely is ignored:
+        o = options(checkpoint=self.filename, checkpoint_every=100, reinsert=False)
+        self.assertRaises(Crash, trees.ktree, CrashingSource(self.X, 50, 430), o)
+        offsets = [ meta["offset"] for meta, arrays in checkpoint._segments(self.filename) ]
+        self.assertTrue(len(offsets) > 1)
+        k, phase, offset = checkpoint.load(self.filename, o)
+        self.assertEqual((phase, offset, k.N), ("build", offsets[-1], offsets[-1]))
+        f = open(self.filename, "r+b")
+        f.truncate(os.path.getsize(self.filename) - 100)
+        f.close()
+        k, phase, offset = checkpoint.load(self.filename, o)
+        self.assertEqual((phase, offset, k.N), ("build", offsets[-2], offsets[-2]))
+
+    def test_options(self):
+        o = options(checkpoint=self.filename, checkpoint_every=100, reinsert=False)
+        self.assertRaises(Crash, trees.ktree, CrashingSource(self.X, 50, 330), o)
+        self.assertRaises(ValueError, trees.ktree, self.X, 
+                          options(checkpoint=self.filename, resume=True, order=7, reinsert=False))
+
+    def test_incremental(self):
+        # a segment holds the nodes on the insert paths only:
+        o = options(checkpoint=self.filename, checkpoint_every=1, reinsert=False)
+        self.assertRaises(Crash, trees.ktree, CrashingSource(self.X, 50, 530), o)
+        depth = checkpoint.load(self.filename, o)[0].depth
+        segments = list(checkpoint._segments(self.filename))
+        for (meta, arrays), (previous, _) in zip(segments[1:], segments):
+            if meta["offset"] == previous["offset"] + 1:
+                # the path and the nodes of splits:
+                self.assertTrue(len(arrays["ids"]) <= 2 * (depth + 2))
+
+    def test_sparse(self):
+        X = scipy.sparse.random(100, 20, density=0.2, format="csr", random_state=0)
+        self.assertRaises(ValueError, trees.ktree, X, options(checkpoint=self.filename, distance="cosine"))
+
+    def test_compaction(self):
+        # the log is rewritten once it holds too many records:
+        o = options(checkpoint=self.filename, checkpoint_every=10, reinsert=False)
+        trees.ktree(self.X, o)
+        records = sum(len(arrays["ids"]) for meta, arrays in checkpoint._segments(self.filename))
+        nodes = sum(1 for node in trees.ktree(self.X, options(reinsert=False)).root.walk())
+        self.assertTrue(records <= (checkpoint.COMPACT + 1) * nodes)
+
+
+if __name__ == "__main__":
+    unittest.main()
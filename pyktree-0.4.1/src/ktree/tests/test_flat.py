@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the flat K-Tree file format, see module ktree.flat."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import scipy.sparse
+
+from ktree import flat, trees, utils
+from ktree.tests import data, options, brute_force
+
+
+class FlatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "ktree.ktf")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def round_trip(self, k):
+        """Saves and loads "k", returns the KTree and the FlatKTree."""
+        flat.save(k, self.filename)
+        self.assertTrue(flat.is_flat(self.filename))
+        return flat.load(self.filename).to_ktree(), flat.load(self.filename, mmap=True)
+
+    def check_nodes(self, k, loaded):
+        self.assertEqual(loaded.N, k.N)
+        self.assertEqual(loaded.depth, k.depth)
+        self.assertEqual(loaded.N_code_book, k.N_code_book)
+        nodes = [ node for node in k.root.walk() ]
+        loaded_nodes = [ node for node in loaded.root.walk() ]
+        self.assertEqual(len(loaded_nodes), len(nodes))
+        for node, loaded_node in zip(nodes, loaded_nodes):
+            self.assertEqual(len(loaded_node), len(node))
+            if len(node):
+                numpy.testing.assert_array_equal(loaded_node.keys(), node.keys())
+            numpy.testing.assert_array_equal(loaded_node.Ns, node.Ns)
+            numpy.testing.assert_array_equal(loaded_node._radii[:len(node)], node._radii[:len(node)])
+            if node.hold_leafs:
+                numpy.testing.assert_array_equal(loaded_node.values(), node.values())
+
+    def check_queries(self, k, loaded, X, Q):
+        for result, expected in zip(loaded.nearest_neighbors(Q), k.nearest_neighbors(Q)):
+            numpy.testing.assert_array_equal(result, expected)
+        for query in Q:
+            for mode in ("exact", "beam"):
+                for result, expected in zip(loaded.knn(query, 5, mode), k.knn(query, 5, mode)):
+                    numpy.testing.assert_allclose(result, expected)
+
+    def test_round_trip(self):
+        X, Q = data(1000), data(20, seed=1)
+        k = trees.ktree(X, options())
+        loaded, mapped = self.round_trip(k)
+        self.check_nodes(k, loaded)
+        self.check_queries(k, loaded, X, Q)
+        self.check_queries(k, mapped, X, Q)
+        self.assertEqual(mapped.N, k.N)
+        numpy.testing.assert_array_equal(numpy.sort(mapped.ids), numpy.arange(len(X)))
+
+    def test_options(self):
+        k = trees.ktree(data(300), options(order=7, distance="cityblock", weighted=False))
+        loaded, mapped = self.round_trip(k)
+        for name in flat.OPTIONS:
+            self.assertEqual(getattr(loaded.options, name), getattr(k.options, name))
+        self.assertEqual(loaded.model.__class__, k.model.__class__)
+
+    def test_float32(self):
+        X, Q = data(1000), data(20, seed=1)
+        k = trees.ktree(X, options(dtype="float32"))
+        loaded, mapped = self.round_trip(k)
+        self.assertEqual(mapped.prototypes.dtype, numpy.float32)
+        self.assertEqual(mapped.leafs.dtype, numpy.float32)
+        self.check_nodes(k, loaded)
+        self.check_queries(k, mapped, X, Q)
+
+    def test_quantize(self):
+        X, Q = data(1000), data(20, seed=1)
+        k = trees.ktree(X, options(quantize="uint8"))
+        loaded, mapped = self.round_trip(k)
+        self.assertEqual(mapped.leafs.dtype, numpy.uint8)
+        self.check_nodes(k, loaded)
+        self.check_queries(k, mapped, X, Q)
+
+    def test_exact_knn(self):
+        X, Q = data(1000), data(20, seed=1)
+        loaded, mapped = self.round_trip(trees.ktree(X, options()))
+        vectors, ids, distances = mapped.knn(Q[0], 1)
+        self.assertEqual(ids[0], brute_force(X, Q[:1])[0])
+
+    def test_empty_sub_trees(self):
+        # queries never end in empty leaf nodes:
+        X = data(1000)
+        k = trees.ktree(X, options())
+        self.assertTrue(any(node.N == 0 for node in k.root.walk()))
+        Q = numpy.array([ key for node in k.root.walk() if not node.hold_leafs
+                          for key, child in zip(node.keys(), node.values()) if child.N == 0 ])
+        loaded, mapped = self.round_trip(k)
+        vectors, ids, distances = mapped.nearest_neighbors(Q)
+        self.assertTrue(numpy.all(ids >= 0))
+        for query in Q:
+            self.assertEqual(len(mapped.knn(query, 1, "beam", 1)[1]), 1)
+
+    def test_sparse_leafs(self):
+        X = scipy.sparse.random(300, 20, density=0.2, format="csr", random_state=0)
+        k = trees.ktree(X, options(distance="cosine"))
+        self.assertTrue(flat.has_sparse_leafs(k))
+        utils.save_ktree(k, self.filename)
+        self.assertFalse(flat.is_flat(self.filename))
+        loaded = utils.load_ktree(self.filename)
+        self.assertEqual(loaded.N, k.N)
+        for result, expected in zip(loaded.nearest_neighbors(X[:20]), k.nearest_neighbors(X[:20])):
+            if scipy.sparse.issparse(result):
+                result, expected = result.toarray(), expected.toarray()
+            numpy.testing.assert_array_equal(result, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
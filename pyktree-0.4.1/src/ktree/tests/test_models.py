@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the distances and the k-means clusterings of the models, see
+module ktree.models.
+"""
+
+import unittest
+
+import numpy
+import scipy.sparse
+import scipy.spatial.distance
+
+from ktree import models, trees
+from ktree.tests import data, options
+
+
+class DistanceTest(unittest.TestCase):
+    """The distances of the models equal those of scipy."""
+
+    distances = ("euclidean", "sqeuclidean", "cityblock", "cosine")
+
+    def check(self, X, Y, **kwargs):
+        rtol = atol = 1e-4 if "distance_dtype" in kwargs else 1e-9
+        for distance in self.distances:
+            for weighted in (True, False):
+                model = models.model(options(distance=distance, weighted=weighted, **kwargs))
+                expected = scipy.spatial.distance.cdist(X, Y, distance)
+                numpy.testing.assert_allclose(model.distance_matrix(X, Y), expected, 
+                                              rtol=rtol, atol=atol, err_msg=distance)
+                norms = models.sqnorms(Y)
+                numpy.testing.assert_allclose(model.distance_matrix(X, Y, norms), expected, 
+                                              rtol=rtol, atol=atol, err_msg=distance)
+                n = min(len(X), len(Y))
+                numpy.testing.assert_allclose(model.paired_distances(X[:n], Y[:n]), 
+                                              numpy.diag(expected)[:n], rtol=rtol, atol=atol)
+                numpy.testing.assert_allclose(model.distance_function(X[0], Y[0]), expected[0,0], 
+                                              rtol=rtol, atol=atol)
+
+    def test_small(self):
+        # computed directly, see models.SMALL:
+        self.check(data(2), data(5, seed=1))
+
+    def test_large(self):
+        # computed with a matrix product:
+        self.check(data(300), data(200, seed=1))
+
+    def test_float32(self):
+        self.check(data(300), data(200, seed=1), distance_dtype="float32")
+        self.check(data(2), data(5, seed=1), distance_dtype="float32")
+
+    def test_identical(self):
+        # rounding errors must not result in negative distances:
+        X = 1000.0 + data(300)
+        for distance in ("euclidean", "sqeuclidean"):
+            dm = models.model(options(distance=distance)).distance_matrix(X, X)
+            self.assertTrue(numpy.all(dm >= 0))
+            self.assertTrue(numpy.all(numpy.argmin(dm, 1) == numpy.arange(len(X))))
+
+    def test_scratch(self):
+        # results do not share the scratch buffer:
+        model = models.model(options())
+        first = model.distance_matrix(data(300), data(200, seed=1))
+        expected = first.copy()
+        model.distance_matrix(data(300, seed=2), data(200, seed=3))
+        numpy.testing.assert_array_equal(first, expected)
+
+
+class ScalarQuantizerTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        X = data(500)
+        for dtype in models.QUANTIZATIONS:
+            quantizer = models.ScalarQuantizer(dtype, X.min(0), X.max(0))
+            codes = quantizer.encode(X)
+            self.assertEqual(codes.dtype, numpy.dtype(dtype))
+            error = numpy.abs(quantizer.decode(codes) - X)
+            self.assertTrue(numpy.all(error <= quantizer.scale / 2 + 1e-12))
+            # the bounds are exact:
+            numpy.testing.assert_allclose(quantizer.decode(quantizer.encode(X.min(0))), X.min(0))
+            numpy.testing.assert_allclose(quantizer.decode(quantizer.encode(X.max(0))), X.max(0))
+
+    def test_clip(self):
+        quantizer = models.ScalarQuantizer("uint8", numpy.zeros(3), numpy.ones(3))
+        decoded = quantizer.decode(quantizer.encode([ [ -1.0, 0.5, 2.0 ] ]))
+        numpy.testing.assert_allclose(decoded, [ [ 0.0, 0.5, 1.0 ] ], atol=quantizer.scale[1])
+
+    def test_constant_dimension(self):
+        quantizer = models.ScalarQuantizer("int8", [ 0.0, 2.0 ], [ 1.0, 2.0 ])
+        decoded = quantizer.decode(quantizer.encode([ [ 0.25, 2.0 ] ]))
+        self.assertEqual(decoded[0,1], 2.0)
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, models.ScalarQuantizer, "uint16", [ 0.0 ], [ 1.0 ])
+        self.assertRaises(ValueError, models.model, options(quantize="uint8"))
+
+
+def sparse_data(n, d=40, density=0.1, seed=0):
+    """Returns a random (n, d) CSR matrix."""
+    return scipy.sparse.random(n, d, density=density, format="csr", random_state=seed)
+
+
+class SparseTest(unittest.TestCase):
+    """The distances and the clusterings of sparse examples equal those 
+    of the dense examples.
+    """
+
+    distances = ("euclidean", "sqeuclidean", "cosine")
+
+    def test_distance_matrix(self):
+        X, Y = sparse_data(300), sparse_data(200, seed=1)
+        for distance in self.distances:
+            for weighted in (True, False):
+                model = models.model(options(distance=distance, weighted=weighted))
+                expected = model.distance_matrix(X.toarray(), Y.toarray())
+                for A, B in ((X, Y.toarray()), (X.toarray(), Y), (X, Y), (X[:2], Y[:3])):
+                    numpy.testing.assert_allclose(model.distance_matrix(A, B), expected[:A.shape[0],:B.shape[0]],
+                                                  rtol=1e-9, atol=1e-9, err_msg=distance)
+                numpy.testing.assert_allclose(model.paired_distances(X[:200], Y.toarray()), 
+                                              numpy.diag(expected), rtol=1e-9, atol=1e-9)
+                numpy.testing.assert_allclose(model.distance_function(X[0], Y[0]), expected[0,0], 
+                                              rtol=1e-9, atol=1e-9)
+
+    def test_zero_vectors(self):
+        # zero vectors have cosine distance 1 to all vectors:
+        X = sparse_data(5)
+        Z = scipy.sparse.csr_matrix((2, X.shape[1]))
+        dm = models.model(options(distance="cosine")).distance_matrix(Z, X.toarray())
+        numpy.testing.assert_array_equal(dm, 1.0)
+
+    def test_cityblock(self):
+        model = models.model(options(distance="cityblock"))
+        self.assertRaises(TypeError, model.distance_matrix, sparse_data(5), data(5, d=40))
+
+    def test_kmeans(self):
+        X = sparse_data(200)
+        Ns = numpy.arange(1, 201)
+        for distance in self.distances:
+            for weighted in (True, False):
+                centroids, labels = models.model(options(distance=distance, weighted=weighted)).kmeans(X, 3, Ns)
+                expected = models.model(options(distance=distance, weighted=weighted)).kmeans(X.toarray(), 3, Ns)
+                self.assertFalse(scipy.sparse.issparse(centroids))
+                numpy.testing.assert_allclose(centroids, expected[0], rtol=1e-9, atol=1e-12)
+                numpy.testing.assert_array_equal(labels, expected[1])
+
+
+def blobs(n, K, d=8, seed=0):
+    """Returns "n" examples of "K" well separated clusters and their labels."""
+    random = numpy.random.RandomState(seed)
+    labels = numpy.arange(n) % K
+    centers = 10.0 * numpy.eye(K, d)
+    return centers[labels] + random.rand(n, d), labels
+
+
+class KMeansTest(unittest.TestCase):
+
+    def test_clusters(self):
+        X, expected = blobs(300, 3)
+        for distance in ("sqeuclidean", "euclidean", "cityblock", "cosine"):
+            model = models.model(options(distance=distance, weighted=False))
+            centroids, labels = model.kmeans(X, 3)
+            # the clusters are found up to their numbering:
+            self.assertEqual(len(set(zip(labels, expected))), 3, distance)
+            for k in xrange(3):
+                numpy.testing.assert_allclose(centroids[k], 
+                                              model.centroid_function(X[labels == k]))
+
+    def test_converged(self):
+        # the assignments of the result are those of its centroids:
+        X, expected = blobs(500, 5)
+        model = models.model(options())
+        centroids, labels = model.kmeans(X, 5)
+        numpy.testing.assert_array_equal(labels, numpy.argmin(model.distance_matrix(X, centroids), 1))
+
+    def test_weighted(self):
+        X = data(200)
+        Ns = numpy.random.RandomState(3).randint(1, 10, len(X))
+        model = models.model(options())
+        centroids, labels = model.kmeans(X, 4, Ns)
+        for k in xrange(4):
+            members = labels == k
+            numpy.testing.assert_allclose(centroids[k], numpy.average(X[members], 0, Ns[members]))
+
+    def test_non_empty(self):
+        # duplicates must not leave clusters empty:
+        X = numpy.repeat(data(3), [ 20, 1, 1 ], 0)
+        for seed in xrange(10):
+            model = models.model(options(seed=seed))
+            centroids, labels = model.kmeans(X, 3)
+            numpy.testing.assert_array_equal(numpy.sort(numpy.bincount(labels, minlength=3)), [ 1, 1, 20 ])
+
+    def test_seed(self):
+        # k-means++ chooses distinct rows:
+        X = numpy.repeat(data(5), 10, 0)
+        model = models.model(options())
+        for K in xrange(1, 6):
+            seeds = model._seed(X, K, numpy.ones(len(X)))
+            self.assertEqual(len(set(map(tuple, seeds))), K)
+
+
+def nodes(k):
+    """Returns the keys and the row IDs of KTree "k" in walk order."""
+    return [ (node.keys(), node.values() if node.hold_leafs else None) for node in k.root.walk() ]
+
+
+class SeedTest(unittest.TestCase):
+    """K-Trees built with the same seed are identical."""
+
+    def check(self, **kwargs):
+        X = data(1000)
+        first = nodes(trees.ktree(X, options(**kwargs)))
+        second = nodes(trees.ktree(X, options(**kwargs)))
+        self.assertEqual(len(first), len(second))
+        for (keys1, ids1), (keys2, ids2) in zip(first, second):
+            numpy.testing.assert_array_equal(keys1, keys2)
+            numpy.testing.assert_array_equal(ids1, ids2)
+
+    def test_insert(self):
+        self.check(reinsert=False)
+
+    def test_reinsert(self):
+        self.check()
+
+    def test_bulk(self):
+        self.check(bulk=True)
+
+    def test_seeds_differ(self):
+        X = data(1000)
+        first = trees.ktree(X, options(seed=1, bulk=True, reinsert=False))
+        second = trees.ktree(X, options(seed=2, bulk=True, reinsert=False))
+        self.assertFalse(numpy.array_equal(first.root.keys(), second.root.keys()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the instrumentation of K-Tree builds, see module ktree.profiler."""
+
+import copy
+import json
+import unittest
+
+import numpy
+
+from ktree import profiler, trees
+from ktree.tests import data, options
+
+
+class StatsTest(unittest.TestCase):
+
+    def test_unprofiled(self):
+        k = trees.ktree(data(500), options())
+        stats = k.stats()
+        self.assertEqual(stats["counters"], {})
+        self.assertEqual(stats["timers"], {})
+        self.assertEqual(stats["N"], 500)
+        self.assertEqual(len(stats["fill"]), k.depth + 1)
+        for level, fill in enumerate(stats["fill"]):
+            lengths = [ len(node) for node in k.root.walk() if node.depth == level ]
+            self.assertEqual(fill, numpy.bincount(lengths, minlength=k.order+1).tolist())
+        # the statistics can be written as JSON:
+        json.dumps(stats)
+
+    def test_same_tree(self):
+        # the instrumentation does not change the K-Tree:
+        X = data(500)
+        first, second = trees.ktree(X, options()), trees.ktree(X, options(profile=True))
+        for a, b in zip(first.root.walk(), second.root.walk()):
+            numpy.testing.assert_array_equal(a.keys(), b.keys())
+
+    def test_splits(self):
+        # each split adds a node, each root split a level and a root:
+        X = data(1000)
+        k = trees.ktree(X, options(profile=True, reinsert=False))
+        stats = k.stats()
+        counters = stats["counters"]
+        nodes = sum(1 for node in k.root.walk())
+        self.assertEqual(sum(counters["root_splits"]), k.depth)
+        self.assertEqual(nodes, 1 + sum(counters["splits"]) + sum(counters["root_splits"]))
+        self.assertEqual(stats["timers"]["insert"]["calls"], len(X))
+        self.assertEqual(stats["timers"]["split"]["calls"], sum(counters["splits"]))
+        self.assertEqual(stats["timers"]["build"]["calls"], 1)
+        self.assertFalse("reinsert" in stats["timers"])
+        json.dumps(stats)
+
+    def test_reinsert(self):
+        X = data(500)
+        stats = trees.ktree(X, options(profile=True)).stats()
+        self.assertEqual(stats["timers"]["insert"]["calls"], 2 * len(X))
+        self.assertEqual(stats["timers"]["reinsert"]["calls"], 1)
+
+    def test_distances(self):
+        # an insert evaluates the distances to the keys of each node on
+        # its path and two more to update the covering radius:
+        X = data(1000)
+        k = trees.ktree(X, options(profile=True, reinsert=False))
+        before = copy.deepcopy(k.stats()["counters"]["distances"])
+        query = data(1, seed=1)[0]
+        expected = [ 0 ] * len(before)
+        node = k.root
+        while not node.hold_leafs:
+            expected[node.depth] += len(node) + 2
+            dm = numpy.sum((node.keys() - query) ** 2, 1)
+            node = node.values()[numpy.argmin(dm)]
+        k.insert(query, split=False)
+        after = k.stats()["counters"]["distances"]
+        self.assertEqual([ b - a for a, b in zip(before, after) ], expected)
+
+    def test_parallel(self):
+        # the counters of the shards are added:
+        X = data(1000)
+        stats = trees.ktree(X, options(profile=True, jobs=2, reinsert=False)).stats()
+        self.assertEqual(stats["timers"]["insert"]["calls"], len(X))
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_update(self):
+        first, second = profiler.Profiler(), profiler.Profiler()
+        first.count("splits", 0)
+        first.count("splits", 2, 3)
+        second.count("splits", 1, 2)
+        second.count("distances", 0, 5)
+        first.stop("insert", profiler.clock())
+        second.stop("insert", profiler.clock())
+        first.update(second)
+        stats = first.stats()
+        self.assertEqual(stats["counters"], { "splits": [ 1, 2, 3 ], "distances": [ 5 ] })
+        self.assertEqual(stats["timers"]["insert"]["calls"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the nearest neighbor searches of KTree."""
+
+import unittest
+
+import numpy
+import scipy.sparse
+import scipy.spatial.distance
+
+from ktree import trees
+from ktree.tests import data, options
+
+
+def descend(k, query):
+    """Returns the row ID of the leaf that a greedy descent of KTree "k"
+    finds for "query", computed by brute force in each node.  Empty
+    sub-trees are skipped.
+    """
+    node = k.root
+    while True:
+        dm = scipy.spatial.distance.cdist(query[None,:], node.keys(), "sqeuclidean")[0]
+        if not node.hold_leafs:
+            dm[node.Ns == 0] = numpy.inf
+        i = numpy.argmin(dm)
+        if node.hold_leafs:
+            return node.values()[i]
+        node = node.values()[i]
+
+
+class NearestNeighborsTest(unittest.TestCase):
+
+    def check(self, k, X, Q, deleted=()):
+        vectors, ids, distances = k.nearest_neighbors(Q)
+        self.assertTrue(numpy.all(ids >= 0))
+        self.assertFalse(set(ids) & set(deleted))
+        numpy.testing.assert_array_equal(ids, [ descend(k, q) for q in Q ])
+        numpy.testing.assert_allclose(vectors, X[ids])
+        numpy.testing.assert_allclose(distances, numpy.sum((Q - X[ids])**2, 1))
+
+    def test_after_ktree(self):
+        X = data(2000)
+        Q = data(500, seed=1)
+        k = trees.ktree(X, options())
+        self.assertTrue(any(len(node) == 0 for node in k.root.walk()))
+        self.check(k, X, Q)
+
+    def test_after_delete(self):
+        X = data(2000)
+        Q = data(500, seed=1)
+        k = trees.ktree(X, options())
+        deleted = range(0, len(X), 3)
+        for i in deleted:
+            k.delete(i, X[i])
+        self.assertEqual(k.N, len(X) - len(deleted))
+        self.check(k, X, Q, deleted)
+
+    def test_single_query(self):
+        X = data(300)
+        k = trees.ktree(X, options())
+        self.assertEqual(k.nearest_neighbor(X[7], return_id=True), descend(k, X[7]))
+
+
+class RowIdTest(unittest.TestCase):
+    """The leafs carry the row IDs of their examples."""
+
+    def check(self, k, X):
+        for node in k.root.walk():
+            if node.hold_leafs and len(node):
+                numpy.testing.assert_array_equal(node.keys(), X[node.values()])
+
+    def test_builds(self):
+        X = data(1000)
+        for o in (options(), options(reinsert=False), options(bulk=True), options(jobs=2)):
+            self.check(trees.ktree(X, o), X)
+
+    def test_insert(self):
+        X = data(200)
+        k = trees.KTree(options())
+        row_ids = numpy.arange(len(X)) * 7 + 3
+        for row_id, x in zip(row_ids, X):
+            k.insert(x, row_id=row_id)
+        for row_id, x in zip(row_ids, X):
+            self.assertEqual(k.knn(x, 1)[1][0], row_id)
+        # the greedy descent returns the row ID of the leaf it finds:
+        vectors, ids, distances = k.nearest_neighbors(X)
+        numpy.testing.assert_array_equal(vectors, X[(ids - 3) // 7])
+        vector = k.nearest_neighbor(X[5])
+        numpy.testing.assert_array_equal(vector, X[(k.nearest_neighbor(X[5], return_id=True) - 3) // 7])
+
+    def test_unknown_row_id(self):
+        k = trees.KTree(options())
+        for x in data(20):
+            k.insert(x)
+        vectors, ids, distances = k.nearest_neighbors(data(20))
+        self.assertTrue(numpy.all(ids == -1))
+
+
+class KnnTest(unittest.TestCase):
+    """The exact k nearest neighbor search equals brute force."""
+
+    def check(self, k, X, Q, n, ids=None):
+        if ids is None:
+            ids = numpy.arange(len(X))
+        dm = scipy.spatial.distance.cdist(Q, X[ids], k.options.distance)
+        for query, distances in zip(Q, dm):
+            vectors, found, found_distances = k.knn(query, n)
+            nearest = numpy.argsort(distances, kind="mergesort")[:n]
+            numpy.testing.assert_array_equal(found, ids[nearest])
+            numpy.testing.assert_allclose(vectors, X[found])
+            numpy.testing.assert_allclose(found_distances, distances[nearest], atol=1e-12)
+
+    def test_sqeuclidean(self):
+        X, Q = data(1500), data(20, seed=1)
+        k = trees.ktree(X, options())
+        for n in (1, 5, 20):
+            self.check(k, X, Q, n)
+
+    def test_distances(self):
+        X, Q = data(1000), data(10, seed=1)
+        for distance in ("euclidean", "cityblock", "cosine"):
+            k = trees.ktree(X, options(distance=distance))
+            self.check(k, X, Q, 5)
+
+    def test_unweighted(self):
+        X, Q = data(1000), data(10, seed=1)
+        self.check(trees.ktree(X, options(weighted=False)), X, Q, 5)
+
+    def test_bulk(self):
+        X, Q = data(1000), data(10, seed=1)
+        self.check(trees.ktree(X, options(bulk=True, reinsert=False)), X, Q, 5)
+
+    def test_after_delete(self):
+        X, Q = data(1000), data(10, seed=1)
+        k = trees.ktree(X, options())
+        for i in xrange(0, len(X), 2):
+            k.delete(i, X[i])
+        self.check(k, X, Q, 5, numpy.arange(1, len(X), 2))
+
+    def test_more_than_leafs(self):
+        X = data(7)
+        vectors, ids, distances = trees.ktree(X, options()).knn(X[0], 10)
+        numpy.testing.assert_array_equal(numpy.sort(ids), numpy.arange(7))
+
+    def test_beam(self):
+        X, Q = data(1000), data(10, seed=1)
+        k = trees.ktree(X, options())
+        for query in Q:
+            vectors, ids, distances = k.knn(query, 5, mode="beam", beam_width=3)
+            self.assertTrue(0 < len(ids) <= 5)
+            self.assertTrue(numpy.all(numpy.diff(distances) >= 0))
+            numpy.testing.assert_allclose(distances, numpy.sum((X[ids] - query)**2, 1))
+            # a beam as wide as the K-Tree is an exact search:
+            vectors, ids, distances = k.knn(query, 5, mode="beam", beam_width=len(X))
+            numpy.testing.assert_array_equal(ids, k.knn(query, 5)[1])
+        self.assertRaises(ValueError, k.knn, Q[0], 5, "unknown")
+
+    def test_beam_skips_empty_nodes(self):
+        X = data(1000)
+        k = trees.ktree(X, options())
+        # the keys of empty sub-trees are the nearest keys of these queries:
+        Q = [ key for node in k.root.walk() if not node.hold_leafs
+              for key, child in zip(node.keys(), node.values()) if child.N == 0 ]
+        self.assertTrue(Q)
+        for query in Q:
+            vectors, ids, distances = k.knn(query, 1, mode="beam", beam_width=1)
+            self.assertEqual(len(ids), 1)
+
+class SparseTest(unittest.TestCase):
+    """K-Trees of sparse examples equal those of the dense examples."""
+
+    def setUp(self):
+        self.X = scipy.sparse.random(800, 40, density=0.1, format="csr", random_state=0)
+        self.Q = scipy.sparse.random(30, 40, density=0.1, format="csr", random_state=1)
+
+    def test_leafs(self):
+        k = trees.ktree(self.X, options(distance="cosine"))
+        self.assertEqual(k.N, self.X.shape[0])
+        for node in k.root.walk():
+            if node.hold_leafs and len(node):
+                keys = node.keys()
+                self.assertTrue(scipy.sparse.issparse(keys))
+                self.assertEqual((keys != self.X[node.values()]).nnz, 0)
+
+    def test_dense(self):
+        for distance in ("cosine", "sqeuclidean"):
+            sparse = trees.ktree(self.X, options(distance=distance))
+            dense = trees.ktree(self.X.toarray(), options(distance=distance))
+            self.assertEqual(sparse.depth, dense.depth)
+            numpy.testing.assert_allclose(sparse.root.keys(), dense.root.keys(), rtol=1e-9, atol=1e-12)
+            vectors, ids, distances = sparse.nearest_neighbors(self.Q)
+            expected = dense.nearest_neighbors(self.Q.toarray())
+            self.assertTrue(scipy.sparse.issparse(vectors))
+            numpy.testing.assert_array_equal(ids, expected[1])
+            numpy.testing.assert_allclose(vectors.toarray(), expected[0])
+            numpy.testing.assert_allclose(distances, expected[2], rtol=1e-9, atol=1e-12)
+
+    def test_knn(self):
+        k = trees.ktree(self.X, options(distance="cosine"))
+        X = self.X.toarray()
+        dm = scipy.spatial.distance.cdist(self.Q.toarray(), X, "cosine")
+        for query, distances in zip(self.Q, dm):
+            vectors, found, found_distances = k.knn(query, 5)
+            # sparse examples of the same direction tie:
+            nearest = numpy.sort(distances)[:5]
+            numpy.testing.assert_allclose(found_distances, nearest, atol=1e-12)
+            numpy.testing.assert_allclose(distances[found], nearest, atol=1e-12)
+            numpy.testing.assert_allclose(vectors.toarray(), X[found])
+
+
+class CodebookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.X = data(2000)
+        self.Q = data(300, seed=1)
+        self.k = trees.ktree(self.X, options())
+
+    def test_codebook(self):
+        k = self.k
+        prototypes, weights = k.codebook(0)
+        self.assertEqual(len(prototypes), len(self.X))
+        self.assertEqual(weights.sum(), len(self.X))
+        prototypes, weights = k.codebook(k.depth)
+        numpy.testing.assert_allclose(prototypes, k.root.keys())
+        numpy.testing.assert_array_equal(weights, k.root.Ns)
+        self.assertRaises(ValueError, k.codebook, k.depth + 1)
+
+    def test_predict_leafs(self):
+        prototypes, weights = self.k.codebook(0)
+        labels = self.k.predict(self.Q, level=0)
+        vectors, ids, distances = self.k.nearest_neighbors(self.Q)
+        numpy.testing.assert_allclose(prototypes[labels], vectors)
+
+    def test_predict(self):
+        k = self.k
+        prototypes, weights = k.codebook(1)
+        labels = k.predict(self.Q, level=1)
+        self.assertTrue(numpy.all(labels >= 0))
+        self.assertTrue(numpy.all(weights[labels] > 0))
+        # the nearest prototype of the node that the greedy descent ends in:
+        ids = [ descend(k, q) for q in self.Q ]
+        for label, i in zip(labels, ids):
+            node = self.leaf_node(i)
+            j = list(node.parent.values()).index(node)
+            numpy.testing.assert_allclose(prototypes[label], node.parent.keys()[j])
+
+    def test_encode(self):
+        k = self.k
+        codes = k.encode(self.Q)
+        self.assertEqual(codes.shape, (len(self.Q), k.depth + 1))
+        self.assertTrue(numpy.all(codes >= 0))
+        vectors, ids, distances = k.nearest_neighbors(self.Q)
+        for code, i in zip(codes, ids):
+            node = k.root
+            for j in code[:-1]:
+                node = node.values()[j]
+            self.assertEqual(node.values()[code[-1]], i)
+
+    def leaf_node(self, row_id):
+        for node in self.k.root.walk():
+            if node.hold_leafs and row_id in node.values():
+                return node
+
+
+if __name__ == "__main__":
+    unittest.main()
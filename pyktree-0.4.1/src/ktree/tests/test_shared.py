@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the snapshots of shared K-Trees, see module ktree.shared."""
+
+import pickle
+import threading
+import unittest
+
+import numpy
+
+from ktree import shared, trees
+from ktree.tests import data, options, leafs
+
+
+def content(k):
+    """Returns a copy of the keys, the row IDs and the number of leafs 
+    of the nodes of "k".
+    """
+    return [ (numpy.array(node.keys()), numpy.array(node.values()) if node.hold_leafs else None, 
+              int(node.N)) for node in k.root.walk() ]
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.X = data(1500)
+        self.k = shared.SharedKTree(trees.ktree(self.X[:1000], options()), threads=2)
+
+    def tearDown(self):
+        self.k.close()
+
+    def assertContent(self, first, second):
+        self.assertEqual(len(first), len(second))
+        for (keys1, values1, N1), (keys2, values2, N2) in zip(first, second):
+            numpy.testing.assert_array_equal(keys1, keys2)
+            numpy.testing.assert_array_equal(values1, values2)
+            self.assertEqual(N1, N2)
+
+    def test_insert(self):
+        snapshot = self.k.snapshot()
+        before = content(snapshot)
+        for i in xrange(1000, 1500):
+            self.k.insert(self.X[i], row_id=i)
+        # the old snapshot is unchanged, the new one holds all leafs:
+        self.assertContent(content(snapshot), before)
+        numpy.testing.assert_array_equal(leafs(snapshot), numpy.arange(1000))
+        numpy.testing.assert_array_equal(leafs(self.k.snapshot()), numpy.arange(1500))
+
+    def test_insert_many(self):
+        snapshot = self.k.snapshot()
+        before = content(snapshot)
+        self.k.insert_many(self.X[1000:], numpy.arange(1000, 1500))
+        self.assertContent(content(snapshot), before)
+        numpy.testing.assert_array_equal(leafs(self.k.snapshot()), numpy.arange(1500))
+
+    def test_delete(self):
+        snapshot = self.k.snapshot()
+        before = content(snapshot)
+        for i in xrange(0, 1000, 2):
+            self.k.delete(i, self.X[i])
+        self.assertContent(content(snapshot), before)
+        numpy.testing.assert_array_equal(leafs(self.k.snapshot()), numpy.arange(1, 1000, 2))
+
+    def test_same_tree(self):
+        # copy-on-write results in the tree of a KTree:
+        k = trees.KTree(options())
+        s = shared.SharedKTree(options=options())
+        for i, x in enumerate(self.X):
+            k.insert(x, row_id=i)
+            s.insert(x, row_id=i)
+        self.assertContent(content(s.snapshot()), content(k))
+
+    def test_read_only(self):
+        snapshot = self.k.snapshot()
+        self.assertRaises(TypeError, snapshot.insert, self.X[0])
+        self.assertRaises(TypeError, snapshot.delete, 0)
+        self.assertRaises(TypeError, self.k.merge, [])
+        self.assertRaises(TypeError, self.k.remove_leafs)
+
+    def test_queries(self):
+        Q = data(300, seed=1)
+        snapshot = self.k.snapshot()
+        expected = snapshot.nearest_neighbors(Q)
+        for result, other in zip(self.k.map_nearest_neighbors(Q, batch_size=50), expected):
+            numpy.testing.assert_array_equal(result, other)
+        for result, query in zip(self.k.map_knn(Q[:20], 3), Q[:20]):
+            numpy.testing.assert_array_equal(result[1], snapshot.knn(query, 3)[1])
+
+    def test_pickle(self):
+        k = pickle.loads(pickle.dumps(self.k))
+        self.assertContent(content(k.snapshot()), content(self.k.snapshot()))
+        k.insert(self.X[1000], row_id=1000)
+        self.assertEqual(k.N, 1001)
+        self.assertEqual(self.k.N, 1000)
+
+    def test_concurrent(self):
+        # queries while the writer inserts see consistent snapshots:
+        errors = []
+        done = threading.Event()
+        Q = data(50, seed=1)
+
+        def write():
+            try:
+                for i in xrange(1000, 1500):
+                    self.k.insert(self.X[i], row_id=i)
+                for i in xrange(0, 200):
+                    self.k.delete(i, self.X[i])
+            except Exception, e:
+                errors.append(e)
+            finally:
+                done.set()
+
+        def read():
+            try:
+                while not done.is_set():
+                    snapshot = self.k.snapshot()
+                    ids = leafs(snapshot)
+                    self.assertEqual(len(ids), snapshot.N)
+                    vectors, found, distances = snapshot.nearest_neighbors(Q)
+                    self.assertTrue(set(found) <= set(ids))
+                    numpy.testing.assert_array_equal(vectors, self.X[found])
+            except Exception, e:
+                errors.append(e)
+
+        threads = [ threading.Thread(target=write) ] + [ threading.Thread(target=read) for i in xrange(3) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        numpy.testing.assert_array_equal(leafs(self.k.snapshot()), numpy.arange(200, 1500))
+
+
+if __name__ == "__main__":
+    unittest.main()
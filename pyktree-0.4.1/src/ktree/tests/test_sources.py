@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the chunked data sets, see module ktree.sources."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import scipy.sparse
+
+from ktree import sources, trees
+from ktree.tests import data, options, leafs
+
+
+class SourcesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.X = data(1000, 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def check(self, source, chunk_size):
+        # a source can be iterated more than once:
+        for i in xrange(2):
+            chunks = list(source)
+            self.assertEqual([ len(chunk) for chunk in chunks ][:-1], 
+                             [ chunk_size ] * (len(chunks) - 1))
+            self.assertTrue(0 < len(chunks[-1]) <= chunk_size)
+            numpy.testing.assert_allclose(numpy.concatenate(chunks), self.X)
+        numpy.testing.assert_allclose(source.read(), self.X)
+
+    def test_array(self):
+        self.check(sources.chunks(self.X, 300), 300)
+        source = sources.ArraySource(self.X)
+        self.assertTrue(sources.chunks(source) is source)
+
+    def test_npy(self):
+        numpy.save(self.path("data.npy"), self.X)
+        source = sources.open_source(self.path("data.npy"), 300)
+        self.assertTrue(isinstance(source, sources.NpySource))
+        self.check(source, 300)
+
+    def test_text(self):
+        f = open(self.path("data.txt"), "w")
+        f.write("# a comment\n\n")
+        for row in self.X:
+            f.write(" ".join(repr(float(x)) for x in row) + "  # comment\n")
+        f.close()
+        source = sources.open_source(self.path("data.txt"), 300)
+        self.assertTrue(isinstance(source, sources.TextSource))
+        self.check(source, 300)
+
+    def test_text_rows_of_different_length(self):
+        f = open(self.path("data.txt"), "w")
+        f.write("1 2 3\n4 5\n")
+        f.close()
+        self.assertRaises(ValueError, list, sources.TextSource(self.path("data.txt")))
+
+    def test_npz(self):
+        X = scipy.sparse.random(100, 20, density=0.1, format="csr", random_state=0)
+        scipy.sparse.save_npz(self.path("data.npz"), X)
+        chunks = list(sources.open_source(self.path("data.npz"), 30))
+        self.assertTrue(all(scipy.sparse.issparse(chunk) for chunk in chunks))
+        self.assertEqual(abs(scipy.sparse.vstack(chunks) - X).sum(), 0)
+
+    def test_hdf5(self):
+        if sources.h5py is None:
+            self.assertRaises(ImportError, sources.HDF5Source, self.path("data.h5"))
+            return
+        f = sources.h5py.File(self.path("data.h5"), "w")
+        f.create_dataset("examples", data=self.X)
+        f.close()
+        self.check(sources.open_source(self.path("data.h5"), 300), 300)
+
+    def test_chunk_size(self):
+        self.assertRaises(ValueError, sources.ArraySource, self.X, 0)
+
+    def test_split(self):
+        parts = sources.split(self.X, 3)
+        self.assertEqual([ len(part) for part in parts ], [ 334, 333, 333 ])
+        numpy.testing.assert_array_equal(numpy.concatenate(parts), self.X)
+
+    def test_ranges(self):
+        low, high = sources.ranges(sources.ArraySource(self.X, 300))
+        numpy.testing.assert_array_equal(low, self.X.min(0))
+        numpy.testing.assert_array_equal(high, self.X.max(0))
+
+    def test_ktree(self):
+        # a K-Tree of a source equals the K-Tree of its data in memory:
+        numpy.save(self.path("data.npy"), self.X)
+        for o in (options(), options(reinsert=False), options(bulk=True)):
+            k = trees.ktree(sources.open_source(self.path("data.npy"), 300), o)
+            expected = trees.ktree(self.X, o)
+            numpy.testing.assert_array_equal(leafs(k), numpy.arange(len(self.X)))
+            for node, expected_node in zip(k.root.walk(), expected.root.walk()):
+                self.assertEqual(len(node), len(expected_node))
+                numpy.testing.assert_array_equal(node.Ns, expected_node.Ns)
+                if len(node):
+                    numpy.testing.assert_array_equal(node.keys(), expected_node.keys())
+                if node.hold_leafs:
+                    numpy.testing.assert_array_equal(node.values(), expected_node.values())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+
+"""Tests of the K-Tree builds, see module ktree.trees."""
+
+import unittest
+
+import numpy
+
+from ktree import models, sources, trees
+from ktree.tests import data, options, leafs
+
+
+class NodeFillTest(unittest.TestCase):
+    """No node may hold more than "order" items after a build."""
+
+    def check(self, k, n):
+        order = k.options.order
+        for node in k.root.walk():
+            self.assertTrue(len(node) <= order, "node with %i > %i items" % (len(node), order))
+        self.assertEqual(k.N, n)
+        numpy.testing.assert_array_equal(leafs(k), numpy.arange(n))
+
+    def test_insert(self):
+        X = data(1500)
+        self.check(trees.ktree(X, options(reinsert=False)), len(X))
+
+    def test_reinsert(self):
+        X = data(1500)
+        self.check(trees.ktree(X, options(reinsert=True)), len(X))
+
+    def test_parallel(self):
+        X = data(1500)
+        self.check(trees.ktree(X, options(jobs=2, reinsert=False)), len(X))
+
+    def test_parallel_reinsert(self):
+        X = data(1500)
+        self.check(trees.ktree(X, options(jobs=2, reinsert=True)), len(X))
+
+    def test_parallel_source(self):
+        # each chunk of a source is a shard:
+        X = data(1300)
+        k = trees.ktree(sources.ArraySource(X, 300), options(jobs=3, reinsert=False))
+        self.check(k, len(X))
+        for node in k.root.walk():
+            if node.hold_leafs and len(node):
+                numpy.testing.assert_array_equal(node.keys(), X[node.values()])
+
+    def test_bulk(self):
+        X = data(1500)
+        self.check(trees.ktree(X, options(bulk=True, reinsert=False)), len(X))
+
+    def test_bulk_reinsert(self):
+        X = data(1500)
+        self.check(trees.ktree(X, options(bulk=True)), len(X))
+
+    def test_keys_are_centroids(self):
+        X = data(500)
+        k = trees.ktree(X, options())
+        for node in k.root.walk():
+            if node.hold_leafs:
+                continue
+            for key, child in zip(node.keys(), node.values()):
+                if child.N > 0:
+                    numpy.testing.assert_allclose(key, child.centroid())
+
+
+class BulkLoadTest(unittest.TestCase):
+
+    def test_height(self):
+        # the height is the minimal one for the order:
+        for n in (1, 5, 6, 25, 26, 700):
+            k = trees.ktree(data(n), options(bulk=True, reinsert=False))
+            self.assertEqual(k.N, n)
+            self.assertTrue(5 ** (k.depth + 1) >= n)
+            self.assertTrue(k.depth == 0 or 5 ** k.depth < n)
+
+    def test_leafs(self):
+        X = data(1000)
+        k = trees.ktree(X, options(bulk=True, reinsert=False))
+        for node in k.root.walk():
+            if node.hold_leafs and len(node):
+                numpy.testing.assert_array_equal(node.keys(), X[node.values()])
+
+    def test_sub_trees(self):
+        X = data(1000)
+        nodes = [ node for node in trees.ktree(X, options(reinsert=False)).root.walk() 
+                  if node.hold_leafs and len(node) ]
+        k = trees.KTree(options())
+        k.bulk_load(numpy.array([ node.centroid() for node in nodes ]), nodes)
+        self.assertEqual(k.N, len(X))
+        numpy.testing.assert_array_equal(leafs(k), numpy.arange(len(X)))
+        leaf_nodes = [ node for node in k.root.walk() if node.hold_leafs ]
+        self.assertEqual(set(map(id, leaf_nodes)), set(map(id, nodes)))
+
+
+def leaf_vectors(node):
+    """Returns the leafs of the (sub)tree of "node", one leaf per row."""
+    if node.hold_leafs:
+        return numpy.asarray(node.keys(), dtype=float)
+    return numpy.concatenate([ leaf_vectors(child) for child in node.values() if child.N ])
+
+
+class CentroidTest(unittest.TestCase):
+    """The incrementally updated keys of the inner nodes are the 
+    centroids of their sub-nodes, computed from scratch.
+    """
+
+    def check(self, k):
+        for node in k.root.walk():
+            if node.hold_leafs:
+                continue
+            for key, child in zip(node.keys(), node.values()):
+                if child.N == 0:
+                    continue
+                if k.options.weighted:
+                    # the weighted mean of the keys is the mean of the leafs:
+                    expected = numpy.mean(leaf_vectors(child), 0)
+                else:
+                    expected = numpy.mean(child.keys(), 0)
+                numpy.testing.assert_allclose(key, expected, rtol=1e-9, atol=1e-12)
+
+    def test_weighted(self):
+        self.check(trees.ktree(data(1000), options(reinsert=False)))
+
+    def test_weighted_reinsert(self):
+        self.check(trees.ktree(data(1000), options()))
+
+    def test_unweighted(self):
+        self.check(trees.ktree(data(1000), options(weighted=False, reinsert=False)))
+
+    def test_euclidean(self):
+        self.check(trees.ktree(data(1000), options(distance="euclidean", reinsert=False)))
+
+    def test_parallel_reinsert(self):
+        X = data(1000)
+        k = trees.ktree(X, options(reinsert=False))
+        k.remove_leafs()
+        k.parallel_reinsert(X, 2)
+        numpy.testing.assert_array_equal(leafs(k), numpy.arange(len(X)))
+        self.check(k)
+
+    def test_running_sums(self):
+        k = trees.ktree(data(1000), options())
+        for node in k.root.walk():
+            if len(node):
+                expected = models.wsum(node._weight(node.Ns), node.keys())
+                numpy.testing.assert_allclose(node._sum, expected, rtol=1e-9, atol=1e-12)
+
+
+def statistics(node):
+    """Returns the number of leafs, the number of non-empty nodes that 
+    hold leafs and the depth of the (sub)tree of "node", computed from 
+    scratch.
+    """
+    if not any(isinstance(value, trees.KNode) for value in node.values()):
+        return len(node), int(len(node) > 0), 0
+    children = [ statistics(child) for child in node.values() ]
+    depths = set(depth for N, ncb, depth in children)
+    assert len(depths) == 1, "unbalanced node"
+    return sum(N for N, ncb, depth in children), sum(ncb for N, ncb, depth in children), depths.pop() + 1
+
+
+class StatisticsTest(unittest.TestCase):
+    """The cached statistics of the nodes equal the recomputed ones."""
+
+    def check(self, k):
+        for node in k.root.walk():
+            N, ncb, depth = statistics(node)
+            self.assertEqual(node.N, N)
+            self.assertEqual(node.N_code_book, ncb)
+            self.assertEqual(node.depth, depth)
+            self.assertEqual(node.hold_leafs, depth == 0)
+            if not node.hold_leafs:
+                numpy.testing.assert_array_equal(node.Ns, [ child.N for child in node.values() ])
+                for child in node.values():
+                    self.assertTrue(child.parent is node)
+        self.assertTrue(k.root.parent is k)
+        self.assertEqual(k.N, statistics(k.root)[0])
+
+    def test_insert(self):
+        self.check(trees.ktree(data(1000), options(reinsert=False)))
+
+    def test_reinsert(self):
+        self.check(trees.ktree(data(1000), options()))
+
+    def test_bulk(self):
+        self.check(trees.ktree(data(1000), options(bulk=True, reinsert=False)))
+
+    def test_parallel(self):
+        self.check(trees.ktree(data(1000), options(jobs=2)))
+
+    def test_delete(self):
+        X = data(1000)
+        k = trees.ktree(X, options())
+        for i in xrange(0, len(X), 3):
+            k.delete(i, X[i])
+        self.check(k)
+
+    def test_merge(self):
+        X = data(1000)
+        shards = [ trees.ktree(part, options(reinsert=False)) for part in sources.split(X, 3) ]
+        N_code_book = sum(shard.N_code_book for shard in shards)
+        k = trees.KTree(options())
+        k.merge(shards)
+        self.assertEqual(k.N_code_book, N_code_book)
+        self.check(k)
+
+
+class DeleteTest(unittest.TestCase):
+    """The leafs of a K-Tree after deletions are the remaining examples."""
+
+    def check(self, k, remaining):
+        order = k.options.order
+        for node in k.root.walk():
+            self.assertTrue(len(node) <= order)
+            if node.hold_leafs and len(node):
+                numpy.testing.assert_array_equal(node.keys(), self.X[node.values()])
+        self.assertEqual(k.N, len(remaining))
+        numpy.testing.assert_array_equal(leafs(k), numpy.sort(remaining))
+
+    def setUp(self):
+        self.X = data(600)
+
+    def test_delete(self):
+        k = trees.ktree(self.X, options())
+        deleted = numpy.arange(0, len(self.X), 3)
+        for i in deleted:
+            k.delete(i, self.X[i])
+        self.check(k, numpy.setdiff1d(numpy.arange(len(self.X)), deleted))
+
+    def test_delete_without_value(self):
+        k = trees.ktree(self.X, options())
+        deleted = numpy.arange(1, len(self.X), 2)
+        for i in deleted:
+            k.delete(i)
+        self.check(k, numpy.setdiff1d(numpy.arange(len(self.X)), deleted))
+
+    def test_delete_all(self):
+        k = trees.ktree(self.X, options())
+        for i in numpy.random.RandomState(2).permutation(len(self.X)):
+            k.delete(i, self.X[i])
+        self.check(k, [])
+        k.insert(self.X[7], row_id=7)
+        self.check(k, [ 7 ])
+
+    def test_unknown_row_id(self):
+        k = trees.ktree(self.X, options())
+        self.assertRaises(KeyError, k.delete, len(self.X))
+        self.assertRaises(KeyError, k.delete, len(self.X), self.X[0])
+        k.delete(0)
+        self.assertRaises(KeyError, k.delete, 0)
+
+    def test_window(self):
+        k = trees.KTree(options(window=100))
+        for i, x in enumerate(self.X):
+            k.insert(x, row_id=i)
+            if i % 50 == 0:
+                self.check(k, numpy.arange(max(0, i - 99), i + 1))
+        self.check(k, numpy.arange(len(self.X) - 100, len(self.X)))
+
+
+class QualityTest(unittest.TestCase):
+    """The quality of the code books equals the one computed by brute 
+    force, i.e. from the leafs of each sub-tree.
+    """
+
+    def check(self, k):
+        quality = k.quality()
+        self.assertEqual(len(quality["levels"]), k.depth + 1)
+        self.assertEqual(quality["N"], k.N)
+        for level, result in enumerate(quality["levels"]):
+            nodes = [ node for node in k.root.walk() if node.depth == level ]
+            lengths = [ len(node) for node in nodes ]
+            self.assertEqual(result["fill"]["histogram"], numpy.bincount(lengths, minlength=k.order+1).tolist())
+            self.assertAlmostEqual(result["fill"]["factor"], numpy.mean(lengths) / float(k.order))
+            if level == 0:
+                self.assertEqual(result["prototypes"], k.N)
+                self.assertEqual(result["distortion"], 0.0)
+                continue
+            sizes, distortion, sqsum = [], 0.0, 0.0
+            for node in nodes:
+                for key, child in zip(node.keys(), node.values()):
+                    sizes.append(child.N)
+                    if child.N == 0:
+                        continue
+                    X = leaf_vectors(child)
+                    key = numpy.asarray(key, dtype=float)[numpy.newaxis,:]
+                    distortion += numpy.sum(k.model.distance_matrix(X, key))
+                    sqsum += numpy.sum((X - key) ** 2)
+            self.assertEqual(result["prototypes"], len(sizes))
+            self.assertEqual(result["sizes"]["min"], min(sizes))
+            self.assertEqual(result["sizes"]["max"], max(sizes))
+            self.assertEqual(result["sizes"]["empty"], sizes.count(0))
+            self.assertAlmostEqual(result["sizes"]["mean"], numpy.mean(sizes))
+            self.assertAlmostEqual(result["balance"]["cv"], numpy.std(sizes) / numpy.mean(sizes))
+            self.assertAlmostEqual(result["distortion"], distortion, delta=1e-6 * max(distortion, 1))
+            self.assertAlmostEqual(result["rmse"], numpy.sqrt(sqsum / sum(sizes)))
+            histogram = numpy.bincount([ int(numpy.log2(size)) for size in sizes if size ])
+            self.assertEqual(result["sizes"]["histogram"], histogram.tolist())
+
+    def test_sqeuclidean(self):
+        self.check(trees.ktree(data(1000), options()))
+
+    def test_distances(self):
+        for distance in ("euclidean", "cityblock", "cosine"):
+            self.check(trees.ktree(data(500), options(distance=distance)))
+
+    def test_float32(self):
+        self.check(trees.ktree(data(500), options(dtype="float32")))
+
+    def test_delete(self):
+        X = data(1000)
+        k = trees.ktree(X, options())
+        for i in xrange(0, len(X), 2):
+            k.delete(i, X[i])
+        self.check(k)
+
+    def test_single_node(self):
+        quality = trees.ktree(data(4), options()).quality()
+        self.assertEqual(len(quality["levels"]), 1)
+        self.assertEqual(quality["levels"][0]["prototypes"], 4)
+
+    def test_distortion(self):
+        # the distortion of the prototypes of the nodes that hold leafs:
+        k = trees.ktree(data(1000), options())
+        self.assertEqual(k.distrortion, k.quality()["levels"][1]["distortion"])
+
+
+class LayoutTest(unittest.TestCase):
+    """KNodes have no instance dictionary, share the options and the 
+    model of their KTree and allocate their arrays with the first key.
+    """
+
+    def test_slots(self):
+        k = trees.ktree(data(300), options())
+        for node in k.root.walk():
+            self.assertFalse(hasattr(node, "__dict__"))
+            self.assertTrue(node.options is k.options)
+            self.assertTrue(node.model is k.model)
+            self.assertEqual(node._keys.shape[0], k.order + 1)
+            self.assertEqual(node._values.dtype, numpy.int64 if node.hold_leafs else object)
+        self.assertRaises(AttributeError, setattr, k.root, "foo", 1)
+
+    def test_empty(self):
+        node = trees.KNode(options())
+        self.assertTrue(node._keys is None)
+        self.assertTrue(node._values is trees._NO_VALUES)
+        self.assertEqual((len(node), node.N, node.N_code_book), (0, 0, 0))
+        self.assertTrue(node.hold_leafs)
+        node.insert(data(1)[0], row_id=2 ** 40)
+        self.assertEqual(node.values()[0], 2 ** 40)
+
+    def test_copy(self):
+        X = data(300)
+        k = trees.ktree(X, options())
+        for node in list(k.root.walk()):
+            keys, values = numpy.array(node.keys()), numpy.array(node.values())
+            copy = node.copy()
+            self.assertNotEqual(copy.ID, node.ID)
+            numpy.testing.assert_array_equal(copy.keys(), keys)
+            if not copy.hold_leafs:
+                for child in copy.values():
+                    self.assertTrue(child.parent is copy)
+                continue
+            # the arrays of the copy are its own:
+            copy.insert(X[0], split=False, row_id=-5)
+            copy._keys[0] += 1.0
+            numpy.testing.assert_array_equal(node.keys(), keys)
+            numpy.testing.assert_array_equal(node.values(), values)
+            self.assertEqual(len(copy), len(node) + 1)
+
+
+class StoredKeysTest(unittest.TestCase):
+    """The running sums and the norms of the nodes are those of the
+    stored, i.e. rounded or quantized, keys.
+    """
+
+    def check(self, k):
+        for node in k.root.walk():
+            n = len(node)
+            if n == 0:
+                continue
+            keys = numpy.asarray(node.keys(), dtype=float)
+            numpy.testing.assert_allclose(node._norms[:n], models.sqnorms(keys), rtol=1e-12)
+            numpy.testing.assert_allclose(node._sum, models.wsum(node._weight(node._Ns[:n]), keys),
+                                          rtol=1e-10, atol=1e-10)
+
+    def test_float32(self):
+        X = data(1000)
+        self.check(trees.ktree(X, options(dtype="float32", reinsert=False)))
+
+    def test_float32_unweighted(self):
+        X = data(1000)
+        self.check(trees.ktree(X, options(dtype="float32", weighted=False, reinsert=False)))
+
+    def test_quantize(self):
+        X = data(1000)
+        self.check(trees.ktree(X, options(quantize="uint8", reinsert=False)))
+
+    def test_float32_delete(self):
+        X = data(1000)
+        k = trees.ktree(X, options(dtype="float32"))
+        for i in xrange(0, len(X), 2):
+            k.delete(i, X[i])
+        self.check(k)
+
+    def test_float32_bulk(self):
+        X = data(1000)
+        self.check(trees.ktree(X, options(dtype="float32", bulk=True)))
+
+    def test_quantize_bulk(self):
+        X = data(1000)
+        self.check(trees.ktree(X, options(quantize="uint8", bulk=True)))
+
+
+class StorageTest(unittest.TestCase):
+    """Keys are stored in options.dtype, quantized leafs as codes."""
+
+    def test_float32(self):
+        X = data(1000)
+        k = trees.ktree(X, options(dtype="float32"))
+        for node in k.root.walk():
+            if len(node):
+                self.assertEqual(node.keys().dtype, numpy.float32)
+            if node.hold_leafs and len(node):
+                numpy.testing.assert_array_equal(node.keys(), X[node.values()].astype(numpy.float32))
+        numpy.testing.assert_array_equal(leafs(k), numpy.arange(len(X)))
+
+    def test_quantize(self):
+        X = data(1000)
+        k = trees.ktree(X, options(quantize="uint8"))
+        quantizer = k.model.quantizer
+        numpy.testing.assert_allclose(quantizer.low, X.min(0))
+        numpy.testing.assert_allclose(quantizer.high, X.max(0))
+        for node in k.root.walk():
+            if node.hold_leafs and len(node):
+                self.assertEqual(node._keys.codes.dtype, numpy.uint8)
+                error = numpy.abs(node.keys() - X[node.values()])
+                self.assertTrue(numpy.all(error <= quantizer.scale / 2 + 1e-12))
+        numpy.testing.assert_array_equal(leafs(k), numpy.arange(len(X)))
+
+    def test_quantize_range(self):
+        X = data(300)
+        k = trees.ktree(X, options(quantize="int8", quantize_range=(numpy.zeros(8), 2 * numpy.ones(8))))
+        numpy.testing.assert_allclose(k.model.quantizer.high, 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
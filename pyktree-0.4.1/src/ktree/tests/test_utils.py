@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright © 2011 Ulf Großekathöfer
+#
+# Email: ugrossek@techfak.uni-bielefeld.de
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from ktree import trees, utils
+from ktree.tests import data, options, leafs
+
+
+class KNode(list):
+    """The node layout of pyktree 0.4.1, a list of [key, value] pairs."""
+
+
+class KTree(object):
+    """The K-Tree of pyktree 0.4.1."""
+
+
+def legacy_node(node):
+    """Returns a KNode of pyktree 0.4.1 with the items of "node"."""
+    old = KNode()
+    old.ID = node.ID
+    for key, value in node:
+        if isinstance(value, trees.KNode):
+            value = legacy_node(value)
+        else:
+            value = None
+        old.append([numpy.array(key), value])
+    return old
+
+
+def legacy_pickle(k, filename, protocol=2):
+    """Pickle KTree "k" in the layout of pyktree 0.4.1 to "filename"."""
+    old = KTree()
+    old.ID = -1
+    old.options = trees.KTreeOptions.__new__(trees.KTreeOptions)
+    old.options.__dict__.update(order=k.options.order, weighted=True,
+                                distance="sqeuclidean", reinsert=True)
+    old.root = legacy_node(k.root)
+    # the pickles refer to the classes of module ktree.trees:
+    classes = trees.KNode, trees.KTree
+    for cls, name in ((KNode, "KNode"), (KTree, "KTree")):
+        cls.__module__, cls.__name__ = trees.__name__, name
+        setattr(trees, name, cls)
+    try:
+        f = open(filename, "wb")
+        pickle.dump(old, f, protocol)
+        f.close()
+    finally:
+        trees.KNode, trees.KTree = classes
+
+
+class LoadKTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "ktree.pkl")
+        self.X = data(300)
+        self.k = trees.ktree(self.X, options(reinsert=False))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_legacy_pickle(self):
+        legacy_pickle(self.k, self.filename)
+        k = utils.load_ktree(self.filename)
+        self.assertTrue(isinstance(k, trees.KTree))
+        self.assertTrue(isinstance(k.root, trees.KNode))
+        self.assertTrue(k.root.parent is k)
+        self.assertEqual(k.N, self.X.shape[0])
+        self.assertEqual(k.depth, self.k.depth)
+        self.assertEqual(k.options.order, self.k.options.order)
+        for old, new in zip(self.k.root.walk(), k.root.walk()):
+            numpy.testing.assert_array_equal(old.keys(), new.keys())
+            numpy.testing.assert_array_equal(old.Ns, new.Ns)
+            if new.hold_leafs:
+                self.assertTrue(numpy.all(new.values() == -1))
+        vectors, ids, distances = k.nearest_neighbors(self.X)
+        expected = self.k.nearest_neighbors(self.X)
+        numpy.testing.assert_array_equal(vectors, expected[0])
+        numpy.testing.assert_array_equal(distances, expected[2])
+        self.assertTrue(numpy.all(ids == -1))
+
+    def test_legacy_protocols(self):
+        for protocol in (0, 1, 2):
+            legacy_pickle(self.k, self.filename, protocol)
+            k = utils.load_ktree(self.filename)
+            self.assertEqual(k.N, self.X.shape[0])
+            for old, new in zip(self.k.root.walk(), k.root.walk()):
+                numpy.testing.assert_array_equal(old.keys(), new.keys())
+
+    def test_pickle_protocols(self):
+        for protocol in (0, 1, 2):
+            f = open(self.filename, "wb")
+            pickle.dump(self.k, f, protocol)
+            f.close()
+            k = utils.load_ktree(self.filename)
+            self.assertTrue(k.root.parent is k)
+            self.assertEqual(k.N, self.X.shape[0])
+            for old, new in zip(self.k.root.walk(), k.root.walk()):
+                self.assertEqual(new.ID, old.ID)
+                numpy.testing.assert_array_equal(old.keys(), new.keys())
+                numpy.testing.assert_array_equal(old.values(), new.values())
+                if not new.hold_leafs:
+                    for child in new.values():
+                        self.assertTrue(child.parent is new)
+            vectors, ids, distances = k.nearest_neighbors(self.X)
+            numpy.testing.assert_array_equal(ids, self.k.nearest_neighbors(self.X)[1])
+
+    def test_legacy_insert(self):
+        legacy_pickle(self.k, self.filename)
+        k = utils.load_ktree(self.filename)
+        Q = data(50, seed=1)
+        for i, q in enumerate(Q):
+            k.insert(q, row_id=i)
+        self.assertEqual(k.N, self.X.shape[0] + Q.shape[0])
+        for node in k.root.walk():
+            self.assertTrue(len(node) <= k.order)
+        expected = numpy.concatenate([-numpy.ones(self.X.shape[0]), numpy.arange(Q.shape[0])])
+        numpy.testing.assert_array_equal(leafs(k), expected)
+
+    def test_flat(self):
+        utils.save_ktree(self.k, self.filename)
+        for mmap in (False, True):
+            k = utils.load_ktree(self.filename, mmap)
+            vectors, ids, distances = k.nearest_neighbors(self.X)
+            expected = self.k.nearest_neighbors(self.X)
+            numpy.testing.assert_array_equal(ids, expected[1])
+            numpy.testing.assert_array_equal(vectors, expected[0])
+            del k
+
+
+if __name__ == "__main__":
+    unittest.main()
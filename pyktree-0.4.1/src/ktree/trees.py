@@ -34,51 +34,234 @@ Neural Networks for Signal Processing X, 2000. 1 (2000) 271-280 vol.1
 #   - clean up
 
 import sys
+import collections
+import copy
 import datetime
+import heapq
+import itertools
+import multiprocessing
+import os
 import time
 
 import numpy
 import scipy
+import scipy.sparse
 
+import checkpoint
 import models
+import profiler
+import sources
 
-# global variable, really?
-ID = 0
+# the IDs of KNodes, next() on it is atomic, i.e. thread-safe:
+_ids = itertools.count(1)
+# the arrays of KNodes without keys, shared and never written:
+_NO_VALUES = numpy.empty(0, dtype=object)
+_NO_COUNTS = numpy.zeros((2, 0), dtype=int)
+_NO_GEOMETRY = numpy.zeros((2, 0))
 
 def ktree(data, options=None):
     """This function creates a KTree and inserts the examples from "data" in the KTree.
     Arguments:
         * data:                 a data set for which a KTree will be build. 
-                                Make sure "data" is an iterator.
+                                Either an array or a source of chunks of 
+                                examples, see module ktree.sources.  A source
+                                is read chunk by chunk, once for building the
+                                KTree and once more for the re-insert pass.
         * options.order:        order of KTree, i.e. the maximum number of 
                                 a node's children.  Default order is 5.
         * options.distance:     Distance measure that will be used for K-Tree, 
-                                please use one of:
-                                "cityblock", "euclidean", "sqeuclidean".
+                                please use one of: "cityblock", "euclidean",
+                                "sqeuclidean", "cosine".
                                 Default distance measure is "sqeuclidean".
         * options.weight_mean:  Use weight mean in k-means computation or not 
                                 (only valid for "euclidean", "sqeuclidean").
                                 Default is True.
+        * options.bulk:         Build the KTree top-down from the complete
+                                data set, see KTree.bulk_load(), instead of
+                                inserting the examples one by one.  The
+                                complete data set is read into memory.
+                                Default is False.
+        * options.jobs:         Number of processes that build the KTree.
+                                An array is split into "jobs" shards, each
+                                chunk of a source is a shard.  Default is 1.
+        * options.dtype:        Floating point type of the stored prototypes
+                                and leafs, "float64" (default) or "float32".
+        * options.profile:      Count distance evaluations, splits and 
+                                centroid computations per level and time
+                                the build phases, see KTree.stats().
+                                Default is False.
+        * options.quantize:     Store the leafs as "uint8" or "int8" codes,
+                                see models.ScalarQuantizer.  The range of
+                                the codes is the range of "data", unless 
+                                options.quantize_range is given.  Default
+                                is None, i.e. leafs are not quantized.
+        * options.checkpoint:   File of incremental checkpoints of the build,
+                                written every options.checkpoint_every rows
+                                and after each phase, see module
+                                ktree.checkpoint.  Default is None.
+        * options.resume:       Continue the build from options.checkpoint,
+                                if the file exists.  "data" and the options
+                                must be the ones of the interrupted build.
+                                Default is False.
     Returns:
         * a KTree
 
+    The leafs of the KTree carry their row ID, i.e. the index of their
+    example in "data".  "data" may be a scipy.sparse matrix, its rows are
+    then stored as sparse leafs, see KNode.
+
     Please note that "euclidean" and "sqeuclidean" should result in similar results.
     """
     if options is None:
         options = KTreeOptions()
-    k = KTree(options=options)
-    # build K-Tree:
-    for i, d in enumerate(data):
-        k.insert(d)
-    if options.reinsert:
-        # remove all leafs from tree
-        k.remove_leafs()
+    source = sources.chunks(data)
+    if getattr(options, "quantize", None) and getattr(options, "quantize_range", None) is None:
+        options = copy.copy(options)
+        options.quantize_range = sources.ranges(source)
+    # the build phase and the number of rows it has consumed:
+    phase, offset = "build", 0
+    filename = getattr(options, "checkpoint", None)
+    if filename and getattr(options, "resume", False) and os.path.exists(filename):
+        k, phase, offset = checkpoint.load(filename, options)
+    else:
+        k = KTree(options=options)
+    writer = None
+    if filename:
+        writer = checkpoint.Checkpointer(filename, k, phase, offset)
+        every = getattr(options, "checkpoint_every", None) or checkpoint.EVERY
+    profile = k.model.profiler
+    if profile is not None:
+        start = profiler.clock()
+    # build K-Tree, unless a resumed build has finished it:
+    if phase == "build":
+        if options.jobs > 1:
+            shard_options = copy.copy(options)
+            shard_options.jobs = 1
+            shard_options.reinsert = False
+            shard_options.checkpoint = None
+            if isinstance(data, sources.Source):
+                shards = iter(source)
+            else:
+                shards = sources.split(source.read(), options.jobs)
+            pool = multiprocessing.Pool(options.jobs)
+            try:
+                trees = list(pool.imap(_build_shard, _shard_tasks(shards, shard_options)))
+            finally:
+                pool.close()
+                pool.join()
+            k.merge(trees)
+        elif options.bulk:
+            k.bulk_load(source.read())
+        else:
+            for i, d in _enumerate_rows(source, offset):
+                k.insert(d, row_id=i)
+                if writer is not None and (i + 1) % every == 0:
+                    writer.write("build", i + 1)
+        if profile is not None:
+            profile.stop("build", start)
+            start = profiler.clock()
+        if options.reinsert:
+            # remove all leafs from tree
+            k.remove_leafs()
+            phase, offset = "reinsert", 0
+        else:
+            phase = "done"
+        if writer is not None:
+            writer.write(phase, 0, full=options.jobs > 1)
+    if phase == "reinsert":
         # re-insert vectors 
-        for i, d in enumerate(data):
-            k.insert(d, split=False)
+        if options.jobs > 1:
+            k.parallel_reinsert(source, options.jobs)
+        else:
+            for i, d in _enumerate_rows(source, offset):
+                k.insert(d, split=False, row_id=i)
+                if writer is not None and (i + 1) % every == 0:
+                    writer.write("reinsert", i + 1)
+        if writer is not None:
+            writer.write("done", 0, full=options.jobs > 1)
+        if profile is not None:
+            profile.stop("reinsert", start)
+    k.model.journal = None
     return k    
 
 
+def _enumerate_rows(source, start=0):
+    """Yields (row ID, row) for the rows of "source" from row "start" on,
+    chunks before "start" are skipped as a whole.
+    """
+    offset = 0
+    for chunk in source:
+        n = chunk.shape[0]
+        for i in xrange(max(start - offset, 0), n):
+            yield offset + i, chunk[i]
+        offset += n
+
+def _shard_tasks(shards, options):
+    """Yields the arguments of _build_shard() for each shard."""
+    offset = 0
+    for shard in shards:
+        yield shard, offset, options
+        offset += shard.shape[0]
+
+def _build_shard(args):
+    """Build a KTree for a shard of a data set in a worker process,
+    the row IDs of the shard start at "offset".
+    """
+    data, offset, options = args
+    k = ktree(data, options)
+    for node in k.root.walk():
+        if node.hold_leafs:
+            node._values[:len(node)] += offset
+    return k
+
+# the K-Tree and its leaf nodes in reinsert worker processes:
+_worker = None
+
+def _init_reinsert_worker(k):
+    global _worker
+    nodes = [ node for node in k.root.walk() if node.hold_leafs ]
+    _worker = (k, dict((id(node), i) for i, node in enumerate(nodes)))
+
+def _assign_leaf_nodes(X):
+    """Returns the index of the nearest leaf node for each row of "X"."""
+    k, index = _worker
+    labels = numpy.empty(X.shape[0], dtype=int)
+    # the leaf nodes are empty while their leafs are re-inserted:
+    for node, rows in k.root.route(X, numpy.arange(X.shape[0]), 0, skip_empty=False):
+        labels[rows] = index[id(node)]
+    return labels
+
+
+def _partition(model, X, Ns, K, capacity):
+    """Partition the rows of "X" into "K" non-empty groups of at most
+    "capacity" rows.  The groups are found with k-means, rows of groups 
+    that exceed the capacity are moved to the nearest groups with room
+    left, cheapest moves first.
+    Returns:
+        * the group of each row of "X"
+    """
+    if X.shape[0] == 1:
+        return numpy.zeros(1, dtype=int)
+    if not model.weighted:
+        Ns = None
+    centroids, labels = model.kmeans(X, K, Ns)
+    counts = numpy.bincount(labels, minlength=K)
+    if counts.max() <= capacity:
+        return labels
+    dm = model.distance_matrix(X, centroids)
+    while counts.max() > capacity:
+        k = numpy.argmax(counts)
+        members = numpy.nonzero(labels == k)[0]
+        room = numpy.nonzero(counts < capacity)[0]
+        costs = dm[members][:,room]
+        targets = room[numpy.argmin(costs, 1)]
+        penalties = numpy.min(costs, 1) - dm[members,k]
+        moved = numpy.argsort(penalties)[:counts[k]-capacity]
+        labels[members[moved]] = targets[moved]
+        counts = numpy.bincount(labels, minlength=K)
+    return labels
+
+
 class KTreeOptions(object):
     """This class holds the options for K-Trees
     Currently, this options are:
@@ -89,8 +272,48 @@ class KTreeOptions(object):
         .distance: One of 
                        - "sqeuclidean" (default),
                        - "euclidean",
-                       - "cityblock".
+                       - "cityblock",
+                       - "cosine".
         .reinsert: 
+        .bulk:     a boolean weather to build the K-Tree
+                   top-down from the complete data set,
+                   default False.
+        .jobs:     number of processes that build the
+                   K-Tree, default 1.
+        .window:   if positive, the K-Tree holds the 
+                   "window" most recently inserted 
+                   examples only, see KTree.insert(),
+                   default 0.
+        .seed:     seed of the random number generator
+                   used for node splits, None (default)
+                   seeds it randomly.
+        .profile:  a boolean weather to instrument the
+                   K-Tree, see module ktree.profiler,
+                   default False.
+        .dtype:    floating point type of the stored 
+                   prototypes and leafs, "float64" 
+                   (default) or "float32".  Centroids
+                   are accumulated in float64.
+        .distance_dtype: floating point type of the
+                   distance computations of the 
+                   "euclidean", "sqeuclidean" and "cosine"
+                   models, None (default) for .dtype.
+        .quantize: None (default), "uint8" or "int8",
+                   the type of scalar quantized leafs,
+                   see models.ScalarQuantizer.
+        .quantize_range: the minimum and the maximum
+                   of each dimension, i.e. the range of
+                   quantized leafs, None (default) sets
+                   it to the range of the data set, see
+                   ktree().
+        .checkpoint: None (default) or the file of
+                   incremental checkpoints of the build,
+                   see module ktree.checkpoint.
+        .checkpoint_every: number of inserted 
+                   examples between checkpoints, default
+                   checkpoint.EVERY.
+        .resume:   a boolean weather to continue the 
+                   build from .checkpoint, default False.
     """
 
     def __init__(self):
@@ -98,6 +321,18 @@ class KTreeOptions(object):
         self.weighted = True
         self.distance = "sqeuclidean"
         self.reinsert = True
+        self.bulk = False
+        self.jobs = 1
+        self.window = 0
+        self.seed = None
+        self.profile = False
+        self.dtype = "float64"
+        self.distance_dtype = None
+        self.quantize = None
+        self.quantize_range = None
+        self.checkpoint = None
+        self.checkpoint_every = checkpoint.EVERY
+        self.resume = False
 
     def __str__(self):
         s =  "KTreeOptions: order: %i, " % self.order
@@ -106,13 +341,138 @@ class KTreeOptions(object):
         return s
 
 
-class KNode(list):
+def _concatenate(arrays):
+    """Stack the rows of "arrays", the result is sparse if one of them is."""
+    if any(models.issparse(a) for a in arrays):
+        return scipy.sparse.vstack(arrays, format="csr")
+    return numpy.concatenate(arrays)
+
+
+class SparseRows(object):
+    """A preallocated stack of sparse rows that replaces the key array of
+    KNodes that hold sparse leafs.  Rows are set one by one or by slices 
+    of CSR matrices, reading anything but a single row returns the rows 
+    as CSR matrix, i.e. it is indexed like a 2-d array.  The CSR matrix
+    of all rows is cached until the next write.
+    """
+
+    def __init__(self, size, d):
+        self.shape = (size, d)
+        self._empty = scipy.sparse.csr_matrix((1, d))
+        self._rows = [ self._empty ] * size
+        self._matrix = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _stack(self):
+        if self._matrix is None:
+            self._matrix = scipy.sparse.vstack(self._rows, format="csr")
+        return self._matrix
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long, numpy.integer)):
+            return self._rows[index]
+        return self._stack()[index]
+
+    def __setitem__(self, index, value):
+        value = scipy.sparse.csr_matrix(value)
+        if isinstance(index, slice):
+            for j, i in enumerate(xrange(*index.indices(self.shape[0]))):
+                self._rows[i] = value[j]
+        else:
+            self._rows[index] = value
+        self._matrix = None
+
+    def copy(self):
+        """Returns a copy that shares the (immutable) rows."""
+        rows = SparseRows.__new__(SparseRows)
+        rows.shape = self.shape
+        rows._empty = self._empty
+        rows._rows = list(self._rows)
+        rows._matrix = self._matrix
+        return rows
+
+
+class QuantizedRows(object):
+    """A preallocated array of scalar quantized rows that replaces the
+    key array of KNodes that hold leafs if options.quantize is set.
+    The rows are encoded by "quantizer" (see models.ScalarQuantizer) when
+    they are set and decoded to "dtype" when they are read, i.e. it is 
+    indexed like a 2-d array.
+    """
+
+    def __init__(self, size, d, quantizer, dtype):
+        self.codes = numpy.zeros((size, d), dtype=quantizer.dtype)
+        self.quantizer = quantizer
+        self.dtype = dtype
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.quantizer.decode(self.codes[index], self.dtype)
+
+    def __setitem__(self, index, value):
+        self.codes[index] = self.quantizer.encode(value)
+
+    def copy(self):
+        """Returns a copy of the codes."""
+        rows = QuantizedRows(0, 0, self.quantizer, self.dtype)
+        rows.codes = self.codes.copy()
+        return rows
+
+
+class KNode(object):
+    """A node of a K-Tree.
+
+    The keys of a node are stored row-wise in a preallocated, contiguous
+    (order+1, d) array and its values in a parallel array.  The values
+    are sub-nodes (an object array), or the row IDs of leafs (an int64
+    array), i.e. the index of the leaf's example in the data set the
+    KTree was built from (-1 if it is unknown).  Only the first len(node)
+    rows are in use, the additional row takes the overflowing element
+    right before a split.  The arrays are allocated with the first key.
+
+    Each node also keeps the running sum of its (weighted) keys, so that
+    its centroid can be updated in O(d) for incremental models, and caches
+    the statistics of its sub-trees (number of leafs, number of code book
+    vectors, depth), which are updated along the insert/split path.
+
+    For each key, a node stores a covering radius, i.e. an upper bound of
+    the (metric) distance between the key and the leafs of its sub-tree.
+    KTree.knn() uses them to prune sub-trees.
+
+    The squared euclidean norms of the keys are cached as well, they save 
+    the euclidean models a pass over the keys in distances().  The 
+    statistics, radii and norms of the items are rows of two arrays, i.e.
+    a node consists of five arrays.  All nodes of a KTree share its
+    options and model.
+
+    Nodes that hold sparse leafs (scipy.sparse rows) store them in a 
+    SparseRows stack instead of the dense key array, their memory scales
+    with the number of nonzeros.  The keys of inner nodes are dense.
+
+    Keys are stored in options.dtype, e.g. float32, while the running sum
+    is kept in float64.  If the model has a quantizer, the nodes that hold
+    leafs store them in a QuantizedRows array.
+    """
+
+    __slots__ = ("ID", "options", "model", "parent", "_keys", "_values", "_n",
+                 "_counts", "_N", "_ncb", "_sum", "_depth", "_leaf", "_geometry")
 
     def __init__(self, options=None, model=None, parent=None):
-        global ID
-        ID += 1
-        self.ID = ID
-        # TODO: look up options in parent node?
+        self.ID = next(_ids)
+        # the nodes of a KTree share its options and model:
+        if parent is not None:
+            if options is None:
+                options = parent.options
+            if model is None:
+                model = parent.model
         self.options = options
         if self.options is None:
             self.options = KTreeOptions()
@@ -120,6 +480,21 @@ class KNode(list):
         if self.model is None:
                 self.model = models.model(self.options)
         self.parent = parent
+        # the arrays are allocated with the first key, i.e. when the 
+        # dimension of the examples is known, see _reserve():
+        self._keys = None
+        self._values = _NO_VALUES
+        self._n = 0
+        # number of leafs and code book vectors of each sub-tree:
+        self._counts = _NO_COUNTS
+        # covering radii and squared norms of the keys:
+        self._geometry = _NO_GEOMETRY
+        self._N = 0
+        self._ncb = 0
+        # running sum, see centroid():
+        self._sum = None
+        self._depth = 0
+        self._leaf = True
 
     def str(self, level=0):
         """A string representation of the current node and its (sub)trees."""
@@ -141,15 +516,73 @@ class KNode(list):
     def __eq__(self, other):
         return self.ID == other.ID
 
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        for i in xrange(self._n):
+            yield self._keys[i], self._values[i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("KNode index out of range")
+        return self._keys[i], self._values[i]
+
+    def copy(self):
+        """Returns a copy of this node with a new ID that shares the
+        sub-nodes, which become the sub-nodes of the copy, i.e. their
+        parent is the copy.  See module ktree.shared.
+        """
+        node = KNode.__new__(KNode)
+        for name in KNode.__slots__:
+            setattr(node, name, getattr(self, name))
+        node.ID = next(_ids)
+        for name in ("_keys", "_values", "_counts", "_geometry", "_sum"):
+            value = getattr(self, name)
+            if value is not None:
+                setattr(node, name, value.copy())
+        if not self._leaf:
+            for value in node.values():
+                value.parent = node
+        return node
+
+    def __getstate__(self):
+        # a class with __slots__ and without __dict__ can't be pickled with
+        # the protocols 0 and 1 otherwise:
+        return dict((name, getattr(self, name)) for name in KNode.__slots__)
+
+    def __setstate__(self, state):
+        for name in KNode.__slots__:
+            setattr(self, name, state[name])
+
+    @property
+    def _Ns(self):
+        """The number of leafs of each sub-tree (including the spare row)."""
+        return self._counts[0]
+
+    @property
+    def _ncbs(self):
+        """The number of code book vectors of each sub-tree."""
+        return self._counts[1]
+
+    @property
+    def _radii(self):
+        """The covering radius of each key."""
+        return self._geometry[0]
+
+    @property
+    def _norms(self):
+        """The squared euclidean norm of each key."""
+        return self._geometry[1]
+
     @property 
     def N(self):
         """A property that represents the accumulated number 
         of leafs in this node's (sub)tree.
         """
-        try:
-            return numpy.sum([item[1].N for item in self])
-        except AttributeError:
-            return len(self)
+        return self._N
 
     @property
     def distortion(self):
@@ -162,46 +595,122 @@ class KNode(list):
 
     @property
     def N_code_book(self):
-        try:
-            ncb = numpy.sum([ item[1].N_code_book for item in self ])
-        except AttributeError:
-            ncb = 1
-        return ncb 
+        """The number of (non-empty) nodes that hold leafs 
+        in this node's (sub)tree.
+        """
+        if self._leaf:
+            return int(self._n > 0)
+        return self._ncb
          
     @property
     def Ns(self):
         """The number of leafs in each sub-tree."""
-        Ns = []
-        for value in self.values():
-            try:
-                Ns.append(value.N)
-            except AttributeError:
-                Ns.append(1)
-        return Ns
+        return self._Ns[:self._n]
 
     @property
     def depth(self):
         """A property that represents the depth of this node's (sub)tree."""
-        try:
-            d = self[0][1].depth  
-        except (IndexError, AttributeError):
-            d = -1
-        return d+1 
+        return self._depth
 
     def nearest_neighbor(self, value):
         """Find the nearest neighbor of "value" in this KTree."""
-        try:
-            nearest = self.nearestitem(value)[1].nearest_neighbor(value)
-        except AttributeError, exc:
-            nearest = self.nearestitem(value)[0]
-        return nearest
+        if self._leaf:
+            return self.nearestitem(value)[0].copy()
+        return self.nearestitem(value)[1].nearest_neighbor(value)
+
+    def nearest_neighbors(self, X, rows, result):
+        """Route the queries "X" down this node's (sub)tree and store
+        their nearest leafs in "result".
+        Arguments:
+            * X:        a matrix of queries, one query per row.
+            * rows:     the rows of "X" in the complete query matrix.
+            * result:   a tuple of arrays (vectors, ids, distances),
+                        see KTree.nearest_neighbors().
+        """
+        if self._N == 0:
+            return
+        dm = self.descent_distances(X)
+        nearest = numpy.argmin(dm, 1)
+        if self._leaf:
+            vectors, ids, distances = result
+            leafs = self._keys[nearest]
+            if vectors.dtype == object:
+                # sparse queries, see KTree.nearest_neighbors():
+                for row, leaf in zip(rows, leafs):
+                    vectors[row] = leaf
+            else:
+                vectors[rows] = models.toarray(leafs)
+            ids[rows] = self._values[nearest]
+            distances[rows] = dm[numpy.arange(len(rows)), nearest]
+        else:
+            for i in numpy.unique(nearest):
+                mask = nearest == i
+                self._values[i].nearest_neighbors(X[mask], rows[mask], result)
+
+    def route(self, X, rows, depth, skip_empty=True):
+        """Route the queries "X" down to the nodes of depth "depth".
+        Arguments:
+            * X:        a matrix of queries, one query per row.
+            * rows:     the rows of "X" in the complete query matrix.
+            * depth:    the depth of the target nodes, 0 for the 
+                        nodes that hold leafs.
+            * skip_empty: do not route queries into sub-trees without
+                        leafs, see descent_distances(), default True.
+        Returns:
+            * a list of (node, rows) pairs.
+        """
+        if self._depth == depth:
+            return [ (self, rows) ]
+        if skip_empty:
+            if self._N == 0:
+                return []
+            dm = self.descent_distances(X)
+        else:
+            dm = self.distances(X)
+        nearest = numpy.argmin(dm, 1)
+        routes = []
+        for i in numpy.unique(nearest):
+            mask = nearest == i
+            routes.extend(self._values[i].route(X[mask], rows[mask], depth, skip_empty))
+        return routes
+
+    def walk(self):
+        """Iterate over the nodes of this node's (sub)tree in depth-first order."""
+        yield self
+        if not self._leaf:
+            for value in self.values():
+                for node in value.walk():
+                    yield node
+
+    def refresh(self):
+        """Recompute the keys, statistics and covering radii of this node's
+        (sub)tree bottom-up, e.g. after leafs have been added to leaf nodes
+        directly.  Keys of empty sub-trees are kept.
+        """
+        if not self._leaf:
+            for i, child in enumerate(self.values()):
+                child.refresh()
+                if child._N > 0:
+                    self._keys[i] = child.centroid()
+                self._radii[i] = child.covering_radius(self._keys[i])
+            self._norms[:self._n] = models.sqnorms(models.rows(self.keys()))
+        self._recount()
+
+    def covering_radius(self, key):
+        """Returns an upper bound of the (metric) distance between "key"
+        and the leafs of this node's (sub)tree.
+        """
+        if self._N == 0:
+            return 0.0
+        dm = self.distances(models.rows(key))
+        return numpy.max(self.model.to_metric(dm[0]) + self._radii[:self._n])
 
     def level(self, n=1):
         """Return the prototypes of level 'n' in this KTree. 
         'n' is counted bottom-up, i.e. the level just above leaf level can be accessed with n=1.
         """
         if self.depth == n:
-            return zip(self.keys(), self.Ns)
+            return zip(self.keys().copy(), self.Ns)
         else:
             keys = []
             for value in self.values():
@@ -210,86 +719,377 @@ class KNode(list):
 
     def remove(self, key):
         """Delete the item that is associated with "key" from this node."""
-        #print "remove:", self.ID, key, "*", map(lambda x: str(x[0])+" "+str(x[1]), self)
-        for i, item in enumerate(self):
-            if item[1] is key:
-                del self[i]
+        for i in xrange(self._n-1, -1, -1):
+            if self._values[i] is key:
+                self._delete(i)
+
+    def index(self, value):
+        """Returns the index of the item with value "value"."""
+        for i in xrange(self._n):
+            if self._values[i] is value:
+                return i
+        raise ValueError("%s is not a value of %s." % (str(value), str(self)))
+
+    def _update(self, i):
+        """Recompute the key, statistics and covering radius of the
+        i-th item of this node from its sub-node.
+        """
+        if self.model.journal is not None:
+            self.model.journal[self.ID] = self
+        child = self._values[i]
+        self._sum -= self._weight(self._Ns[i]) * self._keys[i].astype(float)
+        if child._N > 0:
+            self._keys[i] = child.centroid()
+            # the sum and the norm of the stored key, which may be rounded:
+            key = self._keys[i].astype(float)
+            self._sum += self._weight(child._N) * key
+            self._norms[i] = numpy.dot(key, key)
+        self._N += child._N - self._Ns[i]
+        self._ncb += child.N_code_book - self._ncbs[i]
+        self._Ns[i] = child._N
+        self._ncbs[i] = child.N_code_book
+        self._radii[i] = child.covering_radius(self._keys[i])
+
+    def rebalance(self):
+        """Update the path from this node to the root after items have
+        been deleted from this node.  On the way up, empty nodes are 
+        removed and nodes with less than order/2 items are merged with 
+        their nearest sibling.  If the items of both nodes do not fit into
+        a single node, they are redistributed between both nodes instead.
+        Since only nodes of the same level are merged, the tree stays
+        height balanced.
+        """
+        node = self
+        while isinstance(node.parent, KNode):
+            parent = node.parent
+            i = parent.index(node)
+            n = len(node)
+            if n == 0:
+                parent._delete(i)
+            elif 2*n < self.options.order and len(parent) > 1:
+                dm = parent.distances(parent._keys[i:i+1])[0]
+                dm[i] = numpy.inf
+                j = numpy.argmin(dm)
+                sibling = parent._values[j]
+                if n + len(sibling) > self.options.order:
+                    sibling.redistribute(node)
+                    parent._update(i)
+                    parent._update(j)
+                else:
+                    parent._delete(i)
+                    sibling.extend(node.keys().copy(), node.values().copy(), node.Ns.copy(),
+                                   node._ncbs[:n].copy(), node._radii[:n].copy())
+                    parent._update(parent.index(sibling))
+            else:
+                parent._update(i)
+            node = parent
+
+    def redistribute(self, other):
+        """Partition the items of this node and node "other" anew 
+        between both nodes, see _partition().
+        """
+        nodes = (self, other)
+        keys = _concatenate([ node.keys() for node in nodes ])
+        values = numpy.concatenate([ node.values() for node in nodes ])
+        Ns = numpy.concatenate([ node.Ns for node in nodes ])
+        ncbs = numpy.concatenate([ node._ncbs[:node._n] for node in nodes ])
+        radii = numpy.concatenate([ node._radii[:node._n] for node in nodes ])
+        # nodes may exceed the order after re-inserting without splits:
+        capacity = max(self.options.order, -(-keys.shape[0] // 2))
+        labels = _partition(self.model, keys, Ns, 2, capacity)
+        for label, node in enumerate(nodes):
+            if not node._leaf:
+                node._values[:node._n] = None
+            node._n = 0
+            node._recount()
+            members = labels == label
+            node.extend(keys[members], values[members], Ns[members], 
+                        ncbs[members], radii[members])
+
+    def _delete(self, i):
+        """Delete the i-th item of this node and close the gap."""
+        if self.model.journal is not None:
+            self.model.journal[self.ID] = self
+        n = self._n
+        self._sum -= self._weight(self._Ns[i]) * self._row(i)
+        self._N -= self._Ns[i]
+        self._ncb -= self._ncbs[i]
+        self._keys[i:n-1] = self._keys[i+1:n].copy()
+        self._values[i:n-1] = self._values[i+1:n]
+        self._Ns[i:n-1] = self._Ns[i+1:n].copy()
+        self._ncbs[i:n-1] = self._ncbs[i+1:n].copy()
+        self._radii[i:n-1] = self._radii[i+1:n].copy()
+        self._norms[i:n-1] = self._norms[i+1:n].copy()
+        if not self._leaf:
+            self._values[n-1] = None
+        self._n -= 1
 
     def remove_leafs(self):
         if self.hold_leafs:
-            for i in range(len(self)-1,-1,-1):
-                del self[i]
+            self._n = 0
         else:
-            for subnode in self:
-                subnode[1].remove_leafs()
+            for subnode in self.values():
+                subnode.remove_leafs()
+            self._radii[:self._n] = 0.0
+        self._recount()
 
     @property
     def hold_leafs(self):
         """Returns True if this node holds leafs and
         False if is holds sub-nodes.
         """
-        try:
-            # ok, if this node has sub-nodes, these nodes
-            # would definitely have an insert method, right?
-            f = self[0][1].insert
-            return False
-        except (IndexError, AttributeError), exc:
-            return True
+        return self._leaf
 
     def keys(self):
-        """A property that returns a list of all keys in this node."""
-        return [ k[0] for k in self ]
+        """Returns an array of all keys in this node, one key per row."""
+        if self._keys is None:
+            return numpy.empty((0, 0))
+        return self._keys[:self._n]
 
     def values(self):
-        return [ k[1] for k in self ]
+        return self._values[:self._n]
 
     def items(self):
         return [ (k[0],k[1]) for k in self ]
 
+    def _weight(self, N):
+        """Returns the weight of a key with "N" leafs 
+        in this node's running sum.
+        """
+        if self.model.weighted:
+            return N
+        return numpy.ones_like(N)
+
+    def _recount(self):
+        """Recompute this node's statistics from its items."""
+        if self.model.journal is not None:
+            self.model.journal[self.ID] = self
+        n = self._n
+        if not self._leaf:
+            self._Ns[:n] = [ value._N for value in self.values() ]
+            self._ncbs[:n] = [ value.N_code_book for value in self.values() ]
+        self._N = numpy.sum(self._Ns[:n])
+        self._ncb = numpy.sum(self._ncbs[:n])
+        if self._keys is not None:
+            self._sum = models.wsum(self._weight(self._Ns[:n]), self._keys[:n])
+
+    def centroid(self):
+        """Returns the centroid of this node's keys."""
+        if self.model.profiler is not None:
+            self.model.profiler.count("centroids", self._depth)
+        if not self.model.incremental:
+            return self.model.centroid_function(self)
+        if self.model.weighted:
+            return self._sum / self._N
+        return self._sum / self._n
+
+    def _row(self, i):
+        """Returns the i-th key as dense 1-d float64 array, i.e. the
+        stored key, which may be rounded or quantized, in the type of 
+        the running sum.
+        """
+        return numpy.ravel(models.toarray(self._keys[i])).astype(float)
+
+    def _new_keys(self, size, d, sparse, leafs):
+        """Returns an empty key array for "size" keys of dimension "d",
+        the keys are "sparse" or dense, and "leafs" or sub-node keys.
+        """
+        if sparse:
+            return SparseRows(size, d)
+        dtype = models.storage_dtype(self.options)
+        if leafs and self.model.quantizer is not None:
+            return QuantizedRows(size, d, self.model.quantizer, dtype)
+        return numpy.empty((size, d), dtype=dtype)
+
+    def _reserve(self, d, n, sparse=False, leafs=True):
+        """Make sure this node has room for "n" keys of dimension "d",
+        the keys of a new key array are "sparse" or dense, and "leafs" 
+        or sub-node keys, see _new_keys().
+        """
+        size = len(self._values)
+        if n > size:
+            # the first key, or appending without splitting:
+            size = max(n, 2*size, self.options.order+1)
+            if self._keys is None:
+                # row IDs of leafs or sub-nodes:
+                values = numpy.empty(size, dtype=numpy.int64 if leafs else object)
+            else:
+                values = numpy.empty(size, dtype=self._values.dtype)
+            values[:self._n] = self._values[:self._n]
+            self._values = values
+            counts = numpy.zeros((2, size), dtype=int)
+            counts[:,:self._n] = self._counts[:,:self._n]
+            self._counts = counts
+            geometry = numpy.zeros((2, size))
+            geometry[:,:self._n] = self._geometry[:,:self._n]
+            self._geometry = geometry
+        if self._keys is None:
+            self._keys = self._new_keys(size, d, sparse, leafs)
+            self._sum = numpy.zeros(d)
+        elif size > len(self._keys):
+            keys = self._new_keys(size, d, isinstance(self._keys, SparseRows),
+                                  isinstance(self._keys, QuantizedRows))
+            keys[:self._n] = self._keys[:self._n]
+            self._keys = keys
+
     def append(self, key, value, split=True):
         """Append a (key, value) pair to this KNode and split it 
         if the number of elements exceed the KTree's order.
         """
-        try:
+        if self.model.journal is not None:
+            self.model.journal[self.ID] = self
+        sparse = models.issparse(key)
+        if sparse:
+            key = scipy.sparse.csr_matrix(key, dtype=float)
+        else:
+            key = numpy.ravel(key)
+        self._reserve(key.shape[-1], self._n+1, sparse, not isinstance(value, KNode))
+        if not isinstance(value, KNode):
+            N, ncb, radius = 1, 0, 0.0
+        else:
             value.parent = self
-        except AttributeError, exc:
-            pass
-        super(KNode, self).append([key, value])
-        if (len(self) > self.options.order) and split:
+            N, ncb = value._N, value.N_code_book
+            radius = value.covering_radius(key)
+            self._depth = value._depth + 1
+            self._leaf = False
+        self._keys[self._n] = key
+        self._values[self._n] = value
+        self._Ns[self._n] = N
+        self._ncbs[self._n] = ncb
+        self._radii[self._n] = radius
+        # the norm of the stored key, which may be rounded or quantized:
+        self._norms[self._n] = models.sqnorms(models.rows(self._keys[self._n]))[0]
+        self._sum += self._weight(N) * self._row(self._n)
+        self._N += N
+        self._ncb += ncb
+        self._n += 1
+        if (self._n > self.options.order) and split:
             self.split()
 
+    def extend(self, keys, values, Ns, ncbs, radii):
+        """Append the rows of "keys" and the related "values",
+        sub-tree statistics and covering radii to this KNode 
+        without splitting it.
+        """
+        if self.model.journal is not None:
+            self.model.journal[self.ID] = self
+        n = self._n + keys.shape[0]
+        self._reserve(keys.shape[1], n, models.issparse(keys), not isinstance(values[0], KNode))
+        self._keys[self._n:n] = keys
+        self._values[self._n:n] = values
+        self._Ns[self._n:n] = Ns
+        self._ncbs[self._n:n] = ncbs
+        self._radii[self._n:n] = radii
+        self._norms[self._n:n] = models.sqnorms(models.rows(self._keys[self._n:n]))
+        self._sum += models.wsum(self._weight(Ns), self._keys[self._n:n])
+        self._N += numpy.sum(Ns)
+        self._ncb += numpy.sum(ncbs)
+        if isinstance(values[0], KNode):
+            for value in values:
+                value.parent = self
+            self._depth = values[0]._depth + 1
+            self._leaf = False
+        self._n = n
+
     def split(self):
         """Split this node and replace it with its successors in the parent node."""
+        profile = self.model.profiler
+        if profile is not None:
+            start = profiler.clock()
+            profile.count("splits", self._depth)
         centroids, labels = self.model.clustering_function(self)
         if isinstance(self.parent, KTree):
+            if profile is not None:
+                profile.count("root_splits", self._depth)
             self.parent = self.parent.new_root()
         else:
             self.parent.remove(self)
+        n = self._n
+        keys, values = self.keys(), self.values()
         nodes = [ KNode(options=self.options, model=self.model) for i in range(2) ]
-        for label, item in zip(labels, self.items()):
-            nodes[label].append(item[0], item[1])
+        for i, node in enumerate(nodes):
+            mask = labels == i
+            node.extend(keys[mask], values[mask], self._Ns[:n][mask], 
+                        self._ncbs[:n][mask], self._radii[:n][mask])
+        if profile is not None:
+            # the parent's split is timed on its own:
+            profile.stop("split", start)
         for i, node in enumerate(nodes):
             self.parent.append(centroids[i], node)
 
+    def distances(self, X):
+        """Returns the distance matrix between the rows of "X" and 
+        this node's keys.
+        """
+        if self.model.profiler is not None:
+            self.model.profiler.count("distances", self._depth, X.shape[0] * self._n)
+        return self.model.distance_matrix(X, self.keys(), self._norms[:self._n])
+
+    def descent_distances(self, X):
+        """Returns the distance matrix between the rows of "X" and 
+        this node's keys, with infinite distances to the keys of empty
+        sub-nodes, i.e. queries never descend into sub-trees without leafs.
+        """
+        dm = self.distances(X)
+        if not self._leaf:
+            dm[:, self._Ns[:self._n] == 0] = numpy.inf
+        return dm
+
+    def nearestindex(self, key):
+        """Find the index of this KNode's nearest item 
+        in terms of distance to "key".
+        """
+        dm = self.distances(models.rows(key))
+        return numpy.argmin(dm)
+
     def nearestitem(self, key):
         """Find this KNode's nearest item 
         in terms of distance to "key".
         """
-        dm = [ self.model.distance_function(key, sk) for sk in self.keys() ]
-        return self[numpy.argmin(dm)]
+        return self[self.nearestindex(key)]
 
-    def insert(self, value, split=True):
+    def insert(self, value, split=True, row_id=-1):
         """ Insert "value" to this KNode. If this KNode has leafs, append
-        "value" to the leafs, otherwise insert "value" to its nearest child
-        node.
-        """
-        if not self.hold_leafs:
-            nearest_element = self.nearestitem(value)
-            nearest_element[1].insert(value)
-            # TODO: this can be solved more efficiently:
-            nearest_element[0] = self.model.centroid_function(nearest_element[1])
+        "value" with its "row_id" to the leafs, otherwise insert "value" 
+        to its nearest child node.
+        """
+        if not self._leaf:
+            profile = self.model.profiler
+            if profile is not None:
+                start = profiler.clock()
+            i = self.nearestindex(value)
+            if profile is not None:
+                profile.stop("descent", start)
+            child = self._values[i]
+            # "split" only concerns the leafs of the root, sub-nodes
+            # are split as usual:
+            child.insert(value, row_id=row_id)
+            # the child's entry is only outdated if the child has 
+            # not been split (and replaced) during insertion:
+            if i < self._n and self._values[i] is child:
+                if self.model.journal is not None:
+                    self.model.journal[self.ID] = self
+                key = child.centroid()
+                N, ncb = child._N, child.N_code_book
+                # the old radius grows by the shift of the key:
+                shift, radius = self.model.to_metric(
+                        [ self.model.distance_function(key, self._keys[i]), 
+                          self.model.distance_function(key, value) ])
+                if profile is not None:
+                    profile.count("distances", self._depth, 2)
+                self._radii[i] = max(self._radii[i] + shift, radius)
+                self._sum -= self._weight(self._Ns[i]) * self._keys[i].astype(float)
+                self._N += N - self._Ns[i]
+                self._ncb += ncb - self._ncbs[i]
+                self._keys[i] = key
+                # the sum and the norm of the stored key, which may be rounded:
+                key = self._keys[i].astype(float)
+                self._sum += self._weight(N) * key
+                self._norms[i] = numpy.dot(key, key)
+                self._Ns[i] = N
+                self._ncbs[i] = ncb
         else:
-            self.append(value, None, split)
+            self.append(value, row_id, split)
 
     
 class KTree(object):
@@ -302,8 +1102,12 @@ class KTree(object):
             self.options = KTreeOptions()
         # self.model provides all metric related functions:
         self.model = models.model(self.options)
+        if getattr(self.options, "profile", False):
+            self.model.profiler = profiler.Profiler()
         # root node of tree:
         self.root = self.new_root()
+        # the examples in insertion order, see insert():
+        self.window = collections.deque()
 
     def __str__(self):
         s = "KTree("
@@ -321,14 +1125,406 @@ class KTree(object):
         """Convenient property that returns this K-Tree's order.""" 
         return self.options.order
 
-    def insert(self, value, split=True):
-        """Insert value in KTree."""
-        self.root.insert(value, split)
+    def insert(self, value, split=True, row_id=-1):
+        """Insert value in KTree.  "row_id" identifies "value", e.g. its
+        index in a data set, and is returned by the nearest neighbor 
+        searches.  If options.window is positive and this KTree holds 
+        more than "window" inserted examples, the oldest example is
+        deleted.
+        """
+        profile = self.model.profiler
+        if profile is not None:
+            start = profiler.clock()
+        self.root.insert(value, split, row_id)
+        if profile is not None:
+            profile.stop("insert", start)
+        if getattr(self.options, "window", 0) > 0:
+            self.window.append((row_id, models.rows(value).copy()))
+            if len(self.window) > self.options.window:
+                self.delete(*self.window.popleft())
 
-    def nearest_neighbor(self, value):
-        """Find the nearest neighbor of "value" in this KTree."""
+    def delete(self, row_id, value=None):
+        """Delete the leaf with row ID "row_id" from this KTree.  The keys
+        along the leaf's path are updated, underfull nodes are merged, see
+        KNode.rebalance(), and a root with a single sub-node is replaced
+        by its sub-node.
+        Arguments:
+            * row_id:   the row ID of the leaf, see insert().
+            * value:    the leaf's example, if known.  The leaf is then
+                        searched in the sub-trees whose covering radius
+                        includes "value" only, otherwise all leaf nodes 
+                        are searched.
+        """
+        node, i = self._locate(row_id, value)
+        self._delete_leaf(node, i)
+
+    def _delete_leaf(self, node, i):
+        """Delete the i-th leaf of leaf node "node", see delete()."""
+        node._delete(i)
+        node.rebalance()
+        root = self.root
+        while not root.hold_leafs and len(root) == 1:
+            root = root._values[0]
+            root.parent = self
+            self.root = root
+        if not root.hold_leafs and len(root) == 0:
+            self.new_root()
+
+    def _locate(self, row_id, value):
+        """Returns the leaf node and the index of the leaf 
+        with row ID "row_id", see delete().
+        """
+        best = (numpy.inf, None, None)
+        if value is None:
+            nodes = self.root.walk()
+        else:
+            value = models.rows(value)
+            # the covering radii are subject to rounding errors, 
+            # search all leaf nodes if the leaf is not covered:
+            nodes = itertools.chain(self._covering_nodes(value), [ None ], self.root.walk())
+        for node in nodes:
+            if node is None:
+                if best[1] is not None:
+                    break
+                continue
+            if not node.hold_leafs or len(node) == 0:
+                continue
+            hits = numpy.nonzero(node.values() == row_id)[0]
+            if len(hits) and value is None:
+                return node, hits[0]
+            if len(hits):
+                dm = self.model.distance_matrix(value, node.keys()[hits])[0]
+                if numpy.min(dm) < best[0]:
+                    best = (numpy.min(dm), node, hits[numpy.argmin(dm)])
+        if best[1] is None:
+            raise KeyError("No leaf with row ID %s." % str(row_id))
+        return best[1], best[2]
+
+    def _covering_nodes(self, value):
+        """Yields the leaf nodes whose covering 
+        radius includes "value".
+        """
+        stack = [ self.root ]
+        while stack:
+            node = stack.pop()
+            if node.hold_leafs:
+                yield node
+            elif len(node):
+                dm = self.model.to_metric(node.distances(value)[0])
+                radii = node._radii[:len(node)]
+                # tolerate rounding errors of the incrementally updated radii:
+                covering = dm <= radii + 1e-9 * (1.0 + radii)
+                stack.extend(node.values()[covering])
+
+    def nearest_neighbor(self, value, return_id=False):
+        """Find the nearest neighbor of "value" in this KTree.
+        If "return_id" is True, return its row ID instead.
+        """
+        if return_id:
+            return self.nearest_neighbors(value)[1][0]
         return self.root.nearest_neighbor(value)
     
+    def nearest_neighbors(self, X):
+        """Find the nearest neighbors of all rows of "X" in this KTree.
+        The queries are routed down the tree level by level, i.e. each
+        node is visited once for all queries that are assigned to it.
+        Arguments:
+            * X:        a matrix of queries, one query per row.
+        Returns:
+            * vectors:   the nearest leaf of each query, one leaf per row.
+            * ids:       the row ID of each leaf, see insert().
+            * distances: the distance of each query to its nearest leaf.
+        Empty sub-trees are skipped, see KNode.descent_distances().
+        If this KTree is empty, the queries get NaN vectors, 
+        row ID -1, and an infinite distance.  For sparse queries, the 
+        vectors are a CSR matrix and the vectors of such queries are empty.
+        """
+        X = models.rows(X)
+        N = X.shape[0]
+        if models.issparse(X):
+            vectors = numpy.empty(N, dtype=object)
+        else:
+            vectors = numpy.empty(X.shape)
+            vectors.fill(numpy.nan)
+        ids = -numpy.ones(N, dtype=int)
+        distances = numpy.empty(N)
+        distances.fill(numpy.inf)
+        result = (vectors, ids, distances)
+        self.root.nearest_neighbors(X, numpy.arange(N), result)
+        if models.issparse(X):
+            empty = scipy.sparse.csr_matrix((1, X.shape[1]))
+            vectors = scipy.sparse.vstack([ empty if vector is None else vector 
+                                            for vector in vectors ], format="csr")
+        return vectors, ids, distances
+    
+    def bulk_load(self, keys, values=None, Ns=None):
+        """Replace this KTree's content with a height balanced tree that
+        is built top-down from the rows of "keys".  The items of each node
+        are partitioned into at most "order" groups with k-means, until
+        the groups fit into a single node.
+        Arguments:
+            * keys:     a matrix of keys, one key per row, may be sparse.
+            * values:   the value of each key, i.e. the row IDs of leafs
+                        (default: 0, 1, ...) or the roots of sub-trees of 
+                        equal depth.
+            * Ns:       the number of leafs in each sub-tree, 
+                        by default this is computed from "values".
+        """
+        n = keys.shape[0]
+        items = numpy.empty(n, dtype=object)
+        if values is None:
+            values = xrange(n)
+        for i, value in enumerate(values):
+            items[i] = value
+        if n == 0 or not isinstance(items[0], KNode):
+            Ns = numpy.ones(n, dtype=int)
+            ncbs = numpy.zeros(n, dtype=int)
+        else:
+            if Ns is None:
+                Ns = [ value.N for value in items ]
+            ncbs = numpy.array([ value.N_code_book for value in items ], dtype=int)
+        Ns = numpy.asarray(Ns, dtype=int)
+        height = 1
+        while self.order ** height < n:
+            height += 1
+        self.root = self._bulk_node(keys, items, Ns, ncbs, height)
+        self.root.parent = self
+
+    def merge(self, trees):
+        """Replace this KTree's content with the content of "trees".
+        The (non-empty) nodes that hold leafs are kept, the levels above
+        are rebuilt with bulk_load() from their centroids.
+        """
+        nodes = []
+        for k in trees:
+            if self.model.profiler is not None and k.model.profiler is not None:
+                self.model.profiler.update(k.model.profiler)
+            for node in k.root.walk():
+                # nodes of other processes may share IDs:
+                node.ID = next(_ids)
+                node.options = self.options
+                node.model = self.model
+                if node.hold_leafs and len(node):
+                    nodes.append(node)
+        keys = numpy.array([ node.centroid() for node in nodes ])
+        self.bulk_load(keys, nodes)
+
+    def parallel_reinsert(self, data, jobs):
+        """Insert the rows of "data" into this K-Tree's leaf nodes,
+        using "jobs" processes.  "data" is an array or a source, see 
+        module ktree.sources.  The rows of each chunk are assigned to 
+        their nearest leaf nodes first, the keys are updated and the
+        nodes that exceed the order are split after the last chunk.
+        """
+        nodes = [ node for node in self.root.walk() if node.hold_leafs ]
+        pool = multiprocessing.Pool(jobs, _init_reinsert_worker, (self,))
+        try:
+            offset = 0
+            for chunk in sources.chunks(data):
+                parts = sources.split(chunk, 4*jobs)
+                labels = numpy.concatenate(pool.map(_assign_leaf_nodes, parts))
+                rows = numpy.argsort(labels, kind="mergesort")
+                bounds = numpy.searchsorted(labels[rows], numpy.arange(len(nodes)+1))
+                for i, node in enumerate(nodes):
+                    members = rows[bounds[i]:bounds[i+1]]
+                    n = len(members)
+                    if n:
+                        node.extend(chunk[members], offset + members,
+                                    numpy.ones(n, dtype=int), numpy.zeros(n, dtype=int),
+                                    numpy.zeros(n))
+                offset += chunk.shape[0]
+        finally:
+            pool.close()
+            pool.join()
+        self.root.refresh()
+        self._split_overfull()
+
+    def _split_overfull(self):
+        """Split the nodes that hold more than "order" leafs until all
+        nodes fit, and update the keys.  As for the sequential re-insert
+        pass, a root that holds leafs is not split.
+        """
+        order = self.options.order
+        while True:
+            nodes = [ node for node in self.root.walk() 
+                      if len(node) > order and node is not self.root ]
+            if not nodes:
+                break
+            for node in nodes:
+                node.split()
+        self.root.refresh()
+
+    def _bulk_node(self, keys, values, Ns, ncbs, height):
+        """Build a (sub)tree of "height" levels of nodes for the given items."""
+        node = KNode(options=self.options, model=self.model)
+        n = keys.shape[0]
+        if n == 0:
+            return node
+        if height == 1:
+            radii = [ value.covering_radius(key) if isinstance(value, KNode) else 0.0
+                      for key, value in zip(keys, values) ]
+            node.extend(keys, values, Ns, ncbs, radii)
+            return node
+        capacity = self.order ** (height-1)
+        K = min(n, max(2, -(-n // capacity)))
+        labels = _partition(self.model, keys, Ns, K, capacity)
+        for k in xrange(K):
+            members = labels == k
+            child = self._bulk_node(keys[members], values[members], 
+                                    Ns[members], ncbs[members], height-1)
+            node.append(child.centroid(), child, split=False)
+        return node
+
+    def knn(self, query, k=1, mode="exact", beam_width=None):
+        """Find the "k" nearest leafs of "query" in this KTree.
+        Arguments:
+            * query:      a single example.
+            * k:          number of nearest neighbors, default 1.
+            * mode:       "exact" searches the tree best-first and skips
+                          sub-trees whose covering radius shows that they 
+                          cannot contain a nearer leaf.  "beam" descends 
+                          the tree level by level and follows the 
+                          "beam_width" nearest non-empty nodes only, which
+                          is faster but approximate.  Default is "exact".
+            * beam_width: number of nodes per level in "beam" mode, 
+                          default is k.
+        Returns:
+            * vectors:    the nearest leafs, nearest first, one leaf per row.
+            * ids:        the row ID of each leaf, see insert().
+            * distances:  the distance of "query" to each leaf.
+        """
+        query = models.rows(query)
+        model = self.model
+        # the best leafs so far (vectors, ids, distances, metric distances):
+        best = [ numpy.empty((0, query.shape[1])), numpy.empty(0, dtype=int), 
+                 numpy.empty(0), numpy.empty(0) ]
+        def add_leafs(node, dm):
+            candidates = [ node.keys(), node.values().astype(int), 
+                           dm, model.to_metric(dm) ]
+            for i, candidate in enumerate(candidates):
+                best[i] = _concatenate((best[i], candidate))
+            nearest = numpy.argsort(best[3], kind="mergesort")[:k]
+            for i in xrange(len(best)):
+                best[i] = best[i][nearest]
+        if mode == "exact":
+            # best-first search over (lower bound, counter, node):
+            heap = [ (0.0, 0, self.root) ]
+            counter = 1
+            while heap:
+                bound = best[3][-1] if len(best[3]) == k else numpy.inf
+                lower, _, node = heapq.heappop(heap)
+                if lower >= bound:
+                    break
+                if len(node) == 0:
+                    continue
+                dm = node.distances(query)[0]
+                if node.hold_leafs:
+                    add_leafs(node, dm)
+                    continue
+                lowers = numpy.maximum(model.to_metric(dm) - node._radii[:len(node)], lower)
+                for i in numpy.nonzero(lowers < bound)[0]:
+                    heapq.heappush(heap, (lowers[i], counter, node._values[i]))
+                    counter += 1
+        elif mode == "beam":
+            if beam_width is None:
+                beam_width = k
+            frontier = [ self.root ]
+            while frontier and not frontier[0].hold_leafs:
+                children = []
+                for node in frontier:
+                    dm = node.distances(query)[0]
+                    # empty sub-trees would take the place of leafs:
+                    children.extend(child for child in zip(dm, node.values()) if child[1].N > 0)
+                children.sort(key=lambda child: child[0])
+                frontier = [ node for dist, node in children[:beam_width] ]
+            for node in frontier:
+                if len(node):
+                    add_leafs(node, node.distances(query)[0])
+        else:
+            raise ValueError("Unknown search mode %s." % str(mode))
+        return best[0], best[1], best[2]
+
+    def _level_nodes(self, level):
+        """Returns the nodes that hold the keys of level "level",
+        in depth-first order, see codebook().
+        """
+        if not 0 <= level <= self.depth:
+            raise ValueError("Level must be in 0..%i, got %s." % (self.depth, str(level)))
+        nodes = [ self.root ]
+        while nodes[0].depth > level:
+            nodes = [ child for node in nodes for child in node.values() ]
+        return nodes
+
+    def codebook(self, level=1):
+        """Returns the prototypes of level "level" of this KTree.
+        Arguments:
+            * level:        counted bottom-up as for KNode.level(), i.e.
+                            0 for the leafs and 1 for the prototypes of 
+                            the nodes that hold leafs (default).
+        Returns:
+            * prototypes:   a matrix of prototypes, one prototype per row,
+                            in depth-first order.
+            * weights:      the number of leafs of each prototype.
+        """
+        nodes = [ node for node in self._level_nodes(level) if len(node) ]
+        if not nodes:
+            return numpy.empty((0, 0)), numpy.empty(0, dtype=int)
+        return (_concatenate([ node.keys() for node in nodes ]),
+                numpy.concatenate([ node.Ns for node in nodes ]))
+
+    def predict(self, X, level=1):
+        """Assign the rows of "X" to the prototypes of level "level".
+        The rows are routed down the tree together, see nearest_neighbors().
+        Arguments:
+            * X:        a matrix of examples, one example per row.
+            * level:    see codebook().
+        Returns:
+            * the row of the nearest prototype in codebook(level) for each
+              row of "X".  Prototypes of empty sub-trees are skipped, the 
+              rows get -1 if this KTree is empty.
+        """
+        X = models.rows(X)
+        labels = -numpy.ones(X.shape[0], dtype=int)
+        offsets = {}
+        offset = 0
+        for node in self._level_nodes(level):
+            offsets[id(node)] = offset
+            offset += len(node)
+        for node, rows in self.root.route(X, numpy.arange(X.shape[0]), level):
+            if node.N > 0:
+                dm = node.descent_distances(X[rows])
+                labels[rows] = offsets[id(node)] + numpy.argmin(dm, 1)
+        return labels
+
+    def encode(self, X):
+        """Encode the rows of "X" by their paths from the root to their
+        nearest leafs, i.e. KTree is used as tree-structured vector
+        quantizer.
+        Arguments:
+            * X:        a matrix of examples, one example per row.
+        Returns:
+            * a (len(X), depth+1) matrix of item indices: column 0 holds
+              the nearest item of the root, the last column the nearest
+              leaf of the node that holds leafs.  Empty sub-trees are 
+              skipped, the rows get -1 if this KTree is empty.
+        """
+        X = models.rows(X)
+        N = X.shape[0]
+        codes = -numpy.ones((N, self.depth+1), dtype=int)
+        groups = [ (self.root, numpy.arange(N)) ]
+        for j in xrange(self.depth+1):
+            children = []
+            for node, rows in groups:
+                if node.N == 0:
+                    continue
+                nearest = numpy.argmin(node.descent_distances(X[rows]), 1)
+                codes[rows, j] = nearest
+                if not node.hold_leafs:
+                    for i in numpy.unique(nearest):
+                        children.append((node._values[i], rows[nearest == i]))
+            groups = children
+        return codes
+
     def new_root(self):
         """Create and return a new root node."""
         self.root = KNode(parent=self, options=self.options, model=self.model)
@@ -336,8 +1532,103 @@ class KTree(object):
 
     def remove_leafs(self):
         """Remove all leafs from tree."""
+        self.window.clear()
         return self.root.remove_leafs()
 
+    def stats(self):
+        """Returns the instrumentation of this KTree as dict, see module
+        ktree.profiler:
+            * counters:   name -> list of counts per level, empty if
+                          options.profile is not set.
+            * timers:     name -> dict of "seconds" and "calls", empty if
+                          options.profile is not set.
+            * fill:       list of histograms per level, i.e. the number
+                          of nodes of each level with 0, 1, ... items.
+            * depth, N, N_code_book.
+        """
+        if self.model.profiler is None:
+            result = { "counters": {}, "timers": {} }
+        else:
+            result = self.model.profiler.stats()
+        fills = [ [] for level in xrange(self.depth+1) ]
+        for node in self.root.walk():
+            fills[node.depth].append(len(node))
+        result["fill"] = [ numpy.bincount(fill, minlength=self.order+1).tolist()
+                           for fill in fills ]
+        result["depth"] = self.depth
+        result["N"] = int(self.N)
+        result["N_code_book"] = int(self.N_code_book)
+        return result
+
+    def quality(self):
+        """Returns the quality of the code books of this KTree as dict.
+        The leafs and the prototypes of each level are gathered into
+        contiguous arrays once, the leafs of a prototype are a range of
+        rows of the leaf array in depth-first order.
+            * levels:   list of dicts per level, counted bottom-up as for
+                        codebook(), i.e. level 0 are the leafs:
+                - prototypes:   number of prototypes.
+                - distortion:   sum of the distances (of the model) between
+                                the leafs and their prototype of the level.
+                - rmse:         root of the mean squared euclidean distance
+                                between the leafs and their prototype.
+                - sizes:        number of leafs per prototype: "min", "max",
+                                "mean", "std", number of "empty" prototypes
+                                and "histogram", the number of prototypes
+                                with 1, 2-3, 4-7, ... leafs.
+                - balance:      "cv", std / mean, and "max_mean", max / mean,
+                                of the sizes.
+                - fill:         "factor", the mean number of items of the
+                                nodes that hold the prototypes divided by
+                                the order, and "histogram", the number of
+                                these nodes with 0, 1, ... items.
+            * depth, N, N_code_book.
+        """
+        nodes = [ [] for level in xrange(self.depth+1) ]
+        for node in self.root.walk():
+            nodes[node.depth].append(node)
+        leafs = [ node.keys() for node in nodes[0] if len(node) ]
+        if leafs:
+            X = _concatenate(leafs)
+        levels = []
+        for level, members in enumerate(nodes):
+            lengths = numpy.array([ len(node) for node in members ], dtype=int)
+            members = [ node for node in members if len(node) ]
+            distortion = sqsum = 0.0
+            if members:
+                sizes = numpy.concatenate([ node.Ns for node in members ])
+            else:
+                sizes = numpy.zeros(0, dtype=int)
+            if level > 0 and leafs:
+                prototypes = _concatenate([ node.keys() for node in members ])
+                labels = numpy.repeat(numpy.arange(len(sizes)), sizes)
+                for start in xrange(0, X.shape[0], sources.CHUNK_SIZE):
+                    rows = slice(start, start + sources.CHUNK_SIZE)
+                    P = prototypes[labels[rows]]
+                    distortion += numpy.sum(self.model.paired_distances(X[rows], P))
+                    sqsum += numpy.sum(models.paired_sqdistances(X[rows], P))
+            N = max(numpy.sum(sizes), 1)
+            mean = float(numpy.mean(sizes)) if len(sizes) else 0.0
+            std = float(numpy.std(sizes)) if len(sizes) else 0.0
+            # bin i counts the sizes in [2**i, 2**(i+1)):
+            exponents = numpy.frexp(sizes[sizes > 0])[1] - 1
+            levels.append({
+                "prototypes":   len(sizes),
+                "distortion":   float(distortion),
+                "rmse":         float(numpy.sqrt(sqsum / N)),
+                "sizes":        { "min": int(numpy.min(sizes)) if len(sizes) else 0,
+                                  "max": int(numpy.max(sizes)) if len(sizes) else 0,
+                                  "mean": mean, "std": std,
+                                  "empty": int(numpy.sum(sizes == 0)),
+                                  "histogram": numpy.bincount(exponents).tolist() },
+                "balance":      { "cv": std / mean if mean else 0.0,
+                                  "max_mean": float(numpy.max(sizes)) / mean if mean else 0.0 },
+                "fill":         { "factor": float(numpy.mean(lengths)) / self.order,
+                                  "histogram": numpy.bincount(lengths, minlength=self.order+1).tolist() },
+                })
+        return { "levels": levels, "depth": self.depth, "N": int(self.N),
+                 "N_code_book": int(self.N_code_book) }
+
     @property
     def depth(self):
         """Depth of KTree."""
@@ -350,7 +1641,12 @@ class KTree(object):
 
     @property
     def distrortion(self):
-        return self.root.distortion
+        """The distortion of the prototypes of the nodes that hold
+        leafs, see quality().
+        """
+        if self.depth == 0:
+            return self.root.distortion
+        return self.quality()["levels"][1]["distortion"]
 
     @property
     def N_code_book(self):
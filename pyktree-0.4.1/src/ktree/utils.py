@@ -27,15 +27,96 @@ This module provides some handy functions for use with K-Trees.
 
 import numpy
 import cPickle as pickle
+# the Python implementation, its Unpickler can be subclassed:
+import pickle as legacy_pickle
+
+import flat
+import trees
 
 def save_ktree(k, filename):
-    f = open(filename, "wb")
-    pickle.dump(k, f, -1)
-    f.close()
-
-def load_ktree(filename):
-    f = open(filename, "rb")
-    k = pickle.load(f)
-    f.close()
+    """Save KTree "k" to "filename" in the flat K-Tree file format,
+    see module ktree.flat.  K-Trees with sparse leafs are pickled.
+    """
+    if flat.has_sparse_leafs(k):
+        f = open(filename, "wb")
+        try:
+            pickle.dump(k, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        return
+    flat.save(k, filename)
+
+def load_ktree(filename, mmap=False):
+    """Load a K-Tree from "filename".
+    Arguments:
+        * filename:  a file written by save_ktree().
+        * mmap:      if True, return a read-only ktree.flat.FlatKTree 
+                     that answers queries directly from a memory map
+                     of the file.  Otherwise, return a KTree.
+    Pickled K-Trees of pyktree 0.4.1 and older are converted to the
+    current node layout, their leafs have the row ID -1.
+    """
+    if not flat.is_flat(filename):
+        f = open(filename, "rb")
+        try:
+            try:
+                return pickle.load(f)
+            except TypeError:
+                # the nodes of older K-Trees are lists, which are 
+                # unpickled with KNode.extend():
+                f.seek(0)
+                return _convert_legacy(_LegacyUnpickler(f).load())
+        finally:
+            f.close()
+    k = flat.load(filename, mmap)
+    if mmap:
+        return k
+    return k.to_ktree()
+
+
+
+class _LegacyKNode(list):
+    """A node of a pickled K-Tree of pyktree 0.4.1 and older, i.e. a list
+    of [key, value] pairs.  The values are sub-nodes or None for leafs.
+    """
+
+
+class _LegacyKTree(object):
+    """A pickled K-Tree of pyktree 0.4.1 and older."""
+
+
+class _LegacyUnpickler(legacy_pickle.Unpickler):
+    """Unpickles the KNodes and KTrees of a pickled K-Tree of pyktree
+    0.4.1 and older as _LegacyKNodes and _LegacyKTrees.
+    """
+
+    def find_class(self, module, name):
+        if module.split(".")[-1] == "trees":
+            if name == "KNode":
+                return _LegacyKNode
+            if name == "KTree":
+                return _LegacyKTree
+        return legacy_pickle.Unpickler.find_class(self, module, name)
+
+
+def _convert_legacy(old):
+    """Returns a KTree that holds the nodes of _LegacyKTree "old"."""
+    options = trees.KTreeOptions()
+    # options that did not exist keep their default values:
+    options.__dict__.update(old.options.__dict__)
+    k = trees.KTree(options=options)
+    k.root = _convert_legacy_node(old.root, k)
+    k.root.parent = k
     return k
 
+def _convert_legacy_node(old, k):
+    """Returns a KNode of KTree "k" that holds the items of _LegacyKNode "old"."""
+    node = trees.KNode(options=k.options, model=k.model)
+    for key, value in old:
+        if isinstance(value, _LegacyKNode):
+            value = _convert_legacy_node(value, k)
+        else:
+            # older K-Trees do not know the row IDs of their leafs:
+            value = -1
+        node.append(numpy.asarray(key, dtype=float), value, split=False)
+    return node
@@ -1,31 +1,46 @@
-import arcpy
+import logging
 import os
 import types
 
 from collections import defaultdict
+from backend_utils import getBackend
 from decorator_utils import logArgs, standardErrorLoggging
 
+logger = logging.getLogger('arc_utils')
+
 @standardErrorLoggging(logger=logger)
 def stripFieldValues(featureClass, stringFields):
-	with arcpy.da.UpdateCursor(featureClass, [stringFields]) as updateCursor:
+	with getBackend().updateCursor(featureClass, stringFields) as updateCursor:
 		for r in updateCursor:
+			stripped = False
 			for i, s in enumerate(stringFields):
 				if r[i] and not r[i] == r[i].strip():
 					r[i] = r[i].strip()
-					updateCursor.updateRow(r)
+					stripped = True
+			if stripped:
+				updateCursor.updateRow(r)
 
 @standardErrorLoggging(logger=logger)
-def summarizeArea(featureClass, where='1=1'):
+def summarizeArea(featureClass, where='1=1', vectorized=True):
+	'''
+	vectorized sums the areas of chunks of features with numpy, set it to False for the plain cursor loop.
+	'''
 	total_area = 0
-	with arcpy.da.SearchCursor(featureClass, ['SHAPE@AREA'], where) as cursor:
+	if vectorized:
+		for chunk in getBackend().searchArrays(featureClass, ['SHAPE@AREA'], where):
+			total_area += float(chunk['SHAPE@AREA'].filled(0).sum())
+		return total_area
+	with getBackend().searchCursor(featureClass, ['SHAPE@AREA'], where) as cursor:
 		for c in cursor:
-			total_area += c[0]
+			#features without geometry have no area, like in the vectorized sum:
+			if c[0] is not None:
+				total_area += c[0]
 	return total_area
 
 @standardErrorLoggging(logger=logger)
 def getUnionedFeatures(featureClass, where='1=1'):
 	union_polygon = None
-	with arcpy.da.SearchCursor(featureClass, ['SHAPE@'], where) as cursor:
+	with getBackend().searchCursor(featureClass, ['SHAPE@'], where) as cursor:
 		for c in cursor:
 			if not union_polygon:
 				union_polygon = c[0]
@@ -37,11 +52,10 @@ def getUnionedFeatures(featureClass, where='1=1'):
 def compareSchemas(featureClassOne, featureClassTwo):
 
 	#Just added this in because tool needed it...this is just a schema compare...
-	fieldnames = [f.name for f in arcpy.ListFields(featureClassOne)]
+	fieldnames = [f.name for f in getBackend().listFields(featureClassOne)]
 	sort_field = fieldnames[0]
 
-	compare_result = arcpy.TableCompare_management(featureClassOne, featureClassTwo, [sort_field], 'SCHEMA_ONLY')
-	return compare_result.getOutput(0)
+	return getBackend().tableCompare(featureClassOne, featureClassTwo, [sort_field], 'SCHEMA_ONLY')
 
 @standardErrorLoggging(logger=logger)
 def createStringIndex(inputFeatureClass, keyField, valueField, fields=None, keyFunction=None, valueFunction=None, where=None):
@@ -55,7 +69,7 @@ def createStringIndex(inputFeatureClass, keyField, valueField, fields=None, keyF
 		valueFunction = lambda row:row[1]
 		
 	index = {}
-	with arcpy.da.SearchCursor(inputFeatureClass, fields, where) as cursor:
+	with getBackend().searchCursor(inputFeatureClass, fields, where) as cursor:
 		for row in cursor:
 			index[keyFunction(row)] = valueFunction(row)
 	return index
@@ -77,7 +91,7 @@ def indexDictList(keyFunction, valueFunction, sourceDictList):
 @standardErrorLoggging(logger=logger)
 def getUniqueFieldValues(featureClass, fieldName, where=None, getValueFunction=None):
 	unique_values = []
-	with arcpy.da.SearchCursor(featureClass, [fieldName], where) as cursor:
+	with getBackend().searchCursor(featureClass, [fieldName], where) as cursor:
 		for r in cursor:
 			if getValueFunction:
 				unique_values.append(getValueFunction(r[0]))
@@ -89,15 +103,15 @@ def getUniqueFieldValues(featureClass, fieldName, where=None, getValueFunction=N
 @standardErrorLoggging(logger=logger)
 def createStringMembershipWhereClause(featureClass, fieldName, values):
 	where_membership = ','.join(["'{}'".format(v) for v in values])
-	return arcpy.AddFieldDelimiters(featureClass, fieldName) + " IN ({})".format(where_membership)
+	return getBackend().addFieldDelimiters(featureClass, fieldName) + " IN ({})".format(where_membership)
 
 @standardErrorLoggging(logger=logger)
 def createStringCompareWhereClause(featureClass, fieldName, value, operator='='):
-	return arcpy.AddFieldDelimiters(featureClass, fieldName) + " {} '{}'".format(operator, value)
+	return getBackend().addFieldDelimiters(featureClass, fieldName) + " {} '{}'".format(operator, value)
 
 @standardErrorLoggging(logger=logger)
 def assertFeatureCount(featureLayer, minimum=None, maximum=None, exactly=None):
-	count = int(arcpy.GetCount_management(featureLayer).getOutput(0))
+	count = getBackend().getCount(featureLayer)
 	if minimum and count < minimum:
 		raise Exception('ERROR: Layer {} must have at least {} features, but has {}.'.format(featureLayer, minimum, count))
 	elif maximum and count > maximum:
@@ -108,26 +122,29 @@ def assertFeatureCount(featureLayer, minimum=None, maximum=None, exactly=None):
 
 @standardErrorLoggging(logger=logger)
 def getFeatureCount(inputFeatureClass):
-	return int(arcpy.GetCount_management(inputFeatureClass).getOutput(0))
+	return getBackend().getCount(inputFeatureClass)
 
 @standardErrorLoggging(logger=logger)
 def cursorRowsAsDicts(cursor):
 	colnames = cursor.fields
 	for row in cursor:
-		arcpy.AddMessage(str(row))
+		getBackend().addMessage(str(row))
 
 		d = dict(zip(colnames, row))
-		arcpy.AddMessage(d)
+		getBackend().addMessage(d)
 		yield d
 
 @standardErrorLoggging(logger=logger)
-def getCursorCount(inputFeatureClass, fields, whereClause):
+def getCursorCount(inputFeatureClass, fields, whereClause, vectorized=True):
 	'''
 	very sad hack around getting the row count of a cursor
+	vectorized lets the backend count the rows (the fields do not change the count), set it to False for the plain cursor loop.
 	'''
+	if vectorized:
+		return getBackend().getCount(inputFeatureClass, whereClause)
 
 	count = 0
-	with arcpy.da.SearchCursor(inputFeatureClass, fields, whereClause) as cursor:
+	with getBackend().searchCursor(inputFeatureClass, fields, whereClause) as cursor:
 		for r in cursor:
 			count += 1
 	return count
@@ -138,38 +155,38 @@ def fixLeadingZeroFields(inputFeatureClass, fieldName, length):
 	temp_field = fieldName + '_temp'
 	
 	#Add in District Id Field
-	arcpy.AddField_management(inputFeatureClass, 
+	getBackend().addField(inputFeatureClass, 
 							  temp_field,
 							  "text", 
 							  length)
 	
 	calc_expression = "str(!" + fieldName + "!)" + ".zfill(" + str(length) +")" 
-	arcpy.CalculateField_management(inputFeatureClass, 
+	getBackend().calculateField(inputFeatureClass, 
 									fieldName + '_temp', 
 									calc_expression,
 									"PYTHON")
 	
-	arcpy.DeleteField_management(inputFeatureClass, [fieldName])
+	getBackend().deleteField(inputFeatureClass, [fieldName])
 	
 	#Add in District Id Field
-	arcpy.AddField_management(inputFeatureClass, 
+	getBackend().addField(inputFeatureClass, 
 							  fieldName,
 							  "text", 
 							  length)
 	
 	calc_expression = "!" + temp_field + "!" 
-	arcpy.CalculateField_management(inputFeatureClass, 
+	getBackend().calculateField(inputFeatureClass, 
 									fieldName, 
 									calc_expression,
 									"PYTHON")
 	
-	#arcpy.DeleteField_management(inputFeatureClass, [temp_field])
+	#getBackend().deleteField(inputFeatureClass, [temp_field])
 @logArgs(logger=logger) 
 @standardErrorLoggging(logger=logger)        
 def getCommonFieldNames(featureClasses):
 	common_names = []
 	for fc in featureClasses:
-		fields = arcpy.ListFields(fc)
+		fields = getBackend().listFields(fc)
 		names = [f.name for f in fields if f.editable]
 		common_names.append(set(names))
 		del fields
@@ -178,7 +195,7 @@ def getCommonFieldNames(featureClasses):
 @logArgs(logger=logger) 
 @standardErrorLoggging(logger=logger)        
 def hasField(inputFeatureClass, fieldName):
-	fields = arcpy.ListFields(inputFeatureClass)
+	fields = getBackend().listFields(inputFeatureClass)
 	names = [f.name for f in fields]
 	del fields
 	return fieldName in names
@@ -187,7 +204,7 @@ def hasField(inputFeatureClass, fieldName):
 def assertUniformProjections(featureClasses):
 	proj_matches = defaultdict(list)
 	for f in featureClasses:
-		proj_matches[arcpy.Describe(f).spatialReference.name].append(f)
+		proj_matches[getBackend().describe(f).spatialReference.name].append(f)
 
 	if len(proj_matches.keys()) > 1:
 		message = ''
@@ -201,7 +218,7 @@ def assertUniformGeometryType(featureClasses, shapeType=None):
 	error_message = ''
 	shape_type_matches = defaultdict(list)
 	for f in featureClasses:
-		actual_type = arcpy.Describe(f).shapeType
+		actual_type = getBackend().describe(f).shapeType
 		if shapeType and shapeType.lower() != actual_type.lower():
 			fail = True
 			error_message += 'n\tShape type mismatch {} is {} but should be {}'.format(f, actual_type, shapeType)
@@ -224,7 +241,7 @@ def assertFieldAttributeDomain(featureClass, fieldDomainLookup={}, where=None):
 	'''
 	fields = fieldDomainLookup.keys()
 	fieldErrors = defaultdict(list)
-	with arcpy.da.SearchCursor(inputFeatureClass, fields, where) as cursor:
+	with getBackend().searchCursor(inputFeatureClass, fields, where) as cursor:
 		for r in cursor:
 			for i,f in enumerate(fields):
 				val = r[i]
@@ -244,7 +261,7 @@ def assertFieldValuesExist(featureClass, fieldValuesLookup={}, where=None):
 			fields_verified[field][value] = False 
 
 	fields = fieldValuesLookup.keys()
-	with arcpy.da.SearchCursor(featureClass, fields, where) as cursor:
+	with getBackend().searchCursor(featureClass, fields, where) as cursor:
 		for r in cursor:
 			for i, f in enumerate(fields):
 				val = r[i]
@@ -270,7 +287,7 @@ def assertFields(featureClass, fieldNames):
 
 def assertExists(inputFeatureClasses):
 	for f in inputFeatureClasses:
-		if not arcpy.Exists(f):
+		if not getBackend().exists(f):
 			raise Exception('\n\n\t Feature class does not exist {}'.format(f))
 
 @logArgs(logger=logger) 
@@ -294,13 +311,13 @@ def transferField(fromFeatureClass, toFeatureClass, fieldName):
 	'''
 	Calls AddField based on field from other feature class
 	'''
-	inputFields = arcpy.ListFields(fromFeatureClass)
+	inputFields = getBackend().listFields(fromFeatureClass)
 	fieldFound = False
 	for f in inputFields:
 		if f.name.strip() == fieldName.strip():
 			fieldFound = True
-			arcpy.AddMessage(f.name + ' >>> ' + fieldName + ' >>> ' + str(f.name.strip() == fieldName.strip()))
-			arcpy.AddField_management(toFeatureClass, f.name, f.type, f.precision, f.scale, f.length, f.aliasName, f.isNullable, f.required, f.domain)
+			getBackend().addMessage(f.name + ' >>> ' + fieldName + ' >>> ' + str(f.name.strip() == fieldName.strip()))
+			getBackend().addField(toFeatureClass, f.name, f.type, f.precision, f.scale, f.length, f.aliasName, f.isNullable, f.required, f.domain)
 			return
 	
 	if not fieldFound:
@@ -312,18 +329,18 @@ def setupOutputFeatureClass(outputPath, template, geometryType=None, spatial_ref
 	'''
 	setting overwriteOutput to True will delete feature class if it already exists.
 	'''
-	if overwriteOutput and arcpy.Exists(outputPath):
-		arcpy.Delete_management(outputPath)
+	if overwriteOutput and getBackend().exists(outputPath):
+		getBackend().delete(outputPath)
 
 	if not geometryType:
-		geometryType = arcpy.Describe(template).shapeType.upper()
+		geometryType = getBackend().describe(template).shapeType.upper()
 
 	if not spatial_reference:
-		spatial_reference = arcpy.Describe(template).spatialReference
+		spatial_reference = getBackend().describe(template).spatialReference
 		
 	outLocation = os.path.split(outputPath)[0]
 	outName = os.path.split(outputPath)[1]
-	arcpy.CreateFeatureclass_management(outLocation, outName, geometryType, template, spatial_reference=spatial_reference)
+	getBackend().createFeatureclass(outLocation, outName, geometryType, template, spatial_reference)
 	return outputPath
 
 @logArgs(logger=logger)
@@ -331,9 +348,9 @@ def setupOutputFeatureClass(outputPath, template, geometryType=None, spatial_ref
 def translateAppend(targetFeatureClass, appendFeatureClass, where, fieldTranslations, outputFeatureClass):
 	import types
 	
-	arcpy.CopyFeatures_management(targetFeatureClass, outputFeatureClass)
-	insertCursor = arcpy.InsertCursor(outputFeatureClass)
-	appendRows = arcpy.SearchCursor(appendFeatureClass, where)
+	getBackend().copyFeatures(targetFeatureClass, outputFeatureClass)
+	insertCursor = getBackend().insertRows(outputFeatureClass)
+	appendRows = getBackend().searchRows(appendFeatureClass, where)
 	
 	for r in appendRows:
 		newRow = insertCursor.newRow() 
@@ -354,7 +371,7 @@ def translateAppend(targetFeatureClass, appendFeatureClass, where, fieldTranslat
 @logArgs(logger=logger)
 @standardErrorLoggging(logger=logger)  
 def mapRows(featureClass, where, functionList):
-	rows = arcpy.SearchCursor(featureClass, where)
+	rows = getBackend().searchRows(featureClass, where)
 	for r in rows:
 		for f in functionList:
 			f(r)
@@ -363,7 +380,7 @@ def mapRows(featureClass, where, functionList):
 @logArgs(logger=logger)
 @standardErrorLoggging(logger=logger)
 def mapRows2(featureClass, fields, where, functionList):
-	with arcpy.da.SearchCursor(featureClass, fields, where) as rows:
+	with getBackend().searchCursor(featureClass, fields, where) as rows:
 		for r in rows:
 			for f in functionList:
 				f(r)
@@ -374,7 +391,7 @@ def groupRows(inputFeatureClass, where, keyFunction, valueFunction):
 	from collections import defaultdict
 
 	groupings = defaultdict(list)
-	rows = arcpy.SearchCursor(inputFeatureClass, where)
+	rows = getBackend().searchRows(inputFeatureClass, where)
 	for r in rows:
 		groupings[keyFunction(r)].append(valueFunction(r))
 	del rows
@@ -385,7 +402,7 @@ def groupRows(inputFeatureClass, where, keyFunction, valueFunction):
 def groupRows2(inputFeatureClass, fields, where, keyFunction, valueFunction):
 	from collections import defaultdict
 	groupings = defaultdict(list)
-	with arcpy.da.SearchCursor(inputFeatureClass, fields, where) as cursor:
+	with getBackend().searchCursor(inputFeatureClass, fields, where) as cursor:
 		for r in cursor:
 			groupings[keyFunction(r)].append(valueFunction(r))
 	return groupings
@@ -398,7 +415,7 @@ def transposeRows(targetFeatureClass, outputFeatureClass):
 	fieldNamePredicates = []
 	deleteFields = []
 	
-	fields = arcpy.ListFields(targetFeatureClass)
+	fields = getBackend().listFields(targetFeatureClass)
 	for f in fields:
 		try:
 			lastNumber = int(f.name[-1])
@@ -416,10 +433,10 @@ def transposeRows(targetFeatureClass, outputFeatureClass):
 	
 	fieldNamePredicates = set(fieldNamePredicates) 
 	for p in fieldNamePredicates:
-		arcpy.AddField_management(outputFeatureClass, p, "text", "255")
+		getBackend().addField(outputFeatureClass, p, "text", "255")
 		
-	insertCursor = arcpy.InsertCursor(outputFeatureClass)
-	appendRows= arcpy.SearchCursor(targetFeatureClass)
+	insertCursor = getBackend().insertRows(outputFeatureClass)
+	appendRows= getBackend().searchRows(targetFeatureClass)
 	for r in appendRows:
 		for k,v in transposeItems.items():
 			idCheck = False
@@ -452,22 +469,41 @@ def transposeRows(targetFeatureClass, outputFeatureClass):
 	del appendRows
 	del insertCursor
 	
-	arcpy.DeleteField_management(outputFeatureClass, deleteFields)
+	getBackend().deleteField(outputFeatureClass, deleteFields)
 
 @standardErrorLoggging(logger=logger)
-def getNullCountsByField(inputFeautreClass):
-	counts = {}
-	fields = arcpy.ListFields(inputFeautreClass)
+def getNullCountsByField(inputFeautreClass, vectorized=True, byKind=False):
+	'''
+	counts the empty values of each field.
+	byKind returns the numbers of None, empty string and zero values of each field, {field: {'null': n, 'empty': n, 'zero': n}}, instead of their sum.
+	vectorized lets the backend count all fields in a single pass (see nullCounts()), set it to False for the plain cursor loop.
+	'''
+	fields = getBackend().listFields(inputFeautreClass)
 	names = [f.name for f in fields]
-	for n in names:
-		counts[n] = 0
-		
-	rows = arcpy.SearchCursor(inputFeautreClass)
-	for r in rows:
+
+	if vectorized:
+		kinds = getBackend().nullCounts(inputFeautreClass, names)
+	else:
+		kinds = {}
 		for n in names:
-			if not r.getValue(n):
-				counts[n] += 1
-	
+			kinds[n] = {'null': 0, 'empty': 0, 'zero': 0}
+		rows = getBackend().searchRows(inputFeautreClass)
+		for r in rows:
+			for n in names:
+				v = r.getValue(n)
+				if v is None:
+					kinds[n]['null'] += 1
+				elif isinstance(v, basestring):
+					if v == '':
+						kinds[n]['empty'] += 1
+				elif isinstance(v, (int, long, float)) and not isinstance(v, bool) and v == 0:
+					kinds[n]['zero'] += 1
+
+	if byKind:
+		return kinds
+	counts = {}
+	for n in names:
+		counts[n] = sum(kinds[n].values())
 	return counts
 	
 @logArgs(logger=logger)
@@ -492,7 +528,7 @@ def getSDEFeatureDatasetPath(connectionFile, sdePrefix, featureDataset=None):
 def filterFeatures(inputFeatureClass, outputFeatureClass, whereClause):   
 	
 	#Stupid hack for arcpy search cursor row count.
-	inputRows = arcpy.SearchCursor(inputFeatureClass, whereClause)
+	inputRows = getBackend().searchRows(inputFeatureClass, whereClause)
 	count = 0
 	for i in inputRows:
 		count+=1
@@ -504,8 +540,8 @@ def filterFeatures(inputFeatureClass, outputFeatureClass, whereClause):
 	
 	setupOutputFeatureClass(outputFeatureClass, inputFeatureClass)
 
-	inputRows = arcpy.SearchCursor(inputFeatureClass, whereClause)
-	outputRows = arcpy.InsertCursor(outputFeatureClass)
+	inputRows = getBackend().searchRows(inputFeatureClass, whereClause)
+	outputRows = getBackend().insertRows(outputFeatureClass)
 
 	for r in inputRows:
 		outputRows.insertRow(r)
@@ -515,7 +551,7 @@ def filterFeatures(inputFeatureClass, outputFeatureClass, whereClause):
 
 @standardErrorLoggging(logger=logger) 
 def getGeometryFieldName(featureClass):
-	return arcpy.Describe(featureClass).shapeFieldName
+	return getBackend().describe(featureClass).shapeFieldName
 
 @standardErrorLoggging(logger=logger)  
 def getNonGeometryFieldNames(featureClass):
@@ -523,7 +559,7 @@ def getNonGeometryFieldNames(featureClass):
 	Returns all fieldnames except for geometry fields
 	'''
 	fieldnames = []
-	fields = arcpy.ListFields(featureClass)
+	fields = getBackend().listFields(featureClass)
 	for f in fields:
 		if f.type != 'Geometry':
 			fieldnames.append(f.name)
@@ -531,26 +567,44 @@ def getNonGeometryFieldNames(featureClass):
 
 @logArgs(logger=logger)
 @standardErrorLoggging(logger=logger)  
-def getUniqueFieldValues(featureClass, fieldName, where=None, getValueFunction=None):
+def getUniqueFieldValues(featureClass, fieldName, where=None, getValueFunction=None, vectorized=True):
 	'''
 	Returns list of unique values for fieldName
+	Without getValueFunction, vectorized lets the backend count the values (see valueCounts()), set it to False for the plain cursor loop.
 	'''
+	if vectorized and not getValueFunction:
+		values, counts, nulls = getBackend().valueCounts(featureClass, fieldName, where)
+		unique_values = values.tolist()
+		if nulls:
+			unique_values.append(None)
+		return unique_values
+
 	unique_values = []
 	seen = set()
-	with arcpy.da.SearchCursor(featureClass, [fieldName], where) as cursor:
+	with getBackend().searchCursor(featureClass, [fieldName], where) as cursor:
 		for r in cursor:
 			val = getValueFunction and getValueFunction(r) or r[0]
 			seen.add(val)
 	return list(seen)
 
 
-def getDuplicateFieldValues(featureClass, fieldName, where=None, getValueFunction=None):
+def getDuplicateFieldValues(featureClass, fieldName, where=None, getValueFunction=None, vectorized=True):
 	'''
 	Returns list of duplicate values for fieldName
+	Without getValueFunction, vectorized lets the backend count the values (see valueCounts()), set it to False for the plain cursor loop.
+	The vectorized list is ordered by value instead of by feature.
 	'''
+	if vectorized and not getValueFunction:
+		values, counts, nulls = getBackend().valueCounts(featureClass, fieldName, where)
+		duplicates = counts > 1
+		duplicate_values = [None] * max(nulls - 1, 0)
+		for v, c in zip(values[duplicates].tolist(), counts[duplicates].tolist()):
+			duplicate_values.extend([v] * (c - 1))
+		return duplicate_values
+
 	duplicate_values = []
 	seen = set()
-	with arcpy.da.SearchCursor(featureClass, [fieldName], where) as cursor:
+	with getBackend().searchCursor(featureClass, [fieldName], where) as cursor:
 		for r in cursor:
 			val = getValueFunction and getValueFunction(r) or r[0]
 			if val in seen:
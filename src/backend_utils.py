@@ -0,0 +1,1136 @@
+'''
+Feature class backends for arc_utils.
+
+A backend provides the data access that arc_utils needs: cursors, schema
+(ListFields), Describe, counts and the few geoprocessing tools the helpers
+call.  ArcpyBackend delegates to arcpy.  SqliteBackend reads and writes
+SQLite databases and GeoPackages without ArcGIS, e.g. for tests and
+benchmarks on Linux or for bulk jobs.  Its feature classes are addressed
+like feature classes in a file geodatabase, i.e. as the path of the
+database followed by the table name:
+
+	setBackend(SqliteBackend())
+	getFeatureCount('/data/census.gpkg/tracts')
+
+getBackend() returns the backend that arc_utils uses, by default
+ArcpyBackend if arcpy can be imported and SqliteBackend otherwise.
+'''
+
+import itertools
+import logging
+import numbers
+import os
+import re
+import sqlite3
+import struct
+
+import numpy
+
+try:
+	import arcpy
+except ImportError:
+	arcpy = None
+
+#rows of the arrays of searchArrays():
+CHUNK_SIZE = 100000
+
+#the kinds of empty values of nullCounts():
+NULL_KINDS = ('null', 'empty', 'zero')
+
+#the values that ArcpyBackend.searchArrays() reads nulls as, by field type,
+#fields of other types are read with a cursor:
+ARCPY_NULL_VALUES = {
+	'SmallInteger': int(numpy.iinfo(numpy.int16).min),
+	'Integer': int(numpy.iinfo(numpy.int32).min),
+	'Single': float('nan'),
+	'Double': float('nan'),
+	'String': u'\uffff',
+	'GUID': u'\uffff',
+	'GlobalID': u'\uffff',
+}
+
+#the tokens of ArcpyBackend.searchArrays() that are read as numpy arrays:
+ARCPY_ARRAY_TOKENS = ('OID@', 'SHAPE@X', 'SHAPE@Y', 'SHAPE@Z', 'SHAPE@M', 'SHAPE@AREA', 'SHAPE@LENGTH')
+
+#Describe data types of ArcpyBackend.searchArrays() that have features:
+ARCPY_FEATURE_TYPES = ('FeatureClass', 'FeatureLayer', 'ShapeFile')
+
+_backend = None
+
+def getBackend():
+	'''
+	Returns the backend of arc_utils, see setBackend().
+	'''
+	global _backend
+	if _backend is None:
+		if arcpy is not None:
+			_backend = ArcpyBackend()
+		else:
+			_backend = SqliteBackend()
+	return _backend
+
+def setBackend(backend):
+	'''
+	Makes arc_utils use backend, e.g. a SqliteBackend.
+	'''
+	global _backend
+	_backend = backend
+
+def columnArray(values):
+	'''
+	Returns the values of a column as numpy array and the mask of its nulls.
+	The type of the array fits all values: integers become int64, integers
+	mixed with floats float64 and strings unicode arrays (nulls are 0 or
+	''), other values and mixes of strings and numbers stay Python objects.
+	'''
+	column = numpy.empty(len(values), dtype=object)
+	column[:] = values
+	mask = numpy.equal(column, None).astype(bool)
+	present = column[~mask]
+	if not len(present):
+		return numpy.zeros(len(values)), mask
+	types = set(map(type, present))
+	if all(issubclass(t, (bool, numpy.bool_)) for t in types):
+		dtype = bool
+	elif all(issubclass(t, numbers.Integral) for t in types):
+		dtype = numpy.int64
+	elif all(issubclass(t, numbers.Real) for t in types):
+		dtype = numpy.float64
+	elif all(issubclass(t, basestring) for t in types):
+		dtype = unicode
+	else:
+		return column, mask
+	try:
+		present = present.astype(dtype)
+	except (TypeError, ValueError, OverflowError, UnicodeError):
+		return column, mask
+	data = numpy.zeros(len(values), dtype=present.dtype)
+	data[~mask] = present
+	return data, mask
+
+def columnsArray(fields, columns):
+	'''
+	Returns columns (sequences of the values of fields) as masked
+	structured array.
+	'''
+	columns = [columnArray(values) for values in columns]
+	dtype = [(str(f), data.dtype) for f, (data, mask) in zip(fields, columns)]
+	size = len(columns[0][0])
+	data = numpy.empty(size, dtype=dtype)
+	mask = numpy.empty(size, dtype=[(name, bool) for name, t in dtype])
+	for (name, t), (values, nulls) in zip(dtype, columns):
+		data[name] = values
+		mask[name] = nulls
+	return numpy.ma.array(data, mask=mask)
+
+
+class FeatureClassBackend(object):
+	'''
+	The interface of the backends.  Cursors and tools follow arcpy:
+		searchCursor, updateCursor, insertCursor => arcpy.da cursors
+		searchRows, insertRows => the classic arcpy.SearchCursor and
+			arcpy.InsertCursor, i.e. rows with getValue()/setValue()
+		listFields, describe, getCount, exists, addFieldDelimiters
+		addField, deleteField, calculateField, delete, copyFeatures,
+			createFeatureclass, tableCompare, addMessage
+	searchArrays reads the rows of a cursor as numpy arrays, valueCounts and
+	nullCounts aggregate fields with them; backends may override these
+	with faster implementations.
+	'''
+
+	def searchArrays(self, featureClass, fields, where=None, chunkSize=CHUNK_SIZE):
+		'''
+		Yields the rows of searchCursor() as masked structured arrays of up
+		to chunkSize rows, like arcpy.da.FeatureClassToNumPyArray in chunks.
+		Nulls are masked, see columnArray().
+		'''
+		with self.searchCursor(featureClass, fields, where) as cursor:
+			rows = iter(cursor)
+			while True:
+				chunk = list(itertools.islice(rows, chunkSize))
+				if not chunk:
+					break
+				yield columnsArray(fields, zip(*chunk))
+
+	def valueCounts(self, featureClass, fieldName, where=None):
+		'''
+		Returns the distinct values of fieldName (an array, nulls excluded),
+		the number of rows of each value and the number of nulls.
+		'''
+		values = []
+		counts = []
+		nulls = 0
+		for chunk in self.searchArrays(featureClass, [fieldName], where):
+			column = chunk[fieldName]
+			mask = numpy.ma.getmaskarray(column)
+			nulls += int(mask.sum())
+			if not mask.all():
+				v, c = numpy.unique(column.data[~mask], return_counts=True)
+				values.append(v)
+				counts.append(c)
+		if not values:
+			return numpy.empty(0), numpy.empty(0, dtype=numpy.int64), nulls
+		try:
+			values = numpy.concatenate(values)
+		except (TypeError, ValueError):
+			values = numpy.concatenate([v.astype(object) for v in values])
+		values, inverse = numpy.unique(values, return_inverse=True)
+		counts = numpy.bincount(inverse.ravel(), weights=numpy.concatenate(counts))
+		return values, counts.astype(numpy.int64), nulls
+
+	def nullCounts(self, featureClass, fields, where=None):
+		'''
+		Returns a dict of the numbers of nulls, empty strings and zeros of
+		each field, {field: {'null': n, 'empty': n, 'zero': n}}, counted in
+		a single pass.
+		'''
+		counts = dict((f, dict.fromkeys(NULL_KINDS, 0)) for f in fields)
+		for chunk in self.searchArrays(featureClass, fields, where):
+			for f in fields:
+				column = chunk[str(f)]
+				nulls = numpy.ma.getmaskarray(column)
+				data = column.data
+				if data.dtype.kind == 'U':
+					empty = data == u''
+					zero = None
+				elif data.dtype.kind in 'iuf':
+					empty = None
+					zero = data == 0
+				elif data.dtype == object:
+					empty = numpy.equal(data, '').astype(bool)
+					zero = numpy.equal(data, 0).astype(bool)
+				else:
+					empty = zero = None
+				counts[f]['null'] += int(nulls.sum())
+				if empty is not None:
+					counts[f]['empty'] += int((empty & ~nulls).sum())
+				if zero is not None:
+					counts[f]['zero'] += int((zero & ~nulls).sum())
+		return counts
+
+	def searchCursor(self, featureClass, fields, where=None):
+		raise NotImplementedError
+
+	def updateCursor(self, featureClass, fields, where=None):
+		raise NotImplementedError
+
+	def insertCursor(self, featureClass, fields):
+		raise NotImplementedError
+
+	def searchRows(self, featureClass, where=None):
+		raise NotImplementedError
+
+	def insertRows(self, featureClass):
+		raise NotImplementedError
+
+	def listFields(self, featureClass):
+		raise NotImplementedError
+
+	def describe(self, featureClass):
+		raise NotImplementedError
+
+	def getCount(self, featureClass, where=None):
+		raise NotImplementedError
+
+	def exists(self, featureClass):
+		raise NotImplementedError
+
+	def addFieldDelimiters(self, featureClass, fieldName):
+		raise NotImplementedError
+
+	def addField(self, featureClass, fieldName, fieldType, precision=None, scale=None, length=None, alias=None, nullable=None, required=None, domain=None):
+		raise NotImplementedError
+
+	def deleteField(self, featureClass, fieldNames):
+		raise NotImplementedError
+
+	def calculateField(self, featureClass, fieldName, expression, expressionType='PYTHON'):
+		raise NotImplementedError
+
+	def delete(self, featureClass):
+		raise NotImplementedError
+
+	def copyFeatures(self, inputFeatureClass, outputFeatureClass):
+		raise NotImplementedError
+
+	def createFeatureclass(self, outLocation, outName, geometryType, template=None, spatialReference=None):
+		raise NotImplementedError
+
+	def tableCompare(self, featureClassOne, featureClassTwo, sortFields, compareType):
+		raise NotImplementedError
+
+	def addMessage(self, message):
+		raise NotImplementedError
+
+
+class ArcpyBackend(FeatureClassBackend):
+	'''
+	Feature classes of ArcGIS, delegates to arcpy.
+	'''
+
+	def __init__(self):
+		if arcpy is None:
+			raise ImportError('ArcpyBackend requires arcpy')
+
+	def searchCursor(self, featureClass, fields, where=None):
+		return arcpy.da.SearchCursor(featureClass, fields, where)
+
+	def updateCursor(self, featureClass, fields, where=None):
+		return arcpy.da.UpdateCursor(featureClass, fields, where)
+
+	def insertCursor(self, featureClass, fields):
+		return arcpy.da.InsertCursor(featureClass, fields)
+
+	def searchArrays(self, featureClass, fields, where=None, chunkSize=CHUNK_SIZE):
+		'''
+		Like FeatureClassBackend.searchArrays(), but reads the chunks with
+		arcpy.da.FeatureClassToNumPyArray (TableToNumPyArray for tables),
+		each chunk is a range of object IDs.  Nulls are read as the values
+		of ARCPY_NULL_VALUES, the rows that hold them are confirmed with an
+		IS NULL query.  valueCounts() and nullCounts() aggregate these
+		arrays.  Fields of other types and other tokens, e.g. Date fields
+		or SHAPE@, are read with a cursor over the same range of object IDs
+		and joined to the arrays by their object IDs.
+		'''
+		nullValues, cursorFields = self._nullValues(featureClass, fields)
+		arrayFields = [f for f in fields if f not in cursorFields]
+		if not arrayFields:
+			for chunk in FeatureClassBackend.searchArrays(self, featureClass, fields, where, chunkSize):
+				yield chunk
+			return
+		description = arcpy.Describe(featureClass)
+		if description.dataType in ARCPY_FEATURE_TYPES:
+			toNumPyArray = arcpy.da.FeatureClassToNumPyArray
+		else:
+			toNumPyArray = arcpy.da.TableToNumPyArray
+		oidField = arcpy.AddFieldDelimiters(featureClass, description.OIDFieldName)
+		readFields = list(arrayFields)
+		if 'OID@' not in readFields:
+			readFields.append('OID@')
+		oids = numpy.sort(toNumPyArray(featureClass, ['OID@'], where_clause=where)['OID@'])
+		for start in xrange(0, len(oids), chunkSize):
+			last = oids[min(start + chunkSize, len(oids)) - 1]
+			chunkWhere = '{0} >= {1} AND {0} <= {2}'.format(oidField, oids[start], last)
+			if where:
+				chunkWhere = '({}) AND {}'.format(where, chunkWhere)
+			array = toNumPyArray(featureClass, readFields, where_clause=chunkWhere, null_value=nullValues or None)
+			columns = dict((f, (array[str(f)], None)) for f in arrayFields)
+			if cursorFields:
+				columns.update(self._cursorColumns(featureClass, cursorFields, chunkWhere, array['OID@']))
+			dtype = [(str(f), columns[f][0].dtype) for f in fields]
+			data = numpy.empty(len(array), dtype=dtype)
+			mask = numpy.zeros(len(array), dtype=[(name, bool) for name, t in dtype])
+			for f in fields:
+				name = str(f)
+				column = data[name]
+				values, nulls = columns[f]
+				column[:] = values
+				if nulls is not None:
+					mask[name] = nulls
+				if f not in nullValues:
+					continue
+				value = nullValues[f]
+				if value != value:
+					candidates = numpy.isnan(column)
+				else:
+					candidates = column == value
+				if candidates.any():
+					nullWhere = '({}) AND {} IS NULL'.format(chunkWhere, arcpy.AddFieldDelimiters(featureClass, f))
+					nullOids = toNumPyArray(featureClass, ['OID@'], where_clause=nullWhere)['OID@']
+					nulls = candidates & _isIn(array['OID@'], nullOids)
+					#like columnArray(), nulls are 0 or '':
+					column[nulls] = column.dtype.type()
+					mask[name] = nulls
+			yield numpy.ma.array(data, mask=mask)
+
+	def _nullValues(self, featureClass, fields):
+		'''
+		Returns the null_value dict of searchArrays(), the value of each
+		nullable field, and the fields that can not be read as numpy
+		arrays, i.e. that searchArrays() reads with a cursor.
+		'''
+		types = dict((f.name.lower(), (f.type, f.isNullable)) for f in arcpy.ListFields(featureClass))
+		nullValues = {}
+		cursorFields = []
+		for f in fields:
+			if f in ARCPY_ARRAY_TOKENS:
+				continue
+			fieldType, nullable = types.get(f.lower(), (None, False))
+			if fieldType == 'OID':
+				continue
+			if fieldType not in ARCPY_NULL_VALUES:
+				cursorFields.append(f)
+			elif nullable:
+				nullValues[f] = ARCPY_NULL_VALUES[fieldType]
+		return nullValues, cursorFields
+
+	def _cursorColumns(self, featureClass, fields, where, oids):
+		'''
+		Reads fields with a cursor, returns a dict of their columns and
+		masks (see columnArray()) in the order of the object IDs oids.
+		'''
+		with arcpy.da.SearchCursor(featureClass, ['OID@'] + list(fields), where) as cursor:
+			rows = list(cursor)
+		order = numpy.argsort(oids)
+		positions = order[numpy.searchsorted(oids, [r[0] for r in rows], sorter=order)]
+		columns = {}
+		for i, f in enumerate(fields, 1):
+			values = [None] * len(oids)
+			for position, r in itertools.izip(positions, rows):
+				values[position] = r[i]
+			columns[f] = columnArray(values)
+		return columns
+
+	def searchRows(self, featureClass, where=None):
+		return arcpy.SearchCursor(featureClass, where)
+
+	def insertRows(self, featureClass):
+		return arcpy.InsertCursor(featureClass)
+
+	def listFields(self, featureClass):
+		return arcpy.ListFields(featureClass)
+
+	def describe(self, featureClass):
+		return arcpy.Describe(featureClass)
+
+	def getCount(self, featureClass, where=None):
+		if not where:
+			return int(arcpy.GetCount_management(featureClass).getOutput(0))
+		return len(arcpy.da.TableToNumPyArray(featureClass, ['OID@'], where))
+
+	def exists(self, featureClass):
+		return arcpy.Exists(featureClass)
+
+	def addFieldDelimiters(self, featureClass, fieldName):
+		return arcpy.AddFieldDelimiters(featureClass, fieldName)
+
+	def addField(self, featureClass, fieldName, fieldType, precision=None, scale=None, length=None, alias=None, nullable=None, required=None, domain=None):
+		return arcpy.AddField_management(featureClass, fieldName, fieldType, precision, scale, length, alias, nullable, required, domain)
+
+	def deleteField(self, featureClass, fieldNames):
+		return arcpy.DeleteField_management(featureClass, fieldNames)
+
+	def calculateField(self, featureClass, fieldName, expression, expressionType='PYTHON'):
+		return arcpy.CalculateField_management(featureClass, fieldName, expression, expressionType)
+
+	def delete(self, featureClass):
+		return arcpy.Delete_management(featureClass)
+
+	def copyFeatures(self, inputFeatureClass, outputFeatureClass):
+		return arcpy.CopyFeatures_management(inputFeatureClass, outputFeatureClass)
+
+	def createFeatureclass(self, outLocation, outName, geometryType, template=None, spatialReference=None):
+		return arcpy.CreateFeatureclass_management(outLocation, outName, geometryType, template, spatial_reference=spatialReference)
+
+	def tableCompare(self, featureClassOne, featureClassTwo, sortFields, compareType):
+		return arcpy.TableCompare_management(featureClassOne, featureClassTwo, sortFields, compareType).getOutput(0)
+
+	def addMessage(self, message):
+		arcpy.AddMessage(message)
+
+def _isIn(values, members):
+	'''
+	Returns a boolean array, which values are in members (like numpy.isin,
+	which older numpy versions lack).
+	'''
+	members = numpy.sort(members)
+	positions = numpy.searchsorted(members, values)
+	found = positions < len(members)
+	found[found] = members[positions[found]] == values[found]
+	return found
+
+
+#SQLite/GeoPackage backend...
+
+DATABASE_EXTENSIONS = ('.gpkg', '.sqlite', '.sqlite3', '.db')
+
+#rows fetched from SQLite at once:
+FETCH_SIZE = 10000
+
+#ListFields types of declared SQLite column types, see _fieldType():
+FIELD_TYPES = [
+	('SMALLINT', 'SmallInteger'), ('TINYINT', 'SmallInteger'), ('INT', 'Integer'),
+	('REAL', 'Double'), ('DOUBLE', 'Double'), ('FLOAT', 'Double'), ('NUMERIC', 'Double'),
+	('DATE', 'Date'), ('BLOB', 'Blob'), ('TEXT', 'String'), ('CHAR', 'String'),
+]
+
+#SQLite column types for AddField types:
+COLUMN_TYPES = {
+	'TEXT': 'TEXT', 'STRING': 'TEXT', 'SHORT': 'SMALLINT', 'SMALLINTEGER': 'SMALLINT',
+	'LONG': 'INTEGER', 'INTEGER': 'INTEGER', 'FLOAT': 'REAL', 'SINGLE': 'REAL',
+	'DOUBLE': 'DOUBLE', 'DATE': 'DATETIME', 'BLOB': 'BLOB',
+}
+
+#Describe shape types of GeoPackage geometry types:
+SHAPE_TYPES = {
+	'POINT': 'Point', 'MULTIPOINT': 'Multipoint', 'LINESTRING': 'Polyline',
+	'MULTILINESTRING': 'Polyline', 'CURVE': 'Polyline', 'MULTICURVE': 'Polyline',
+	'POLYGON': 'Polygon', 'MULTIPOLYGON': 'Polygon', 'SURFACE': 'Polygon',
+	'MULTISURFACE': 'Polygon', 'GEOMETRY': 'Geometry', 'GEOMETRYCOLLECTION': 'Geometry',
+}
+
+#fields aggregated per SELECT by SqliteBackend.nullCounts(), 3 columns each:
+NULL_COUNT_FIELDS = 500
+
+#cursor tokens that SqliteBackend computes from the geometry:
+GEOMETRY_TOKENS = ('SHAPE@AREA', 'SHAPE@LENGTH', 'SHAPE@WKB')
+
+
+class Field(object):
+	'''
+	The properties of a field, like the fields of arcpy.ListFields().
+	'''
+
+	def __init__(self, name, type, length=0, precision=0, scale=0, isNullable=True, required=False, editable=True, aliasName=None, domain=''):
+		self.name = name
+		self.type = type
+		self.length = length
+		self.precision = precision
+		self.scale = scale
+		self.isNullable = isNullable
+		self.required = required
+		self.editable = editable
+		self.aliasName = aliasName or name
+		self.domain = domain
+		self.baseName = name
+
+	def __repr__(self):
+		return 'Field({}, {})'.format(self.name, self.type)
+
+
+class SpatialReference(object):
+
+	def __init__(self, name, factoryCode=0):
+		self.name = name
+		self.factoryCode = factoryCode
+
+
+class Description(object):
+	'''
+	The properties of a table or feature class, like arcpy.Describe().
+	'''
+
+	def __init__(self, **properties):
+		self.__dict__.update(properties)
+
+
+class Row(object):
+	'''
+	A row of the classic cursors, see SqliteBackend.searchRows().
+	'''
+
+	def __init__(self, values=None):
+		self._values = dict((k.lower(), (k, v)) for k, v in (values or {}).items())
+
+	def getValue(self, fieldName):
+		return self._values[fieldName.lower()][1]
+
+	def setValue(self, fieldName, value):
+		self._values[fieldName.lower()] = (fieldName, value)
+
+	def setNull(self, fieldName):
+		self.setValue(fieldName, None)
+
+	def isNull(self, fieldName):
+		return self.getValue(fieldName) is None
+
+	def items(self):
+		return self._values.values()
+
+
+def _quote(name):
+	return '"' + name.replace('"', '""') + '"'
+
+def _fieldType(declaredType):
+	'''
+	Returns the ListFields type and the length of a SQLite column type.
+	'''
+	declaredType = (declaredType or '').upper()
+	match = re.search(r'\((\d+)', declaredType)
+	length = int(match.group(1)) if match else 0
+	for key, fieldType in FIELD_TYPES:
+		if key in declaredType:
+			return fieldType, length
+	return 'String', length
+
+
+class _SqliteCursor(object):
+	'''
+	Base of the cursors of SqliteBackend, closes itself like the arcpy.da
+	cursors at the end of a with block.
+	'''
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		pass
+
+
+class SqliteSearchCursor(_SqliteCursor):
+	'''
+	Yields a tuple of the values of fields for each row, like
+	arcpy.da.SearchCursor.  The rows are fetched FETCH_SIZE at a time.
+	'''
+
+	def __init__(self, backend, featureClass, fields, where=None):
+		self.fields = tuple(fields)
+		self._backend = backend
+		self._featureClass = featureClass
+		self._where = where
+
+	def __iter__(self):
+		cursor, convert = self._backend._select(self._featureClass, self.fields, self._where)
+		while True:
+			rows = cursor.fetchmany(FETCH_SIZE)
+			if not rows:
+				break
+			for row in rows:
+				if convert:
+					row = tuple(f(v) if f else v for f, v in zip(convert, row))
+				yield row
+
+	def reset(self):
+		pass
+
+
+class SqliteUpdateCursor(_SqliteCursor):
+	'''
+	Yields a list of the values of fields for each row, like
+	arcpy.da.UpdateCursor.  Rows are written with updateRow() and removed
+	with deleteRow().  The rows are fetched in rowid order, FETCH_SIZE at a
+	time, so that updates do not disturb the iteration.
+	'''
+
+	def __init__(self, backend, featureClass, fields, where=None):
+		self.fields = tuple(fields)
+		self._backend = backend
+		self._featureClass = featureClass
+		self._where = where
+		self._rowid = None
+		for f in self.fields:
+			if f.upper() in GEOMETRY_TOKENS or f.upper() == 'SHAPE@':
+				raise NotImplementedError('SqliteBackend can not update geometries ({})'.format(f))
+
+	def __iter__(self):
+		backend = self._backend
+		connection, table = backend._open(self._featureClass)
+		columns, convert = backend._columns(self._featureClass, self.fields)
+		sql = 'SELECT rowid, {} FROM {} WHERE rowid > ?'.format(', '.join(columns), _quote(table))
+		if self._where:
+			sql += ' AND (' + self._where + ')'
+		sql += ' ORDER BY rowid LIMIT {}'.format(FETCH_SIZE)
+		last = -2**63
+		while True:
+			rows = connection.execute(sql, (last,)).fetchall()
+			if not rows:
+				break
+			for row in rows:
+				self._rowid = last = row[0]
+				yield list(row[1:])
+		self._rowid = None
+
+	def updateRow(self, row):
+		connection, table = self._backend._open(self._featureClass)
+		columns, convert = self._backend._columns(self._featureClass, self.fields)
+		assignments = ', '.join('{} = ?'.format(c) for c in columns)
+		connection.execute('UPDATE {} SET {} WHERE rowid = ?'.format(_quote(table), assignments), list(row) + [self._rowid])
+
+	def deleteRow(self):
+		connection, table = self._backend._open(self._featureClass)
+		connection.execute('DELETE FROM {} WHERE rowid = ?'.format(_quote(table)), (self._rowid,))
+
+	def close(self):
+		self._backend._open(self._featureClass)[0].commit()
+
+
+class SqliteInsertCursor(_SqliteCursor):
+	'''
+	Inserts rows of values of fields, like arcpy.da.InsertCursor.
+	'''
+
+	def __init__(self, backend, featureClass, fields):
+		self.fields = tuple(fields)
+		self._backend = backend
+		self._featureClass = featureClass
+		for f in self.fields:
+			if '@' in f:
+				raise NotImplementedError('SqliteBackend can not insert {}'.format(f))
+
+	def insertRow(self, row):
+		connection, table = self._backend._open(self._featureClass)
+		if not self.fields:
+			return connection.execute('INSERT INTO {} DEFAULT VALUES'.format(_quote(table))).lastrowid
+		sql = 'INSERT INTO {} ({}) VALUES ({})'.format(_quote(table), ', '.join(_quote(f) for f in self.fields), ', '.join('?' * len(self.fields)))
+		return connection.execute(sql, list(row)).lastrowid
+
+	def close(self):
+		self._backend._open(self._featureClass)[0].commit()
+
+
+class SqliteInsertRows(_SqliteCursor):
+	'''
+	Inserts Rows, like the classic arcpy.InsertCursor.  Values of fields
+	that the feature class does not have and object IDs are skipped.
+	'''
+
+	def __init__(self, backend, featureClass):
+		self._backend = backend
+		self._featureClass = featureClass
+		fields = backend.listFields(featureClass)
+		self._names = dict((f.name.lower(), f.name) for f in fields if f.type != 'OID')
+
+	def newRow(self):
+		return Row()
+
+	def insertRow(self, row):
+		values = [(self._names[k.lower()], v) for k, v in row.items() if k.lower() in self._names]
+		fields = [k for k, v in values]
+		SqliteInsertCursor(self._backend, self._featureClass, fields).insertRow([v for k, v in values])
+
+	def close(self):
+		self._backend._open(self._featureClass)[0].commit()
+
+	def __del__(self):
+		try:
+			self.close()
+		except Exception:
+			pass
+
+
+class SqliteBackend(FeatureClassBackend):
+	'''
+	Tables of SQLite databases and feature classes of GeoPackages, see the
+	module documentation.  Cursors compute the tokens OID@, SHAPE@AREA,
+	SHAPE@LENGTH and SHAPE@WKB (planar, in the units of the coordinates)
+	from GeoPackage geometries; geometry objects (SHAPE@) require arcpy.
+	Where clauses are SQLite expressions, which covers the usual
+	attribute queries of arcpy.
+	'''
+
+	def __init__(self):
+		self._connections = {}
+
+	def _split(self, featureClass):
+		'''
+		Returns the database path and the table name of featureClass.
+		'''
+		path = os.path.normpath(featureClass)
+		head, table = os.path.split(path)
+		if not head.lower().endswith(DATABASE_EXTENSIONS) or not table:
+			raise ValueError('{} is not a table of a SQLite database or GeoPackage'.format(featureClass))
+		return head, table
+
+	def _connect(self, database):
+		connection = self._connections.get(database)
+		if connection is None:
+			connection = sqlite3.connect(database)
+			self._connections[database] = connection
+		return connection
+
+	def _open(self, featureClass):
+		'''
+		Returns the connection of featureClass' database and its table name.
+		'''
+		database, table = self._split(featureClass)
+		if not os.path.exists(database):
+			raise ValueError('Database does not exist {}'.format(database))
+		return self._connect(database), table
+
+	def _hasTable(self, connection, table):
+		row = connection.execute("SELECT count(*) FROM sqlite_master WHERE type IN ('table', 'view') AND lower(name) = lower(?)", (table,)).fetchone()
+		return row[0] > 0
+
+	def _geometryColumn(self, connection, table):
+		'''
+		Returns (column, geometry type, srs id) of a GeoPackage feature class
+		or None.
+		'''
+		if not self._hasTable(connection, 'gpkg_geometry_columns'):
+			return None
+		return connection.execute('SELECT column_name, geometry_type_name, srs_id FROM gpkg_geometry_columns WHERE lower(table_name) = lower(?)', (table,)).fetchone()
+
+	def _tableInfo(self, connection, table):
+		return connection.execute('PRAGMA table_info({})'.format(_quote(table))).fetchall()
+
+	def _oidColumn(self, connection, table):
+		for cid, name, declaredType, notNull, default, pk in self._tableInfo(connection, table):
+			if pk and 'INT' in (declaredType or '').upper():
+				return name
+		return None
+
+	def _columns(self, featureClass, fields):
+		'''
+		Returns the SQL expressions of fields and the functions that
+		convert their values (None for plain columns).
+		'''
+		connection, table = self._open(featureClass)
+		columns = []
+		convert = []
+		for f in fields:
+			token = f.upper()
+			if token == 'OID@':
+				columns.append(_quote(self._oidColumn(connection, table) or 'rowid'))
+				convert.append(None)
+			elif token in GEOMETRY_TOKENS:
+				geometry = self._geometryColumn(connection, table)
+				if geometry is None:
+					raise ValueError('{} has no geometry for {}'.format(featureClass, f))
+				columns.append(_quote(geometry[0]))
+				convert.append(GEOMETRY_FUNCTIONS[token])
+			elif token == 'SHAPE@' or token.startswith('SHAPE@'):
+				raise NotImplementedError('SqliteBackend does not support {}, please use arcpy'.format(f))
+			else:
+				columns.append(_quote(f))
+				convert.append(None)
+		if not any(convert):
+			convert = None
+		return columns, convert
+
+	def _select(self, featureClass, fields, where=None):
+		'''
+		Returns a SQLite cursor of the columns of fields and their
+		conversions, see _columns().
+		'''
+		connection, table = self._open(featureClass)
+		columns, convert = self._columns(featureClass, fields)
+		sql = 'SELECT {} FROM {}'.format(', '.join(columns), _quote(table))
+		if where:
+			sql += ' WHERE ' + where
+		return connection.execute(sql), convert
+
+	def searchCursor(self, featureClass, fields, where=None):
+		return SqliteSearchCursor(self, featureClass, fields, where)
+
+	def searchArrays(self, featureClass, fields, where=None, chunkSize=CHUNK_SIZE):
+		'''
+		Like FeatureClassBackend.searchArrays(), but fetches the chunks
+		from SQLite directly and converts whole columns.
+		'''
+		cursor, convert = self._select(featureClass, fields, where)
+		while True:
+			rows = cursor.fetchmany(chunkSize)
+			if not rows:
+				break
+			columns = zip(*rows)
+			if convert:
+				columns = [map(f, values) if f else values for f, values in zip(convert, columns)]
+			yield columnsArray(fields, columns)
+
+	def valueCounts(self, featureClass, fieldName, where=None):
+		'''
+		Like FeatureClassBackend.valueCounts(), but SQLite groups the values.
+		'''
+		columns, convert = self._columns(featureClass, [fieldName])
+		if convert:
+			return FeatureClassBackend.valueCounts(self, featureClass, fieldName, where)
+		connection, table = self._open(featureClass)
+		sql = 'SELECT {0}, count(*) FROM {1}'.format(columns[0], _quote(table))
+		if where:
+			sql += ' WHERE ' + where
+		sql += ' GROUP BY {}'.format(columns[0])
+		rows = connection.execute(sql).fetchall()
+		nulls = sum(c for v, c in rows if v is None)
+		rows = [r for r in rows if r[0] is not None]
+		values = columnArray([v for v, c in rows])[0]
+		return values, numpy.array([c for v, c in rows], dtype=numpy.int64), nulls
+
+	def nullCounts(self, featureClass, fields, where=None):
+		'''
+		Like FeatureClassBackend.nullCounts(), but SQLite counts, i.e. the
+		values are not fetched.  Up to NULL_COUNT_FIELDS fields are counted
+		per scan of the table.
+		'''
+		connection, table = self._open(featureClass)
+		counts = {}
+		for i in xrange(0, len(fields), NULL_COUNT_FIELDS):
+			group = fields[i:i+NULL_COUNT_FIELDS]
+			columns, convert = self._columns(featureClass, group)
+			if convert:
+				raise NotImplementedError('SqliteBackend can not count nulls of geometry tokens')
+			aggregates = []
+			for c in columns:
+				aggregates.append('count(*) - count({})'.format(c))
+				aggregates.append("count(CASE WHEN {0} = '' AND typeof({0}) = 'text' THEN 1 END)".format(c))
+				aggregates.append("count(CASE WHEN {0} = 0 AND typeof({0}) IN ('integer', 'real') THEN 1 END)".format(c))
+			sql = 'SELECT {} FROM {}'.format(', '.join(aggregates), _quote(table))
+			if where:
+				sql += ' WHERE ' + where
+			row = connection.execute(sql).fetchone()
+			for j, f in enumerate(group):
+				counts[f] = dict(zip(NULL_KINDS, row[3*j:3*j+3]))
+		return counts
+
+	def updateCursor(self, featureClass, fields, where=None):
+		return SqliteUpdateCursor(self, featureClass, fields, where)
+
+	def insertCursor(self, featureClass, fields):
+		return SqliteInsertCursor(self, featureClass, fields)
+
+	def searchRows(self, featureClass, where=None):
+		names = [f.name for f in self.listFields(featureClass)]
+		for values in self.searchCursor(featureClass, names, where):
+			yield Row(dict(zip(names, values)))
+
+	def insertRows(self, featureClass):
+		return SqliteInsertRows(self, featureClass)
+
+	def listFields(self, featureClass):
+		connection, table = self._open(featureClass)
+		geometry = self._geometryColumn(connection, table)
+		fields = []
+		for cid, name, declaredType, notNull, default, pk in self._tableInfo(connection, table):
+			fieldType, length = _fieldType(declaredType)
+			if pk and 'INT' in (declaredType or '').upper():
+				fieldType = 'OID'
+			elif geometry and name.lower() == geometry[0].lower():
+				fieldType = 'Geometry'
+			oid = fieldType == 'OID'
+			fields.append(Field(name, fieldType, length=length, isNullable=not (notNull or oid), required=oid or fieldType == 'Geometry', editable=not oid))
+		if not fields:
+			raise ValueError('Table does not exist {}'.format(featureClass))
+		return fields
+
+	def describe(self, featureClass):
+		connection, table = self._open(featureClass)
+		fields = self.listFields(featureClass)
+		geometry = self._geometryColumn(connection, table)
+		properties = dict(
+			name=table,
+			baseName=table,
+			catalogPath=featureClass,
+			path=self._split(featureClass)[0],
+			dataType='Table',
+			fields=fields,
+			hasOID=any(f.type == 'OID' for f in fields),
+			OIDFieldName=self._oidColumn(connection, table),
+		)
+		if geometry:
+			column, geometryType, srsId = geometry
+			name = None
+			if self._hasTable(connection, 'gpkg_spatial_ref_sys'):
+				row = connection.execute('SELECT srs_name FROM gpkg_spatial_ref_sys WHERE srs_id = ?', (srsId,)).fetchone()
+				name = row and row[0]
+			properties.update(
+				dataType='FeatureClass',
+				shapeFieldName=column,
+				shapeType=SHAPE_TYPES.get((geometryType or '').upper(), geometryType),
+				spatialReference=SpatialReference(name or 'Unknown', srsId),
+			)
+		return Description(**properties)
+
+	def getCount(self, featureClass, where=None):
+		connection, table = self._open(featureClass)
+		sql = 'SELECT count(*) FROM {}'.format(_quote(table))
+		if where:
+			sql += ' WHERE ' + where
+		return connection.execute(sql).fetchone()[0]
+
+	def exists(self, featureClass):
+		try:
+			connection, table = self._open(featureClass)
+		except ValueError:
+			return False
+		return self._hasTable(connection, table)
+
+	def addFieldDelimiters(self, featureClass, fieldName):
+		return _quote(fieldName)
+
+	def addField(self, featureClass, fieldName, fieldType, precision=None, scale=None, length=None, alias=None, nullable=None, required=None, domain=None):
+		connection, table = self._open(featureClass)
+		columnType = COLUMN_TYPES.get(str(fieldType).upper())
+		if columnType is None:
+			raise ValueError('Field type {} is not supported'.format(fieldType))
+		if columnType == 'TEXT' and length:
+			columnType = 'TEXT({})'.format(int(length))
+		connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(_quote(table), _quote(fieldName), columnType))
+		connection.commit()
+
+	def deleteField(self, featureClass, fieldNames):
+		connection, table = self._open(featureClass)
+		if isinstance(fieldNames, basestring):
+			fieldNames = fieldNames.split(';')
+		for f in fieldNames:
+			connection.execute('ALTER TABLE {} DROP COLUMN {}'.format(_quote(table), _quote(f)))
+		connection.commit()
+
+	def calculateField(self, featureClass, fieldName, expression, expressionType='PYTHON'):
+		'''
+		Evaluates a Python expression for each row; fields are referenced
+		as !name!, as in arcpy.
+		'''
+		if expressionType.upper() not in ('PYTHON', 'PYTHON_9.3'):
+			raise NotImplementedError('SqliteBackend only calculates Python expressions')
+		names = sorted(set(re.findall(r'!([^!]+)!', expression)))
+		code = compile(re.sub(r'!([^!]+)!', lambda m: '_v[{}]'.format(names.index(m.group(1))), expression), '<expression>', 'eval')
+		with self.updateCursor(featureClass, names + [fieldName]) as cursor:
+			for r in cursor:
+				r[-1] = eval(code, {}, {'_v': r})
+				cursor.updateRow(r)
+
+	def delete(self, featureClass):
+		connection, table = self._open(featureClass)
+		for metadata in ('gpkg_geometry_columns', 'gpkg_contents'):
+			if self._hasTable(connection, metadata):
+				connection.execute('DELETE FROM {} WHERE lower(table_name) = lower(?)'.format(metadata), (table,))
+		connection.execute('DROP TABLE IF EXISTS {}'.format(_quote(table)))
+		connection.commit()
+
+	def _createLike(self, template, outputFeatureClass, geometryType=None, srsId=None):
+		'''
+		Creates outputFeatureClass with the columns of template and
+		registers it as GeoPackage feature class if template is one.
+		'''
+		source, sourceTable = self._open(template)
+		database, table = self._split(outputFeatureClass)
+		target = self._connect(database)
+		columns = []
+		for cid, name, declaredType, notNull, default, pk in self._tableInfo(source, sourceTable):
+			column = '{} {}'.format(_quote(name), declaredType or '')
+			if pk:
+				column += ' PRIMARY KEY'
+			elif notNull:
+				column += ' NOT NULL'
+			columns.append(column)
+		target.execute('CREATE TABLE {} ({})'.format(_quote(table), ', '.join(columns)))
+		geometry = self._geometryColumn(source, sourceTable)
+		if geometry and self._hasTable(target, 'gpkg_geometry_columns'):
+			column, sourceType, sourceSrsId = geometry
+			target.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, 'features', ?, ?)", (table, table, srsId or sourceSrsId))
+			target.execute('INSERT INTO gpkg_geometry_columns (table_name, column_name, geometry_type_name, srs_id, z, m) VALUES (?, ?, ?, ?, 0, 0)', (table, column, geometryType or sourceType, srsId or sourceSrsId))
+		target.commit()
+		return target, table
+
+	def copyFeatures(self, inputFeatureClass, outputFeatureClass):
+		target, table = self._createLike(inputFeatureClass, outputFeatureClass)
+		names = [f.name for f in self.listFields(inputFeatureClass)]
+		sql = 'INSERT INTO {} ({}) VALUES ({})'.format(_quote(table), ', '.join(_quote(n) for n in names), ', '.join('?' * len(names)))
+		cursor = self.searchCursor(inputFeatureClass, names)
+		rows = iter(cursor)
+		while True:
+			chunk = [r for r, i in zip(rows, xrange(FETCH_SIZE))]
+			if not chunk:
+				break
+			target.executemany(sql, chunk)
+		target.commit()
+
+	def createFeatureclass(self, outLocation, outName, geometryType, template=None, spatialReference=None):
+		if template is None:
+			raise NotImplementedError('SqliteBackend creates feature classes from a template only')
+		srsId = getattr(spatialReference, 'factoryCode', None)
+		self._createLike(template, os.path.join(outLocation, outName), geometryType, srsId)
+
+	def tableCompare(self, featureClassOne, featureClassTwo, sortFields, compareType):
+		'''
+		Compares the schemas (names and types of the fields), returns
+		'true' if they are equal, like the compare status of TableCompare.
+		'''
+		if compareType.upper() != 'SCHEMA_ONLY':
+			raise NotImplementedError('SqliteBackend only compares schemas')
+		schemas = [[(f.name.lower(), f.type) for f in self.listFields(fc)] for fc in (featureClassOne, featureClassTwo)]
+		return 'true' if schemas[0] == schemas[1] else 'false'
+
+	def addMessage(self, message):
+		logging.getLogger('arc_utils').info(message)
+
+
+#GeoPackage geometries...
+
+#envelope sizes of the GeoPackage binary header, by envelope indicator:
+ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+def _wkb(blob):
+	'''
+	Returns the (ISO) WKB of a GeoPackage geometry blob.
+	'''
+	blob = bytes(blob)
+	if blob[:2] != b'GP':
+		return blob
+	flags = bytearray(blob[3:4])[0]
+	return blob[8 + ENVELOPE_SIZES[(flags >> 1) & 7]:]
+
+def _parts(wkb, offset=0):
+	'''
+	Returns the parts of a WKB geometry as (dimension, rings) tuples, where
+	rings is a list of (n, 2) coordinate arrays, and the end offset.
+	'''
+	order = '<' if bytearray(wkb[offset:offset+1])[0] == 1 else '>'
+	geometryType, = struct.unpack_from(order + 'I', wkb, offset + 1)
+	offset += 5
+	dims = 2
+	if geometryType & 0x80000000:
+		dims += 1
+	if geometryType & 0x40000000:
+		dims += 1
+	geometryType &= 0x0fffffff
+	dims += {0: 0, 1: 1, 2: 1, 3: 2}[geometryType // 1000]
+	base = geometryType % 1000
+	dtype = numpy.dtype(order + 'f8')
+	def coordinates(offset):
+		n, = struct.unpack_from(order + 'I', wkb, offset)
+		xy = numpy.frombuffer(wkb, dtype, n * dims, offset + 4).reshape(n, dims)[:, :2]
+		return xy, offset + 4 + 8 * n * dims
+	if base == 1:
+		return [(0, [])], offset + 8 * dims
+	if base == 2:
+		xy, offset = coordinates(offset)
+		return [(1, [xy])], offset
+	if base == 3:
+		count, = struct.unpack_from(order + 'I', wkb, offset)
+		offset += 4
+		rings = []
+		for i in xrange(count):
+			xy, offset = coordinates(offset)
+			rings.append(xy)
+		return [(2, rings)], offset
+	if base in (4, 5, 6, 7):
+		count, = struct.unpack_from(order + 'I', wkb, offset)
+		offset += 4
+		parts = []
+		for i in xrange(count):
+			p, offset = _parts(wkb, offset)
+			parts.extend(p)
+		return parts, offset
+	raise NotImplementedError('WKB geometry type {} is not supported'.format(geometryType))
+
+def _ringArea(xy):
+	x, y = xy[:, 0], xy[:, 1]
+	return 0.5 * abs(numpy.dot(x[:-1], y[1:]) - numpy.dot(x[1:], y[:-1]))
+
+def _pathLength(xy):
+	return numpy.sum(numpy.hypot(*numpy.diff(xy, axis=0).T))
+
+def geometryArea(blob):
+	'''
+	Returns the planar area of a GeoPackage (or WKB) geometry.
+	'''
+	if blob is None:
+		return None
+	area = 0.0
+	for dimension, rings in _parts(_wkb(blob))[0]:
+		if dimension == 2 and rings:
+			area += _ringArea(rings[0]) - sum(_ringArea(r) for r in rings[1:])
+	return area
+
+def geometryLength(blob):
+	'''
+	Returns the planar length (perimeter of polygons) of a GeoPackage (or
+	WKB) geometry.
+	'''
+	if blob is None:
+		return None
+	return float(sum(_pathLength(r) for dimension, rings in _parts(_wkb(blob))[0] for r in rings))
+
+def geometryWKB(blob):
+	if blob is None:
+		return None
+	return _wkb(blob)
+
+GEOMETRY_FUNCTIONS = {
+	'SHAPE@AREA': geometryArea,
+	'SHAPE@LENGTH': geometryLength,
+	'SHAPE@WKB': geometryWKB,
+}
@@ -1,11 +1,13 @@
 import functools
-from error_utils import reportSysErrors, reportArcpyErrors
 
 try:
     from arcpy import ExecuteError, GetMessages
 except ImportError:
-    ExecuteError = None
-    GetMessages = lambda c:'sorry no arcpy'
+    class ExecuteError(Exception):
+        '''
+        stands in for arcpy.ExecuteError, which is never raised without arcpy
+        '''
+    GetMessages = lambda c=None:'sorry no arcpy'
 
 import sys
 import traceback
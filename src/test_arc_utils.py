@@ -0,0 +1,334 @@
+'''
+Tests of arc_utils with the SqliteBackend, i.e. without arcpy.  Run them
+from the src directory:
+
+	python -m unittest test_arc_utils
+'''
+
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import unittest
+
+import numpy
+
+import arc_utils
+import backend_utils
+from backend_utils import FeatureClassBackend, SqliteBackend, columnArray, setBackend
+
+#NAME, ZONE, VAL of the rows of the test table:
+ROWS = [
+	('a', 'A', 1.0),
+	('b', 'B', 2.5),
+	('c', None, 2.5),
+	(None, 'A', 3.0),
+	('', 'C', None),
+	('a', 'A', 0.0),
+]
+
+#NUM, MIXED of the rows of the table of mixed types:
+MIXED_ROWS = [
+	(1, 'a'),
+	(2.5, 3),
+	(2.5, 'a'),
+	(3, None),
+	(0.5, 3),
+	(0, 'b'),
+	(None, 2.5),
+]
+
+class SqliteBackendTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		database = os.path.join(self.directory, 'test.sqlite')
+		connection = sqlite3.connect(database)
+		connection.execute('CREATE TABLE parcels (OBJECTID INTEGER PRIMARY KEY, NAME TEXT, ZONE TEXT, VAL REAL)')
+		connection.executemany('INSERT INTO parcels (NAME, ZONE, VAL) VALUES (?, ?, ?)', ROWS)
+		#MIXED has no type, i.e. SQLite keeps the type of each value:
+		connection.execute('CREATE TABLE measures (OBJECTID INTEGER PRIMARY KEY, NUM NUMERIC, MIXED)')
+		connection.executemany('INSERT INTO measures (NUM, MIXED) VALUES (?, ?)', MIXED_ROWS)
+		connection.commit()
+		connection.close()
+		self.featureClass = os.path.join(database, 'parcels')
+		self.mixedFeatureClass = os.path.join(database, 'measures')
+		self.backend = backend_utils._backend
+		setBackend(SqliteBackend())
+
+	def tearDown(self):
+		setBackend(self.backend)
+		shutil.rmtree(self.directory)
+
+	def testGetCursorCount(self):
+		for vectorized in (True, False):
+			self.assertEqual(arc_utils.getCursorCount(self.featureClass, ['NAME'], None, vectorized), len(ROWS))
+			self.assertEqual(arc_utils.getCursorCount(self.featureClass, ['NAME'], "ZONE = 'A'", vectorized), 3)
+			self.assertEqual(arc_utils.getCursorCount(self.featureClass, ['NAME'], 'NAME IS NULL', vectorized), 1)
+
+	def testGetUniqueFieldValues(self):
+		for vectorized in (True, False):
+			values = arc_utils.getUniqueFieldValues(self.featureClass, 'ZONE', vectorized=vectorized)
+			self.assertEqual(len(values), 4)
+			self.assertEqual(set(values), set([None, 'A', 'B', 'C']))
+			values = arc_utils.getUniqueFieldValues(self.featureClass, 'NAME', "ZONE = 'A'", vectorized=vectorized)
+			self.assertEqual(len(values), 2)
+			self.assertEqual(set(values), set([None, 'a']))
+
+	def testColumnArrayPromotesNumbers(self):
+		data, mask = columnArray([1, 2.5, None])
+		self.assertEqual(data.dtype, numpy.float64)
+		self.assertEqual(data.tolist(), [1.0, 2.5, 0.0])
+		self.assertEqual(mask.tolist(), [False, False, True])
+		data, mask = columnArray([2, None, 3])
+		self.assertEqual(data.dtype, numpy.int64)
+		self.assertEqual(data.tolist(), [2, 0, 3])
+
+	def testColumnArrayMixedStringsAndNumbers(self):
+		data, mask = columnArray(['a', 3, None])
+		self.assertEqual(data.dtype, object)
+		self.assertEqual(data[:2].tolist(), ['a', 3])
+		self.assertEqual(mask.tolist(), [False, False, True])
+
+	def testValueCountsMixedNumbers(self):
+		backend = SqliteBackend()
+		for valueCounts in (backend.valueCounts, lambda *a: FeatureClassBackend.valueCounts(backend, *a)):
+			values, counts, nulls = valueCounts(self.mixedFeatureClass, 'NUM')
+			self.assertEqual(values.tolist(), [0, 0.5, 1, 2.5, 3])
+			self.assertEqual(counts.tolist(), [1, 1, 1, 2, 1])
+			self.assertEqual(nulls, 1)
+
+	def testValueCountsMixedStringsAndNumbers(self):
+		values, counts, nulls = SqliteBackend().valueCounts(self.mixedFeatureClass, 'MIXED')
+		self.assertEqual(dict(zip(values.tolist(), counts.tolist())), {'a': 2, 'b': 1, 3: 2, 2.5: 1})
+		self.assertEqual(nulls, 1)
+
+	def testNullCountsMixedTypes(self):
+		backend = SqliteBackend()
+		expected = {
+			'NUM': {'null': 1, 'empty': 0, 'zero': 1},
+			'MIXED': {'null': 1, 'empty': 0, 'zero': 0},
+		}
+		self.assertEqual(backend.nullCounts(self.mixedFeatureClass, ['NUM', 'MIXED']), expected)
+		self.assertEqual(FeatureClassBackend.nullCounts(backend, self.mixedFeatureClass, ['NUM', 'MIXED']), expected)
+
+	def testGetNullCountsByField(self):
+		expected = {
+			'NAME': {'null': 1, 'empty': 1, 'zero': 0},
+			'ZONE': {'null': 1, 'empty': 0, 'zero': 0},
+			'VAL': {'null': 1, 'empty': 0, 'zero': 1},
+		}
+		for vectorized in (True, False):
+			kinds = arc_utils.getNullCountsByField(self.featureClass, vectorized, byKind=True)
+			counts = arc_utils.getNullCountsByField(self.featureClass, vectorized)
+			for name in expected:
+				self.assertEqual(kinds[name], expected[name])
+				self.assertEqual(counts[name], sum(expected[name].values()))
+			self.assertEqual(set(counts), set(kinds))
+
+	def testGetNullCountsByFieldVectorizedEqualsLoop(self):
+		for featureClass in (self.featureClass, self.mixedFeatureClass):
+			self.assertEqual(arc_utils.getNullCountsByField(featureClass, True, True),
+				arc_utils.getNullCountsByField(featureClass, False, True))
+
+	def testSearchArraysMixedTypes(self):
+		chunks = list(SqliteBackend().searchArrays(self.mixedFeatureClass, ['NUM', 'MIXED']))
+		self.assertEqual(len(chunks), 1)
+		self.assertEqual(chunks[0]['NUM'].tolist(), [row[0] for row in MIXED_ROWS])
+		self.assertEqual(chunks[0]['MIXED'].tolist(), [row[1] for row in MIXED_ROWS])
+
+def wkbRings(rings, order='<', z=False):
+	'''
+	Returns the WKB of a polygon with rings (lists of (x, y) tuples) or of a
+	Z polygon with the z coordinate 1.
+	'''
+	wkb = struct.pack(order + 'BII', 1 if order == '<' else 0, 1003 if z else 3, len(rings))
+	for ring in rings:
+		wkb += struct.pack(order + 'I', len(ring))
+		for x, y in ring:
+			wkb += struct.pack(order + ('ddd' if z else 'dd'), *((x, y, 1.0) if z else (x, y)))
+	return wkb
+
+def wkbMultiPolygon(polygons):
+	wkb = struct.pack('<BII', 1, 6, len(polygons))
+	for rings in polygons:
+		wkb += wkbRings(rings)
+	return wkb
+
+def gpkgGeometry(wkb, envelope=0, srsId=3857):
+	'''
+	Returns a GeoPackage geometry blob of wkb, the envelope indicator
+	selects an envelope of 0, 4, 6 or 8 doubles (their values do not matter
+	to SqliteBackend).
+	'''
+	flags = 1 | (envelope << 1)
+	size = {0: 0, 1: 4, 2: 6, 3: 6, 4: 8}[envelope]
+	return b'GP' + struct.pack('<BBi', 0, flags, srsId) + struct.pack('<' + 'd' * size, *range(size)) + wkb
+
+def square(x, y, size):
+	return [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+
+#NAME, CODE, WKB, envelope indicator, area and length of the rows of the
+#GeoPackage feature class:
+LOTS = [
+	(' north ', 7, wkbRings([square(0, 0, 4), square(1, 1, 1)]), 0, 15.0, 20.0),
+	('east', 42, wkbRings([[(10, 0), (13, 0), (13, 2), (10, 2), (10, 0)]]), 1, 6.0, 10.0),
+	('south  ', None, wkbMultiPolygon([[square(0, 10, 1)], [square(5, 10, 1)]]), 2, 2.0, 8.0),
+	(None, 1, wkbRings([[(0, 0), (0, 3), (4, 0), (0, 0)]], order='>'), 4, 6.0, 12.0),
+	('west', 300, wkbRings([square(-5, 0, 2)], z=True), 3, 4.0, 8.0),
+	('void', 5, None, 0, None, None),
+]
+
+class GeoPackageTest(unittest.TestCase):
+	'''
+	The SqliteBackend with a GeoPackage feature class of polygons.
+	'''
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.database = os.path.join(self.directory, 'test.gpkg')
+		connection = sqlite3.connect(self.database)
+		connection.execute('CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)')
+		connection.execute("INSERT INTO gpkg_spatial_ref_sys VALUES ('WGS 84 / Pseudo-Mercator', 3857, 'EPSG', 3857, '', NULL)")
+		connection.execute('CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT, description TEXT DEFAULT \'\', last_change DATETIME, min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER)')
+		connection.execute('CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL)')
+		connection.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES ('lots', 'features', 'lots', 3857)")
+		connection.execute("INSERT INTO gpkg_geometry_columns VALUES ('lots', 'geom', 'MULTIPOLYGON', 3857, 0, 0)")
+		connection.execute('CREATE TABLE lots (fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, geom MULTIPOLYGON, NAME TEXT(20), CODE INTEGER, SIZE REAL)')
+		for name, code, wkb, envelope, area, length in LOTS:
+			geometry = None if wkb is None else sqlite3.Binary(gpkgGeometry(wkb, envelope))
+			connection.execute('INSERT INTO lots (geom, NAME, CODE) VALUES (?, ?, ?)', (geometry, name, code))
+		connection.execute('CREATE TABLE parcels (OBJECTID INTEGER PRIMARY KEY, NAME TEXT, ZONE TEXT, VAL REAL)')
+		connection.commit()
+		connection.close()
+		self.featureClass = os.path.join(self.database, 'lots')
+		self.table = os.path.join(self.database, 'parcels')
+		self.backend = backend_utils._backend
+		setBackend(SqliteBackend())
+
+	def tearDown(self):
+		setBackend(self.backend)
+		shutil.rmtree(self.directory)
+
+	def column(self, fieldName, featureClass=None):
+		with backend_utils.getBackend().searchCursor(featureClass or self.featureClass, [fieldName]) as cursor:
+			return [r[0] for r in cursor]
+
+	def assertGeometries(self, featureClass, rows=LOTS):
+		with backend_utils.getBackend().searchCursor(featureClass, ['SHAPE@AREA', 'SHAPE@LENGTH', 'SHAPE@WKB']) as cursor:
+			values = list(cursor)
+		self.assertEqual(len(values), len(rows))
+		for (area, length, wkb), row in zip(values, rows):
+			if row[2] is None:
+				self.assertEqual((area, length, wkb), (None, None, None))
+				continue
+			self.assertAlmostEqual(area, row[4])
+			self.assertAlmostEqual(length, row[5])
+			self.assertEqual(bytes(wkb), row[2])
+
+	def testGeometryTokens(self):
+		self.assertGeometries(self.featureClass)
+
+	def testSummarizeArea(self):
+		total = sum(row[4] for row in LOTS if row[4] is not None)
+		self.assertAlmostEqual(arc_utils.summarizeArea(self.featureClass), total)
+		self.assertAlmostEqual(arc_utils.summarizeArea(self.featureClass, vectorized=False), total)
+		self.assertAlmostEqual(arc_utils.summarizeArea(self.featureClass, 'CODE < 10'), 15.0 + 6.0)
+
+	def testListFields(self):
+		fields = backend_utils.getBackend().listFields(self.featureClass)
+		self.assertEqual([(f.name, f.type) for f in fields],
+			[('fid', 'OID'), ('geom', 'Geometry'), ('NAME', 'String'), ('CODE', 'Integer'), ('SIZE', 'Double')])
+		self.assertEqual(fields[2].length, 20)
+		self.assertEqual([f.isNullable for f in fields], [False, True, True, True, True])
+		self.assertEqual([f.editable for f in fields], [False, True, True, True, True])
+		self.assertEqual([f.required for f in fields], [True, True, False, False, False])
+		self.assertEqual(arc_utils.getNonGeometryFieldNames(self.featureClass), ['fid', 'NAME', 'CODE', 'SIZE'])
+		self.assertTrue(arc_utils.hasField(self.featureClass, 'SIZE'))
+		self.assertFalse(arc_utils.hasField(self.featureClass, 'ZONE'))
+
+	def testDescribe(self):
+		description = backend_utils.getBackend().describe(self.featureClass)
+		self.assertEqual(description.dataType, 'FeatureClass')
+		self.assertEqual(description.name, 'lots')
+		self.assertEqual(description.path, self.database)
+		self.assertEqual(description.OIDFieldName, 'fid')
+		self.assertEqual(description.shapeFieldName, 'geom')
+		self.assertEqual(description.shapeType, 'Polygon')
+		self.assertEqual(description.spatialReference.name, 'WGS 84 / Pseudo-Mercator')
+		self.assertEqual(description.spatialReference.factoryCode, 3857)
+		self.assertEqual(arc_utils.getGeometryFieldName(self.featureClass), 'geom')
+		description = backend_utils.getBackend().describe(self.table)
+		self.assertEqual(description.dataType, 'Table')
+		self.assertEqual(description.OIDFieldName, 'OBJECTID')
+		self.assertFalse(hasattr(description, 'shapeFieldName'))
+
+	def testStripFieldValues(self):
+		arc_utils.stripFieldValues(self.featureClass, ['NAME'])
+		self.assertEqual(self.column('NAME'), [None if row[0] is None else row[0].strip() for row in LOTS])
+		self.assertEqual(self.column('CODE'), [row[1] for row in LOTS])
+		self.assertGeometries(self.featureClass)
+
+	def testCalculateField(self):
+		backend = backend_utils.getBackend()
+		backend.addField(self.featureClass, 'LABEL', 'TEXT', length=30)
+		backend.calculateField(self.featureClass, 'LABEL', "'{}-{}'.format(!NAME!, !CODE!)", 'PYTHON')
+		self.assertEqual(self.column('LABEL'), ['{}-{}'.format(row[0], row[1]) for row in LOTS])
+		backend.calculateField(self.featureClass, 'CODE', '(!CODE! or 0) * 2 + 1', 'PYTHON')
+		self.assertEqual(self.column('CODE'), [(row[1] or 0) * 2 + 1 for row in LOTS])
+		self.assertRaises(NotImplementedError, backend.calculateField, self.featureClass, 'CODE', '1', 'VB')
+
+	def testFixLeadingZeroFields(self):
+		arc_utils.fixLeadingZeroFields(self.featureClass, 'CODE', 4)
+		self.assertEqual(self.column('CODE'), [str(row[1]).zfill(4) for row in LOTS])
+		self.assertEqual(dict((f.name, f.type) for f in backend_utils.getBackend().listFields(self.featureClass))['CODE'], 'String')
+
+	def testCopyFeatures(self):
+		output = os.path.join(self.database, 'lots_copy')
+		backend_utils.getBackend().copyFeatures(self.featureClass, output)
+		backend = backend_utils.getBackend()
+		self.assertEqual([(f.name, f.type, f.length) for f in backend.listFields(output)],
+			[(f.name, f.type, f.length) for f in backend.listFields(self.featureClass)])
+		description = backend.describe(output)
+		self.assertEqual((description.shapeFieldName, description.shapeType, description.spatialReference.factoryCode), ('geom', 'Polygon', 3857))
+		for fieldName in ('fid', 'NAME', 'CODE'):
+			self.assertEqual(self.column(fieldName, output), self.column(fieldName))
+		self.assertGeometries(output)
+		self.assertEqual(arc_utils.compareSchemas(self.featureClass, output), 'true')
+
+	def testSetupOutputFeatureClass(self):
+		backend = backend_utils.getBackend()
+		output = os.path.join(self.database, 'lots_new')
+		self.assertEqual(arc_utils.setupOutputFeatureClass(output, self.featureClass), output)
+		self.assertTrue(backend.exists(output))
+		self.assertEqual(arc_utils.getFeatureCount(output), 0)
+		description = backend.describe(output)
+		self.assertEqual((description.shapeFieldName, description.shapeType, description.spatialReference.name), ('geom', 'Polygon', 'WGS 84 / Pseudo-Mercator'))
+		self.assertEqual(arc_utils.compareSchemas(self.featureClass, output), 'true')
+		with backend.insertCursor(output, ['geom', 'NAME']) as cursor:
+			cursor.insertRow([sqlite3.Binary(gpkgGeometry(LOTS[0][2])), 'north'])
+		self.assertAlmostEqual(arc_utils.summarizeArea(output), LOTS[0][4])
+		#overwriteOutput replaces the feature class:
+		arc_utils.setupOutputFeatureClass(output, self.featureClass, overwriteOutput=True)
+		self.assertEqual(arc_utils.getFeatureCount(output), 0)
+
+	def testCompareSchemas(self):
+		backend = backend_utils.getBackend()
+		output = os.path.join(self.database, 'lots_copy')
+		backend.copyFeatures(self.featureClass, output)
+		self.assertEqual(arc_utils.compareSchemas(self.featureClass, output), 'true')
+		#field names are compared case insensitively, their types not:
+		backend.deleteField(output, ['SIZE'])
+		backend.addField(output, 'size', 'DOUBLE')
+		self.assertEqual(arc_utils.compareSchemas(self.featureClass, output), 'true')
+		backend.deleteField(output, ['size'])
+		backend.addField(output, 'SIZE', 'TEXT')
+		self.assertEqual(arc_utils.compareSchemas(self.featureClass, output), 'false')
+		backend.addField(output, 'EXTRA', 'DOUBLE')
+		self.assertEqual(arc_utils.compareSchemas(self.featureClass, output), 'false')
+		self.assertEqual(arc_utils.compareSchemas(self.featureClass, self.table), 'false')
+		self.assertRaises(NotImplementedError, backend.tableCompare, self.featureClass, output, ['fid'], 'ALL')
+
+if __name__ == '__main__':
+	unittest.main()